@@ -1,16 +1,36 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timezone, timedelta
 from threading import Lock
-import os, time
+import os, sys, time
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask_migrate import Migrate, stamp, upgrade
 from config import Config
 import traceback
-from sqlalchemy import func
-
-ULTIMO_LDR = {"valorLuz": 0, "R1": 0}
+import click
+from sqlalchemy import bindparam, event, func, inspect, tuple_
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session, declared_attr
+from sqlalchemy.orm.attributes import set_committed_value
+from servicos.ingestao import FilaIngestao
+from servicos.carga_energia import COLUNAS_ENERGIA, gravar_registros, ler_csv_energia
+from servicos.rollups import atualizar_picos, atualizar_rollups
+from servicos.estado_vivo import EstadoVivoMemoria, VistaEstado, criar_estado_vivo
+from servicos.comandos import FilaComandos
+from servicos.eventos import criar_hub_eventos
+from servicos.cache import CacheVersionado, Versoes, etag_de
+from servicos.historico import HistoricoRecente
+from servicos.serie_viva import CAMPOS as CAMPOS_SERIE, SerieViva, reduzir
+from servicos.lttb import escolher_grao, gerar_json, reduzir_lttb
+from servicos.notificacoes import DespachanteNotificacoes, janela_agrupamento, janela_resumo
+from servicos.correio import PoolSMTP
+from servicos.envio_telegram import EnviadorTelegram
+from servicos.alertas import RegistoAlertas
+from servicos.saldo import AcumuladorSaldo, LivroSaldo
+from servicos.contador import ConflitoContador, NormalizadorContador
+from servicos.controle_reles import MotorReles
+from servicos.esquema import diferencas_esquema, verificar_dialeto
 
 # =========================================================
 # 1️⃣ CRIAÇÃO DO APP E CARREGAMENTO DAS CONFIGURAÇÕES
@@ -33,27 +53,16 @@ if database_url and database_url.startswith("postgres://"):
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+# Rollups, picos, alertas e livro do saldo usam INSERT ... ON CONFLICT: outro banco falha já aqui
+with app.app_context():
+    verificar_dialeto(db.engine)
+
 # =========================================================
 # 4️⃣ LOGIN MANAGER
 # =========================================================
 login_manager = LoginManager(app)
 login_manager.login_view = 'autenticacao'
 
-# =========================================================
-# 5️⃣ IMPORTS DOS PICOS (AGORA QUE O DB EXISTE)
-# =========================================================
-from routes.picos import (
-    picos_bp,
-    obter_pico_do_dia,
-    obter_picos_semana_atual,
-    obter_pico_semanal,
-    obter_pico_mensal
-)
-
-# =========================================================
-# 6️⃣ REGISTRO DOS BLUEPRINTS
-# =========================================================
-app.register_blueprint(picos_bp)
 
 # ==========================================================
 # CRIAÇÃO AUTOMÁTICA DAS TABELAS NO RAILWAY (Flask 3.0+)
@@ -85,19 +94,24 @@ def base():
 # -----------------------------
 API_KEYS = {"SUA_CHAVE_API_SECRETA": "ESP8266"}
 
-dados_pzem = {
-    "pzem1": {"voltage":0, "current": 0, "power": 0, "energy": 0, "frequency": 0, "pf": 0, "limite": 1000, "conectado": False, "ultima_atualizacao": None},
-    "pzem2": {"voltage":0, "current": 0, "power": 0, "energy": 0, "frequency": 0, "pf": 0, "limite": 1000, "conectado": False, "ultima_atualizacao": None}
-}
-ultimo_consumo_conhecido = {"pzem1": 0.0, "pzem2": 0.0}
-comandos_pendentes = []
 dados_lock = Lock()
 
+
+def intervalo_datas(inicio, fim=None):
+    """Converte datas [inicio, fim] num intervalo semiaberto [inicio 00:00, fim+1 00:00)
+    para filtrar timestamp >= inicio AND timestamp < fim sem func.date() (usa os índices)"""
+    fim = fim or inicio
+    return (
+        datetime.combine(inicio, datetime.min.time()),
+        datetime.combine(fim + timedelta(days=1), datetime.min.time())
+    )
+
 # -----------------------------
 # Modelos de Banco de Dados
 # -----------------------------
 class DailyPeak(db.Model):
     __tablename__ = "daily_peaks"
+    __table_args__ = (db.UniqueConstraint('date', 'pzem_id', name='uq_daily_peaks_date_pzem'),)
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, default=datetime.utcnow().date, index=True)
     pzem_id = db.Column(db.Integer, nullable=False)
@@ -106,20 +120,24 @@ class DailyPeak(db.Model):
 
 class WeeklyPeak(db.Model):
     __tablename__ = "weekly_peaks"
+    __table_args__ = (db.UniqueConstraint('week_start', 'pzem_id', name='uq_weekly_peaks_week_pzem'),)
     id = db.Column(db.Integer, primary_key=True)
     week_start = db.Column(db.Date, index=True)  # primeiro dia da semana
     pzem_id = db.Column(db.Integer, nullable=False)
     value = db.Column(db.Float, nullable=False)
     time = db.Column(db.Time, nullable=False)
+    date = db.Column(db.Date)  # dia em que o pico ocorreu
 
 class MonthlyPeak(db.Model):
     __tablename__ = "monthly_peaks"
+    __table_args__ = (db.UniqueConstraint('year', 'month', 'pzem_id', name='uq_monthly_peaks_year_month_pzem'),)
     id = db.Column(db.Integer, primary_key=True)
     month = db.Column(db.Integer, index=True)  # 1 a 12
     year = db.Column(db.Integer, index=True)
     pzem_id = db.Column(db.Integer, nullable=False)
     value = db.Column(db.Float, nullable=False)
     time = db.Column(db.Time, nullable=False)
+    date = db.Column(db.Date)  # dia em que o pico ocorreu
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -141,6 +159,10 @@ class User(UserMixin, db.Model):
 
 class EnergyData(db.Model):
     __tablename__ = 'energy_data'
+    __table_args__ = (
+        db.Index('ix_energy_data_pzem_id_timestamp', 'pzem_id', 'timestamp'),
+        db.Index('ix_energy_data_timestamp_brin', 'timestamp', postgresql_using='brin'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     pzem_id = db.Column(db.Integer, nullable=False)
     voltage = db.Column(db.Float, nullable=False)
@@ -150,6 +172,88 @@ class EnergyData(db.Model):
     frequency = db.Column(db.Float, nullable=False)
     pf = db.Column(db.Float, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Consumo desde a amostra anterior do PZEM (contador normalizado: reinício/rollover/glitch)
+    delta_kwh = db.Column(db.Float)
+
+
+class RollupEnergiaMixin:
+    """Colunas comuns dos rollups de energy_data (uma linha por PZEM e intervalo)"""
+    id = db.Column(db.Integer, primary_key=True)
+    pzem_id = db.Column(db.Integer, nullable=False)
+    inicio = db.Column(db.DateTime, nullable=False)  # início do intervalo (UTC)
+    amostras = db.Column(db.Integer, nullable=False, default=0)
+    power_min = db.Column(db.Float, nullable=False)
+    power_max = db.Column(db.Float, nullable=False)
+    power_soma = db.Column(db.Float, nullable=False)
+    power_max_em = db.Column(db.DateTime, nullable=False)
+    voltage_min = db.Column(db.Float, nullable=False)
+    voltage_max = db.Column(db.Float, nullable=False)
+    voltage_soma = db.Column(db.Float, nullable=False)
+    energy_min = db.Column(db.Float, nullable=False)
+    energy_max = db.Column(db.Float, nullable=False)
+    energia_soma = db.Column(db.Float, nullable=False, default=0.0)  # soma de delta_kwh
+
+    @declared_attr
+    def __table_args__(cls):
+        return (db.UniqueConstraint('pzem_id', 'inicio', name=f'uq_{cls.__tablename__}_pzem_inicio'),)
+
+    @property
+    def power_media(self):
+        return self.power_soma / self.amostras if self.amostras else 0.0
+
+    @property
+    def voltage_media(self):
+        return self.voltage_soma / self.amostras if self.amostras else 0.0
+
+    @property
+    def energia_kwh(self):
+        # Soma dos consumos normalizados (resiste a reinícios e rollover do contador)
+        return self.energia_soma
+
+
+class EnergiaMinuto(RollupEnergiaMixin, db.Model):
+    __tablename__ = 'energia_minuto'
+
+
+class EnergiaHora(RollupEnergiaMixin, db.Model):
+    __tablename__ = 'energia_hora'
+
+
+class EnergiaDia(RollupEnergiaMixin, db.Model):
+    __tablename__ = 'energia_dia'
+
+
+def tabelas_rollup():
+    return {
+        "minuto": EnergiaMinuto.__table__,
+        "hora": EnergiaHora.__table__,
+        "dia": EnergiaDia.__table__
+    }
+
+
+def tabelas_picos():
+    return {
+        "dia": DailyPeak.__table__,
+        "semana": WeeklyPeak.__table__,
+        "mes": MonthlyPeak.__table__
+    }
+
+
+def resumo_diario_rollups(linhas):
+    """Junta linhas de EnergiaDia (um ou vários PZEMs) por dia: energia somada e maior pico com hora"""
+    dias = {}
+    for linha in linhas:
+        dia = dias.setdefault(linha.inicio.date(), {
+            "data": linha.inicio.date(), "energia": 0.0, "pico": 0.0, "pico_em": None, "pzem": None
+        })
+        dia["energia"] += linha.energia_kwh
+        if dia["pico_em"] is None or linha.power_max > dia["pico"]:
+            dia["pico"] = linha.power_max
+            dia["pico_em"] = linha.power_max_em
+            dia["pzem"] = linha.pzem_id
+    return [dias[d] for d in sorted(dias)]
+
+
 class Rele(db.Model):
     __tablename__ = 'reles'
     id = db.Column(db.Integer, primary_key=True)
@@ -165,6 +269,12 @@ class Rele(db.Model):
     ultima_alteracao_manual = db.Column(db.DateTime, default=datetime.utcnow)
     ultima_sincronizacao_esp = db.Column(db.DateTime, default=datetime.utcnow)
     bloqueado_para_sincronizacao = db.Column(db.Boolean, default=False)
+
+    # Anti-oscilação do modo automático (NULL = padrão do sistema, RELES_* no config)
+    histerese_kwh = db.Column(db.Float)  # só volta a ligar acima de limite + histerese
+    tempo_minimo_ligado = db.Column(db.Integer)  # segundos
+    tempo_minimo_desligado = db.Column(db.Integer)  # segundos
+    estado_alterado_em = db.Column(db.DateTime)  # última mudança real de estado (NULL = nunca mudou)
     
     def to_dict(self):
         return {
@@ -177,9 +287,18 @@ class Rele(db.Model):
             "modo_automatico": self.modo_automatico,
             "modo_desc": "Automático" if self.modo_automatico else "Manual",
             "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "bloqueado_para_sincronizacao": self.bloqueado_para_sincronizacao
+            "bloqueado_para_sincronizacao": self.bloqueado_para_sincronizacao,
+            "histerese_kwh": self.histerese_kwh,
+            "tempo_minimo_ligado": self.tempo_minimo_ligado,
+            "tempo_minimo_desligado": self.tempo_minimo_desligado
         }
 
+@event.listens_for(Rele.estado, "set", active_history=True)
+def marcar_mudanca_estado_rele(rele, novo, anterior, iniciador):
+    """Data da última mudança real de estado (manual, ESP ou automática): base da permanência mínima"""
+    if isinstance(anterior, bool) and bool(novo) != anterior:
+        rele.estado_alterado_em = datetime.utcnow()
+
 # Adicione esta classe após a classe Rele
 class ReleLog(db.Model):
     __tablename__ = 'reles_logs'
@@ -257,6 +376,213 @@ class Configuracao(db.Model):
     alert_erro_sistema = db.Column(db.Boolean, default=True)
     saldo_baixo_limite = db.Column(db.Float, default=5.0)
 
+class EstadoVivo(db.Model):
+    """Snapshots do estado ao vivo quando ESTADO_VIVO_BACKEND=postgres"""
+    __tablename__ = 'estado_vivo'
+    chave = db.Column(db.String(64), primary_key=True)
+    valor = db.Column(db.Text)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ComandoRele(db.Model):
+    """Fila durável de comandos para o ESP (ver servicos/comandos.py)"""
+    __tablename__ = 'comandos_reles'
+    __table_args__ = (
+        db.Index('ix_comandos_reles_estado_id', 'estado', 'id'),
+        db.Index('ix_comandos_reles_rele_id_estado', 'rele_id', 'estado'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    rele_id = db.Column(db.Integer, nullable=True)  # None → comando avulso (sem confirmação)
+    comando = db.Column(db.String(64), nullable=False)
+    # pendente → entregue → confirmado | substituido | expirado
+    estado = db.Column(db.String(16), nullable=False, default='pendente')
+    origem = db.Column(db.String(32), default='sistema')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    entregue_em = db.Column(db.DateTime)
+    confirmado_em = db.Column(db.DateTime)
+    expira_em = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "rele_id": self.rele_id,
+            "comando": self.comando,
+            "estado": self.estado,
+            "origem": self.origem,
+            "tentativas": self.tentativas,
+            "criado_em": self.criado_em.strftime("%Y-%m-%d %H:%M:%S") if self.criado_em else None,
+            "entregue_em": self.entregue_em.strftime("%Y-%m-%d %H:%M:%S") if self.entregue_em else None,
+            "confirmado_em": self.confirmado_em.strftime("%Y-%m-%d %H:%M:%S") if self.confirmado_em else None
+        }
+
+class NotificacaoSaida(db.Model):
+    """Caixa de saída de notificações por canal (ver servicos/notificacoes.py)"""
+    __tablename__ = 'notificacoes_saida'
+    __table_args__ = (
+        db.Index('ix_notificacoes_saida_estado_proxima', 'estado', 'proxima_tentativa_em'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    canal = db.Column(db.String(16), nullable=False)  # telegram | email
+    tipo = db.Column(db.String(50), nullable=False)
+    mensagem = db.Column(db.Text, nullable=False)
+    # pendente → enviando → enviada | falhou (pendente de novo entre tentativas)
+    estado = db.Column(db.String(16), nullable=False, default='pendente')
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    proxima_tentativa_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    enviado_em = db.Column(db.DateTime)
+    ultimo_erro = db.Column(db.Text)
+
+class AlertaEnviado(db.Model):
+    """Chaves de alertas já enviados, partilhadas entre workers (ver servicos/alertas.py)"""
+    __tablename__ = 'alertas_enviados'
+    chave = db.Column(db.String(120), primary_key=True)  # ex.: saldo_baixo_2026101814
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expira_em = db.Column(db.DateTime, nullable=False, index=True)
+
+class ContadorEnergia(db.Model):
+    """Última leitura do contador de energia de cada PZEM já descontada do saldo"""
+    __tablename__ = 'contadores_energia'
+    pzem_id = db.Column(db.Integer, primary_key=True)
+    energia_kwh = db.Column(db.Float, nullable=False)
+    sequencia = db.Column(db.Integer, nullable=False, default=0)  # avança a cada contagem (compare-and-set)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MovimentoSaldo(db.Model):
+    """Livro do saldo (só acrescentado): consumos e recargas (ver servicos/saldo.py)"""
+    __tablename__ = 'movimentos_saldo'
+    __table_args__ = (
+        db.UniqueConstraint('pzem_id', 'sequencia', name='uq_movimentos_saldo_pzem_sequencia'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    configuracao_id = db.Column(db.Integer, db.ForeignKey('configuracoes.id'), nullable=False)
+    tipo = db.Column(db.String(20), nullable=False)  # consumo | recarga | reinicio_contador
+    kwh = db.Column(db.Float, nullable=False)  # negativo = consumo
+    saldo_apos = db.Column(db.Float)
+    pzem_id = db.Column(db.Integer)
+    sequencia = db.Column(db.Integer)
+    contador_anterior = db.Column(db.Float)
+    contador = db.Column(db.Float)
+    recarga_id = db.Column(db.Integer, db.ForeignKey('recargas.id'))
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# =========================================================
+# ESTADO AO VIVO (partilhado entre workers)
+# =========================================================
+PADROES_ESTADO_VIVO = {
+    "pzem1": {"voltage":0, "current": 0, "power": 0, "energy": 0, "frequency": 0, "pf": 0, "limite": 1000, "conectado": False, "ultima_atualizacao": None},
+    "pzem2": {"voltage":0, "current": 0, "power": 0, "energy": 0, "frequency": 0, "pf": 0, "limite": 1000, "conectado": False, "ultima_atualizacao": None},
+    "ldr": {"valorLuz": 0, "R1": 0}
+}
+
+with app.app_context():
+    estado_vivo = criar_estado_vivo(
+        app.config.get('ESTADO_VIVO_BACKEND'),
+        PADROES_ESTADO_VIVO,
+        caminho=app.config.get('ESTADO_VIVO_ARQUIVO'),
+        engine=db.engine,
+        tabela=EstadoVivo.__table__,
+        cache_ttl=app.config.get('ESTADO_VIVO_CACHE_TTL', 1.0),
+        processos=app.config.get('PROCESSOS_WEB', 1)
+    )
+print(f"📡 Estado ao vivo: {estado_vivo.status()}")
+
+# dados_pzem[chave] devolve um snapshot (cópia); escrever via estado_vivo.atualizar()
+dados_pzem = VistaEstado(estado_vivo, ("pzem1", "pzem2"))
+
+# Comandos para o ESP: tabela comandos_reles + índice no estado ao vivo
+fila_comandos = FilaComandos(
+    db, ComandoRele, estado_vivo,
+    validade_segundos=app.config.get('COMANDOS_VALIDADE', 120),
+    reentrega_segundos=app.config.get('COMANDOS_REENTREGA', 10),
+    varredura_segundos=app.config.get('COMANDOS_VARREDURA', 30)
+)
+
+# Eventos ao vivo para o dashboard (SSE): publicados pela ingestão, um fan-out por worker
+with app.app_context():
+    hub_eventos = criar_hub_eventos(
+        estado_vivo, db.engine,
+        max_streams=app.config.get('EVENTOS_MAX_STREAMS', 8),
+        retry_cheio=app.config.get('EVENTOS_RETRY_CHEIO', 30)
+    )
+print(f"📺 Eventos ao vivo: {hub_eventos.status()}")
+
+def pzem_online(ultima, agora=None):
+    """Amostra mais recente dentro da janela PZEM_ONLINE_SEGUNDOS (o ESP envia por lotes)?"""
+    agora = agora or datetime.now(timezone.utc)
+    return bool(ultima) and (agora - ultima).total_seconds() < app.config.get('PZEM_ONLINE_SEGUNDOS', 150)
+
+def evento_pzem(pzem_key, snapshot):
+    """Snapshot do PZEM + 'online' (o mesmo critério de /api/status-pzem)"""
+    return dict(snapshot, pzem=pzem_key, online=pzem_online(snapshot.get('ultima_atualizacao')))
+
+def evento_rele(rele):
+    return {"id": rele.id, "nome": rele.nome, "estado": rele.estado, "modo_automatico": rele.modo_automatico}
+
+def evento_saldo(config):
+    saldo = config.saldo_kwh or 0
+    return {"saldo_kwh": round(saldo, 3), "valor_mzn": round(saldo * (config.preco_kwh or 0), 2)}
+
+# Versões dos dados do dashboard (snapshot com ETag): reles, config, energia
+versoes_dados = Versoes(estado_vivo)
+cache_dashboard = CacheVersionado()
+
+# Séries das últimas 24 horas / 60 minutos por PZEM (anéis no estado partilhado)
+historico_recente = HistoricoRecente(estado_vivo)
+
+# Últimas amostras de cada PZEM para os gráficos ao vivo (sem consultar energy_data)
+serie_viva = SerieViva(
+    capacidade=app.config.get('SERIE_VIVA_CAPACIDADE', 4320),
+    caminho=app.config.get('SERIE_VIVA_ARQUIVO') if estado_vivo.nome == "mmap" else None
+)
+GRUPOS_VERSAO = {Rele: "reles", Configuracao: "config"}
+
+@event.listens_for(Session, "after_flush")
+def registar_eventos_alteracoes(sessao, contexto):
+    """Guarda relés e saldo alterados nesta transação (publicados só depois do commit)"""
+    alterados = sessao.info.setdefault("eventos_pendentes", {})
+    grupos = sessao.info.setdefault("versoes_pendentes", set())
+    for obj in list(sessao.new) + list(sessao.dirty) + list(sessao.deleted):
+        grupo = GRUPOS_VERSAO.get(type(obj))
+        if grupo and (obj in sessao.new or obj in sessao.deleted or sessao.is_modified(obj)):
+            grupos.add(grupo)
+
+        if obj in sessao.deleted:
+            continue
+        if isinstance(obj, Rele) and inspect(obj).attrs.estado.history.has_changes():
+            alterados[("rele", obj.id)] = evento_rele(obj)
+        elif isinstance(obj, Configuracao) and inspect(obj).attrs.saldo_kwh.history.has_changes():
+            alterados[("saldo", obj.id)] = evento_saldo(obj)
+
+@event.listens_for(Session, "after_commit")
+def publicar_eventos_alteracoes(sessao):
+    grupos = sessao.info.pop("versoes_pendentes", None)
+    if grupos:
+        versoes_dados.incrementar(*sorted(grupos))
+    for (tipo, _), dados in sessao.info.pop("eventos_pendentes", {}).items():
+        hub_eventos.publicar(tipo, dados)
+
+@event.listens_for(Session, "after_rollback")
+def descartar_eventos_alteracoes(sessao):
+    sessao.info.pop("eventos_pendentes", None)
+    sessao.info.pop("versoes_pendentes", None)
+
+# =========================================================
+# 5️⃣ IMPORTS DOS PICOS (DEPOIS DOS MODELOS E DO ESTADO GLOBAL)
+# =========================================================
+from routes.picos import (
+    picos_bp,
+    obter_pico_do_dia,
+    obter_picos_semana_atual,
+    obter_pico_semanal,
+    obter_pico_mensal
+)
+
+# =========================================================
+# 6️⃣ REGISTRO DOS BLUEPRINTS
+# =========================================================
+app.register_blueprint(picos_bp)
+
 # ==========================================================
 # ROTAS DE CONFIGURAÇÃO DE NOTIFICAÇÕES
 # ==========================================================
@@ -571,282 +897,6 @@ def testar_email(config):
         print(f"❌ {error_msg}")
         return jsonify({"success": False, "message": error_msg})
 
-# ==========================================================
-# SERVIÇO DE NOTIFICAÇÕES - INTEGRAÇÃO COMPLETA
-# ==========================================================
-
-class ServicoNotificacoes:
-    def __init__(self):
-        self.ultima_verificacao = None
-        self.alertas_enviados = set()
-        self.ultimo_email_diario = None
-
-    def verificar_todas_notificacoes(self):
-        """Verifica todos os eventos e envia notificações se necessário"""
-        try:
-            config = Configuracao.query.first()
-            if not config:
-                return
-
-            print("🔔 Verificando notificações...")
-
-            # 1. SALDO BAIXO - COM LIMITE PERSONALIZADO
-            if config.alert_saldo_baixo:
-                self.verificar_saldo_baixo(config)
-
-            # 2. CONSUMO EM PICO
-            if config.alert_consumo_pico:
-                self.verificar_consumo_pico(config)
-
-            # 3. RELÉS DESLIGADOS
-            if config.alert_reles_desligados:
-                self.verificar_reles_desligados(config)
-
-            # 4. PZEM OFFLINE
-            if config.alert_pzem_offline:
-                self.verificar_pzem_offline(config)
-
-            # 5. ERROS NO SISTEMA
-            if config.alert_erro_sistema:
-                self.verificar_erros_sistema(config)
-
-            # Limpar alertas antigos
-            self.limpar_alertas_antigos()
-
-        except Exception as e:
-            print(f"❌ Erro na verificação de notificações: {e}")
-
-    def verificar_saldo_baixo(self, config):
-        """Verifica se o saldo está baixo usando o limite personalizado"""
-        limite_saldo_baixo = config.saldo_baixo_limite or 5.0  # kWh
-        
-        if config.saldo_kwh <= limite_saldo_baixo:
-            alerta_id = f"saldo_baixo_{datetime.now().strftime('%Y%m%d%H')}"
-            
-            if alerta_id not in self.alertas_enviados:
-                mensagem = (
-                    f"⚠️ **SALDO BAIXO** ⚠️\n"
-                    f"Saldo atual: {config.saldo_kwh:.2f} kWh\n"
-                    f"Valor: {config.saldo_kwh * config.preco_kwh:.2f} MZN\n"
-                    f"Limite configurado: {limite_saldo_baixo} kWh\n"
-                    f"⏰ {datetime.now().strftime('%H:%M')}"
-                )
-                
-                self.enviar_notificacao('saldo_baixo', mensagem, config)
-                self.alertas_enviados.add(alerta_id)
-                print(f"🔔 Alerta de saldo baixo: {config.saldo_kwh:.2f} kWh ≤ {limite_saldo_baixo} kWh")
-
-    def verificar_consumo_pico(self, config):
-        """Verifica se o consumo está em pico (acima de 80% do limite)"""
-        # Obter dados dos PZEMs (ajuste conforme sua estrutura de dados)
-        consumo_total = 0
-        try:
-            # Exemplo - ajuste para seus dados reais
-            from app import dados_pzem  # ou importe de onde vem seus dados
-            consumo_total = dados_pzem.get('pzem1', {}).get('power', 0) + dados_pzem.get('pzem2', {}).get('power', 0)
-        except:
-            # Fallback caso não consiga obter os dados
-            consumo_total = 0
-        
-        limite_total = config.limite_pzem1 + config.limite_pzem2
-        limite_pico = limite_total * 0.8  # 80% do limite total
-        
-        if consumo_total >= limite_pico:
-            alerta_id = f"consumo_pico_{datetime.now().strftime('%Y%m%d%H')}"
-            
-            if alerta_id not in self.alertas_enviados:
-                percentual = (consumo_total / limite_total) * 100
-                mensagem = (
-                    f"⚡ **CONSUMO EM PICO** ⚡\n"
-                    f"Consumo atual: {consumo_total:.0f}W\n"
-                    f"Limite do sistema: {limite_total:.0f}W\n"
-                    f"Utilização: {percentual:.1f}%\n"
-                    f"⏰ {datetime.now().strftime('%H:%M')}"
-                )
-                
-                self.enviar_notificacao('consumo_pico', mensagem, config)
-                self.alertas_enviados.add(alerta_id)
-                print(f"🔔 Alerta de consumo em pico: {consumo_total:.0f}W")
-
-    def verificar_reles_desligados(self, config):
-        """Verifica se relés foram desligados automaticamente recentemente"""
-        try:
-            from app import comandos_pendentes, dados_lock
-            
-            with dados_lock:
-                comandos_desligar = [cmd for cmd in comandos_pendentes if cmd.endswith('_OFF')]
-            
-            if comandos_desligar:
-                for comando in comandos_desligar:
-                    alerta_id = f"rele_desligado_{comando}_{datetime.now().strftime('%Y%m%d%H')}"
-                    
-                    if alerta_id not in self.alertas_enviados:
-                        rele_id = comando.replace('RELE', '').replace('_OFF', '')
-                        mensagem = (
-                            f"🔌 **RELÉ DESLIGADO** 🔌\n"
-                            f"Relé {rele_id} foi desligado automaticamente\n"
-                            f"Motivo: Saldo baixo ou limite atingido\n"
-                            f"Saldo atual: {config.saldo_kwh:.2f} kWh\n"
-                            f"⏰ {datetime.now().strftime('%H:%M')}"
-                        )
-                        
-                        self.enviar_notificacao('reles_desligados', mensagem, config)
-                        self.alertas_enviados.add(alerta_id)
-                        print(f"🔔 Alerta de relé desligado: {comando}")
-        except Exception as e:
-            print(f"❌ Erro ao verificar relés desligados: {e}")
-
-    def verificar_pzem_offline(self, config):
-        """Verifica se algum PZEM está offline"""
-        try:
-            from app import dados_pzem
-            
-            agora = datetime.now(timezone.utc)
-            
-            for pzem_id in [1, 2]:
-                pzem_key = f'pzem{pzem_id}'
-                ultima_atualizacao = dados_pzem.get(pzem_key, {}).get('ultima_atualizacao')
-                
-                if ultima_atualizacao:
-                    tempo_desconectado = (agora - ultima_atualizacao).total_seconds()
-                    
-                    # Considera offline se não atualizou há mais de 2 minutos
-                    if tempo_desconectado > 120:  # 2 minutos
-                        alerta_id = f"pzem_offline_{pzem_id}_{datetime.now().strftime('%Y%m%d%H')}"
-                        
-                        if alerta_id not in self.alertas_enviados:
-                            mensagem = (
-                                f"❌ **PZEM OFFLINE** ❌\n"
-                                f"PZEM {pzem_id} desconectado\n"
-                                f"Tempo offline: {tempo_desconectado/60:.1f} minutos\n"
-                                f"Última atualização: {ultima_atualizacao.strftime('%H:%M')}\n"
-                                f"⏰ {datetime.now().strftime('%H:%M')}"
-                            )
-                            
-                            self.enviar_notificacao('pzem_offline', mensagem, config)
-                            self.alertas_enviados.add(alerta_id)
-                            print(f"🔔 Alerta de PZEM offline: {pzem_key}")
-        except Exception as e:
-            print(f"❌ Erro ao verificar PZEM offline: {e}")
-
-    def verificar_erros_sistema(self, config):
-        """Monitora erros no sistema"""
-        # Esta função pode ser expandida para monitorar logs específicos
-        # Por enquanto, é um placeholder para futuras implementações
-        pass
-
-    def enviar_notificacao(self, tipo, mensagem, config):
-        """Envia notificação por todos os canais configurados"""
-        try:
-            # Telegram
-            if config.notify_telegram and config.telegram_bot_token and config.telegram_chat_id:
-                self.enviar_telegram(mensagem, config)
-            
-            # Email (apenas para alertas críticos)
-            if config.notify_email and tipo in ['saldo_baixo', 'pzem_offline', 'erro_sistema']:
-                self.enviar_email(tipo, mensagem, config)
-            
-            # Browser (sempre que possível)
-            if config.notify_browser:
-                self.enviar_browser(tipo, mensagem)
-                
-        except Exception as e:
-            print(f"❌ Erro ao enviar notificação: {e}")
-
-    def enviar_telegram(self, mensagem, config):
-        """Envia mensagem via Telegram (compatível Railway)"""
-        try:
-            import requests
-
-            url = f"https://api.telegram.org/bot{config.telegram_bot_token}/sendMessage"
-
-            payload = {
-                'chat_id': str(config.telegram_chat_id).strip(),
-                'text': mensagem,
-                'parse_mode': 'HTML'
-            }
-
-            # ⚠️ Railway precisa JSON + cabeçalho
-            response = requests.post(
-                url,
-                json=payload,
-                timeout=10,
-                headers={"Content-Type": "application/json"}
-            )
-
-            if response.json().get('ok'):
-                print("✅ Notificação Telegram enviada")
-            else:
-                print(f"❌ Erro Telegram:", response.json())
-
-        except Exception as e:
-            print(f"❌ Erro ao enviar Telegram: {e}")
-
-
-    def enviar_email(self, tipo, mensagem, config):
-            """Envia email de notificação"""
-            try:
-                import smtplib
-                from email.mime.text import MIMEText
-                from email.mime.multipart import MIMEMultipart
-                
-                # Configurar mensagem
-                msg = MIMEMultipart()
-                msg['From'] = config.email_sender
-                msg['To'] = config.email_notificacao
-                msg['Subject'] = f"🔔 Alerta do Sistema - {tipo.upper()}"
-                
-                # Corpo do email
-                body = f"""
-                <h2>Alerta do Sistema de Energia</h2>
-                <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px;">
-                    {mensagem.replace('\n', '<br>')}
-                </div>
-                <br>
-                <small>Sistema de Automação Residencial - {datetime.now().strftime('%d/%m/%Y %H:%M')}</small>
-                """
-                
-                msg.attach(MIMEText(body, 'html'))
-                
-                # Enviar email
-                if config.smtp_port == 465:
-                    server = smtplib.SMTP_SSL(config.smtp_server, config.smtp_port, timeout=15)
-                else:
-                    server = smtplib.SMTP(config.smtp_server, config.smtp_port, timeout=15)
-                    server.starttls()
-                
-                server.login(config.email_sender, config.email_password)
-                server.sendmail(config.email_sender, config.email_notificacao, msg.as_string())
-                server.quit()
-                
-                print("✅ Notificação Email enviada")
-                
-            except Exception as e:
-                print(f"❌ Erro ao enviar Email: {e}")
-
-    def enviar_browser(self, tipo, mensagem):
-            """Envia notificação no navegador (será capturada pelo JavaScript)"""
-            # Esta notificação será processada pelo frontend
-            print(f"🔔 Notificação Browser: {tipo} - {mensagem}")
-
-    def limpar_alertas_antigos(self):
-            """Remove alertas antigos do conjunto para evitar duplicação"""
-            agora = datetime.now()
-            alertas_para_remover = []
-            
-            for alerta_id in self.alertas_enviados:
-                # Remove alertas com mais de 24 horas
-                if agora.strftime('%Y%m%d') not in alerta_id:
-                    alertas_para_remover.append(alerta_id)
-            
-            for alerta_id in alertas_para_remover:
-                self.alertas_enviados.remove(alerta_id)
-
-# ==========================================================
-# INICIALIZAÇÃO DO SERVIÇO
-# ==========================================================
-servico_notificacoes = ServicoNotificacoes()
-
 # ==========================================================
 # ROTAS ADICIONAIS PARA DEBUG
 # ==========================================================
@@ -921,7 +971,10 @@ def status_notificacoes():
         },
         "limite_saldo_baixo": config.saldo_baixo_limite,
         "ultima_verificacao": servico_notificacoes.ultima_verificacao.isoformat() if servico_notificacoes.ultima_verificacao else None,
-        "alertas_pendentes": len(servico_notificacoes.alertas_enviados)
+        "alertas_pendentes": servico_notificacoes.alertas_enviados.ativos(),
+        "caixa_saida": despachante_notificacoes.status(),
+        "smtp": pool_smtp.status(),
+        "telegram": enviador_telegram.status()
     })
 
 
@@ -1002,26 +1055,28 @@ class Recarga(db.Model):
 # ==========================================================
 @app.route("/api/ldr", methods=["POST"])
 def receber_ldr():
-    global ULTIMO_LDR
-
     data = request.get_json()
 
     if not data or "api_key" not in data or data["api_key"] not in API_KEYS:
         return {"error": "Unauthorized"}, 401
 
-    ULTIMO_LDR["valorLuz"] = data.get("valorLuz", 0)
-    ULTIMO_LDR["R1"] = data.get("R1", 0)
+    ldr = estado_vivo.gravar("ldr", {
+        "valorLuz": data.get("valorLuz", 0),
+        "R1": data.get("R1", 0)
+    })
 
-    print(f"[LDR] valorLuz={ULTIMO_LDR['valorLuz']} | R1={ULTIMO_LDR['R1']}")
+    print(f"[LDR] valorLuz={ldr['valorLuz']} | R1={ldr['R1']}")
+    hub_eventos.publicar("ldr", ldr)
 
     return {"success": True}
 
 @app.route("/api/get_ldr", methods=["GET"])
 def get_ldr():
+    ldr = estado_vivo.ler("ldr")
     return {
         "success": True,
-        "valorLuz": ULTIMO_LDR["valorLuz"],
-        "R1": ULTIMO_LDR["R1"]
+        "valorLuz": ldr["valorLuz"],
+        "R1": ldr["R1"]
     }
 
 # ==========================================================
@@ -1075,17 +1130,20 @@ def gerar_relatorio():
     except ValueError as e:
         return jsonify({"success": False, "message": f"Formato de data inválido: {str(e)}"}), 400
 
+    # Intervalo semiaberto [ts_inicio, ts_fim) → filtros sargáveis
+    ts_inicio, ts_fim = intervalo_datas(dt_start, dt_end)
+
     # ============================
-    # 2) Consulta base com filtros
+    # 2) Consulta base com filtros (rollup diário)
     # ============================
-    base_query = EnergyData.query.filter(
-        func.date(EnergyData.timestamp) >= dt_start,
-        func.date(EnergyData.timestamp) <= dt_end
+    dias_query = EnergiaDia.query.filter(
+        EnergiaDia.inicio >= ts_inicio,
+        EnergiaDia.inicio < ts_fim
     )
 
     if pzem != "all":
         try:
-            base_query = base_query.filter(EnergyData.pzem_id == int(pzem))
+            dias_query = dias_query.filter(EnergiaDia.pzem_id == int(pzem))
         except ValueError:
             return jsonify({"success": False, "message": "PZEM ID inválido"}), 400
 
@@ -1098,8 +1156,8 @@ def gerar_relatorio():
         try:
             # Para recargas, ignoramos o filtro de PZEM
             recargas = Recarga.query.filter(
-                func.date(Recarga.criado_em) >= dt_start,
-                func.date(Recarga.criado_em) <= dt_end
+                Recarga.criado_em >= ts_inicio,
+                Recarga.criado_em < ts_fim
             ).order_by(Recarga.criado_em.desc()).all()
 
             for recarga in recargas:
@@ -1133,24 +1191,11 @@ def gerar_relatorio():
     # ============================
     if tipo == "consumo":
         try:
-            rows = db.session.query(
-                func.date(EnergyData.timestamp).label("data"),
-                func.sum(EnergyData.energy).label("energia_total")
-            ).filter(
-                func.date(EnergyData.timestamp) >= dt_start,
-                func.date(EnergyData.timestamp) <= dt_end
-            )
-            
-            if pzem != "all":
-                rows = rows.filter(EnergyData.pzem_id == int(pzem))
-                
-            rows = rows.group_by(func.date(EnergyData.timestamp)).all()
-
-            for data, energia in rows:
-                custo = energia * cfg.preco_kwh
+            for dia in resumo_diario_rollups(dias_query.all()):
+                custo = dia["energia"] * cfg.preco_kwh
                 dados.append({
-                    "data": data.strftime("%Y-%m-%d"),
-                    "energia": round(float(energia), 3),
+                    "data": dia["data"].strftime("%Y-%m-%d"),
+                    "energia": round(float(dia["energia"]), 3),
                     "custo": round(float(custo), 2)
                 })
             
@@ -1172,25 +1217,11 @@ def gerar_relatorio():
     # ============================
     elif tipo == "picos":
         try:
-            rows = db.session.query(
-                func.date(EnergyData.timestamp).label("data"),
-                func.max(EnergyData.power).label("pico_potencia"),
-                func.min(EnergyData.timestamp).label("primeira_ocorrencia")
-            ).filter(
-                func.date(EnergyData.timestamp) >= dt_start,
-                func.date(EnergyData.timestamp) <= dt_end
-            )
-            
-            if pzem != "all":
-                rows = rows.filter(EnergyData.pzem_id == int(pzem))
-                
-            rows = rows.group_by(func.date(EnergyData.timestamp)).all()
-
-            for data, pico, timestamp in rows:
+            for dia in resumo_diario_rollups(dias_query.all()):
                 dados.append({
-                    "data": data.strftime("%Y-%m-%d"),
-                    "pico": round(float(pico), 1),
-                    "hora": timestamp.time().strftime("%H:%M") if timestamp else "--:--"
+                    "data": dia["data"].strftime("%Y-%m-%d"),
+                    "pico": round(float(dia["pico"]), 1),
+                    "hora": dia["pico_em"].strftime("%H:%M") if dia["pico_em"] else "--:--"
                 })
 
             return jsonify({
@@ -1218,19 +1249,22 @@ def gerar_relatorio():
             dados = []
             for rele in reles:
                 # Calcular consumo médio - CORREÇÃO: garantir que não seja None
-                consumo_medio_result = db.session.query(func.avg(EnergyData.power)).filter(
-                    EnergyData.pzem_id == rele.pzem_id,
-                    func.date(EnergyData.timestamp) >= dt_start,
-                    func.date(EnergyData.timestamp) <= dt_end
-                ).scalar()
+                soma_power, total_amostras = db.session.query(
+                    func.sum(EnergiaDia.power_soma),
+                    func.sum(EnergiaDia.amostras)
+                ).filter(
+                    EnergiaDia.pzem_id == rele.pzem_id,
+                    EnergiaDia.inicio >= ts_inicio,
+                    EnergiaDia.inicio < ts_fim
+                ).one()
                 
-                consumo_medio = float(consumo_medio_result) if consumo_medio_result is not None else 0.0
+                consumo_medio = float(soma_power) / total_amostras if total_amostras else 0.0
 
                 # Contar mudanças de estado no período
                 mudancas_count = ReleLog.query.filter(
                     ReleLog.rele_id == rele.id,
-                    func.date(ReleLog.timestamp) >= dt_start,
-                    func.date(ReleLog.timestamp) <= dt_end
+                    ReleLog.timestamp >= ts_inicio,
+                    ReleLog.timestamp < ts_fim
                 ).count()
 
                 # Calcular dias do período
@@ -1278,25 +1312,14 @@ def gerar_relatorio():
                 return jsonify({"success": False, "message": "Configuração do sistema não encontrada"}), 500
             
             # 1️⃣ DADOS DE CONSUMO
-            rows = db.session.query(
-                func.date(EnergyData.timestamp).label("data"),
-                func.sum(EnergyData.energy).label("energia_total")
-            ).filter(
-                func.date(EnergyData.timestamp) >= dt_start,
-                func.date(EnergyData.timestamp) <= dt_end
-            )
-            
-            if pzem != "all":
-                rows = rows.filter(EnergyData.pzem_id == int(pzem))
-                
-            rows = rows.group_by(func.date(EnergyData.timestamp)).all()
+            rows = resumo_diario_rollups(dias_query.all())
 
             # 2️⃣ DADOS DE RECARGAS
             recargas_periodo = db.session.query(
                 func.sum(Recarga.valor_mzn).label("total_recargas")
             ).filter(
-                func.date(Recarga.criado_em) >= dt_start,
-                func.date(Recarga.criado_em) <= dt_end
+                Recarga.criado_em >= ts_inicio,
+                Recarga.criado_em < ts_fim
             ).scalar() or 0
 
             # 3️⃣ DADOS PARA MÉTRICAS AVANÇADAS
@@ -1308,12 +1331,13 @@ def gerar_relatorio():
             # Dados para análise comparativa
             periodo_anterior_start = dt_start - (dt_end - dt_start) - timedelta(days=1)
             periodo_anterior_end = dt_start - timedelta(days=1)
+            ts_anterior_inicio, ts_anterior_fim = intervalo_datas(periodo_anterior_start, periodo_anterior_end)
             
             consumo_periodo_anterior = db.session.query(
-                func.sum(EnergyData.energy)
+                func.sum(EnergiaDia.energia_soma)
             ).filter(
-                func.date(EnergyData.timestamp) >= periodo_anterior_start,
-                func.date(EnergyData.timestamp) <= periodo_anterior_end
+                EnergiaDia.inicio >= ts_anterior_inicio,
+                EnergiaDia.inicio < ts_anterior_fim
             ).scalar() or 0
 
             # 4️⃣ PROCESSAR DADOS DIÁRIOS
@@ -1323,13 +1347,14 @@ def gerar_relatorio():
 
             dados = []  # Resetar dados para este relatório
 
-            for data, energia in rows:
+            for dia in rows:
+                energia = dia["energia"]
                 custo_dia = energia * cfg.preco_kwh
                 custo_total += custo_dia
                 energia_total += energia
                 
                 dados.append({
-                    "data": data.strftime("%Y-%m-%d"),
+                    "data": dia["data"].strftime("%Y-%m-%d"),
                     "energia": round(float(energia), 3),
                     "custo_dia": round(float(custo_dia), 2)
                 })
@@ -1356,19 +1381,20 @@ def gerar_relatorio():
                 variacao_consumo = ((energia_total - consumo_periodo_anterior) / consumo_periodo_anterior * 100)
             
             # Análise de eficiência
+            # (rollup horário: horas em que o máximo passou de 70% do limite)
             horas_pico = db.session.query(
-                func.count(EnergyData.id)
+                func.count(EnergiaHora.id)
             ).filter(
-                EnergyData.power > (cfg.limite_pzem1 * 0.7),  # 70% do limite como pico
-                func.date(EnergyData.timestamp) >= dt_start,
-                func.date(EnergyData.timestamp) <= dt_end
+                EnergiaHora.power_max > (cfg.limite_pzem1 * 0.7),  # 70% do limite como pico
+                EnergiaHora.inicio >= ts_inicio,
+                EnergiaHora.inicio < ts_fim
             ).scalar() or 0
 
             total_registros = db.session.query(
-                func.count(EnergyData.id)
+                func.count(EnergiaHora.id)
             ).filter(
-                func.date(EnergyData.timestamp) >= dt_start,
-                func.date(EnergyData.timestamp) <= dt_end
+                EnergiaHora.inicio >= ts_inicio,
+                EnergiaHora.inicio < ts_fim
             ).scalar() or 1
 
             percentual_horas_pico = (horas_pico / total_registros) * 100
@@ -1607,7 +1633,10 @@ def registrar_log_rele(rele_id, estado_anterior, estado_novo, motivo, modo_opera
 class ServicoNotificacoes:
     def __init__(self):
         self.ultima_verificacao = None
-        self.alertas_enviados = set()
+        # Alertas já enviados: tabela partilhada com TTL (um só envio por chave entre workers)
+        self.alertas_enviados = RegistoAlertas(
+            db, AlertaEnviado, ttl=app.config.get('ALERTAS_TTL', 86400)
+        )
         self.ultimo_email_diario = None
 
     def verificar_todas_notificacoes(self):
@@ -1656,7 +1685,7 @@ class ServicoNotificacoes:
         if config.saldo_kwh <= limite_saldo_baixo:
             alerta_id = f"saldo_baixo_{datetime.now().strftime('%Y%m%d%H')}"
             
-            if alerta_id not in self.alertas_enviados:
+            if self.alertas_enviados.reservar(alerta_id):
                 mensagem = (
                     f"⚠️ **SALDO BAIXO** ⚠️\n"
                     f"Saldo atual: {config.saldo_kwh:.2f} kWh\n"
@@ -1666,7 +1695,6 @@ class ServicoNotificacoes:
                 )
                 
                 self.enviar_notificacao('saldo_baixo', mensagem, config)
-                self.alertas_enviados.add(alerta_id)
                 print(f"🔔 Alerta de saldo baixo: {config.saldo_kwh:.2f} kWh ≤ {limite_saldo_baixo} kWh")
 
     # ==========================================================
@@ -1681,7 +1709,7 @@ class ServicoNotificacoes:
         if consumo_total >= limite_pico:
             alerta_id = f"consumo_pico_{datetime.now().strftime('%Y%m%d%H')}"
             
-            if alerta_id not in self.alertas_enviados:
+            if self.alertas_enviados.reservar(alerta_id):
                 percentual = (consumo_total / limite_total) * 100
                 mensagem = (
                     f"⚡ **CONSUMO EM PICO** ⚡\n"
@@ -1692,7 +1720,6 @@ class ServicoNotificacoes:
                 )
                 
                 self.enviar_notificacao('consumo_pico', mensagem, config)
-                self.alertas_enviados.add(alerta_id)
                 print(f"🔔 Alerta de consumo em pico: {consumo_total:.0f}W")
 
     # ==========================================================
@@ -1701,14 +1728,13 @@ class ServicoNotificacoes:
     def verificar_reles_desligados(self, config):
         """Verifica se relés foram desligados automaticamente recentemente"""
         # Verifica os comandos pendentes para ver se há relés sendo desligados
-        with dados_lock:
-            comandos_desligar = [cmd for cmd in comandos_pendentes if cmd.endswith('_OFF')]
+        comandos_desligar = [c.comando for c in fila_comandos.abertos() if c.comando.endswith('_OFF')]
         
         if comandos_desligar:
             for comando in comandos_desligar:
                 alerta_id = f"rele_desligado_{comando}_{datetime.now().strftime('%Y%m%d%H')}"
                 
-                if alerta_id not in self.alertas_enviados:
+                if self.alertas_enviados.reservar(alerta_id):
                     rele_id = comando.replace('RELE', '').replace('_OFF', '')
                     mensagem = (
                         f"🔌 **RELÉ DESLIGADO** 🔌\n"
@@ -1719,7 +1745,6 @@ class ServicoNotificacoes:
                     )
                     
                     self.enviar_notificacao('reles_desligados', mensagem, config)
-                    self.alertas_enviados.add(alerta_id)
                     print(f"🔔 Alerta de relé desligado: {comando}")
 
     # ==========================================================
@@ -1736,11 +1761,11 @@ class ServicoNotificacoes:
             if ultima_atualizacao:
                 tempo_desconectado = (agora - ultima_atualizacao).total_seconds()
                 
-                # Considera offline se não atualizou há mais de 2 minutos
-                if tempo_desconectado > 120:  # 2 minutos
+                # Considera offline se não atualizou há mais de 2 minutos (e fora da janela dos lotes)
+                if tempo_desconectado > max(120, app.config.get('PZEM_ONLINE_SEGUNDOS', 150)):
                     alerta_id = f"pzem_offline_{pzem_id}_{datetime.now().strftime('%Y%m%d%H')}"
                     
-                    if alerta_id not in self.alertas_enviados:
+                    if self.alertas_enviados.reservar(alerta_id):
                         mensagem = (
                             f"❌ **PZEM OFFLINE** ❌\n"
                             f"PZEM {pzem_id} desconectado\n"
@@ -1750,7 +1775,6 @@ class ServicoNotificacoes:
                         )
                         
                         self.enviar_notificacao('pzem_offline', mensagem, config)
-                        self.alertas_enviados.add(alerta_id)
                         print(f"🔔 Alerta de PZEM offline: {pzem_key}")
 
     # ==========================================================
@@ -1766,48 +1790,44 @@ class ServicoNotificacoes:
     # MÉTODOS DE ENVIO DE NOTIFICAÇÕES
     # ==========================================================
     def enviar_notificacao(self, tipo, mensagem, config):
-        """Envia notificação por todos os canais configurados"""
+        """Coloca a notificação na caixa de saída de cada canal configurado
+        (Telegram/email seguem pelo despachante, fora da ingestão)"""
         try:
-            # Telegram
+            # Telegram (espera alguns segundos para juntar a rajada de alertas numa só mensagem)
             if config.notify_telegram and config.telegram_bot_token and config.telegram_chat_id:
-                self.enviar_telegram(mensagem, config)
+                despachante_notificacoes.enfileirar('telegram', tipo, mensagem, enviar_em=janela_agrupamento(
+                    datetime.utcnow(), app.config.get('TELEGRAM_AGRUPAR_SEGUNDOS', 3)
+                ))
             
-            # Email (apenas para alertas críticos)
+            # Email (apenas para alertas críticos; hourly/daily → resumo na próxima janela)
             if config.notify_email and tipo in ['saldo_baixo', 'pzem_offline', 'erro_sistema']:
-                self.enviar_email(tipo, mensagem, config)
+                despachante_notificacoes.enfileirar('email', tipo, mensagem, enviar_em=janela_resumo(
+                    config.email_frequency, datetime.utcnow(), app.config.get('EMAIL_RESUMO_HORA', 6)
+                ))
+            
+            db.session.commit()
             
             # Browser (sempre que possível)
             if config.notify_browser:
                 self.enviar_browser(tipo, mensagem)
                 
         except Exception as e:
+            db.session.rollback()
             print(f"❌ Erro ao enviar notificação: {e}")
 
     def enviar_telegram(self, mensagem, config):
-        """Envia mensagem via Telegram"""
+        """Envia mensagem(ns) via Telegram (sessão HTTP partilhada, com limite de taxa por chat)"""
+        mensagens = [mensagem] if isinstance(mensagem, str) else mensagem
         try:
-            import requests
-            
-            url = f"https://api.telegram.org/bot{config.telegram_bot_token}/sendMessage"
-            payload = {
-                'chat_id': config.telegram_chat_id,
-                'text': mensagem,
-                'parse_mode': 'Markdown'
-            }
-            
-            response = requests.post(url, data=payload, timeout=10)
-            if response.json().get('ok'):
-                print("✅ Notificação Telegram enviada")
-            else:
-                print(f"❌ Erro Telegram: {response.json().get('description')}")
-                
+            enviador_telegram.enviar_varias(config.telegram_bot_token, config.telegram_chat_id, mensagens)
+            print("✅ Notificação Telegram enviada")
         except Exception as e:
             print(f"❌ Erro ao enviar Telegram: {e}")
+            raise  # o despachante decide a nova tentativa
 
     def enviar_email(self, tipo, mensagem, config):
         """Envia email de notificação"""
         try:
-            import smtplib
             from email.mime.text import MIMEText
             from email.mime.multipart import MIMEMultipart
             
@@ -1829,48 +1849,90 @@ class ServicoNotificacoes:
             
             msg.attach(MIMEText(body, 'html'))
             
-            # Enviar email
-            if config.smtp_port == 465:
-                server = smtplib.SMTP_SSL(config.smtp_server, config.smtp_port, timeout=15)
-            else:
-                server = smtplib.SMTP(config.smtp_server, config.smtp_port, timeout=15)
-                server.starttls()
-            
-            server.login(config.email_sender, config.email_password)
-            server.sendmail(config.email_sender, config.email_notificacao, msg.as_string())
-            server.quit()
+            # Enviar email pela conexão mantida aberta no pool (sem novo login a cada alerta)
+            pool_smtp.enviar(config, config.email_notificacao, msg)
             
             print("✅ Notificação Email enviada")
             
         except Exception as e:
             print(f"❌ Erro ao enviar Email: {e}")
+            raise  # o despachante decide a nova tentativa
 
     def enviar_browser(self, tipo, mensagem):
-        """Envia notificação no navegador (será capturada pelo JavaScript)"""
-        # Esta notificação será processada pelo frontend
+        """Envia notificação no navegador (evento 'alerta' do /api/eventos)"""
         print(f"🔔 Notificação Browser: {tipo} - {mensagem}")
+        hub_eventos.publicar("alerta", {"tipo": tipo, "mensagem": mensagem})
 
     # ==========================================================
     # LIMPEZA DE ALERTAS ANTIGOS
     # ==========================================================
     def limpar_alertas_antigos(self):
-        """Remove alertas antigos do conjunto para evitar duplicação"""
-        agora = datetime.now()
-        alertas_para_remover = []
-        
-        for alerta_id in self.alertas_enviados:
-            # Remove alertas com mais de 24 horas
-            if agora.strftime('%Y%m%d') not in alerta_id:
-                alertas_para_remover.append(alerta_id)
-        
-        for alerta_id in alertas_para_remover:
-            self.alertas_enviados.remove(alerta_id)
+        """Remove alertas expirados do registo (as chaves continuam a evitar duplicação até expirar)"""
+        try:
+            self.alertas_enviados.limpar()
+        except Exception as e:
+            print(f"⚠️ Erro ao limpar alertas antigos: {e}")
 
 # ==========================================================
 # INICIALIZAÇÃO DO SERVIÇO
 # ==========================================================
 servico_notificacoes = ServicoNotificacoes()
 
+def _configuracao_envio():
+    config = Configuracao.query.first()
+    if not config:
+        raise RuntimeError("Configuração não encontrada")
+    return config
+
+pool_smtp = PoolSMTP(
+    tamanho=app.config.get('SMTP_POOL_TAMANHO', 2),
+    ocioso_maximo=app.config.get('SMTP_OCIOSO_MAXIMO', 240)
+)
+
+enviador_telegram = EnviadorTelegram(
+    mensagens_por_minuto_chat=app.config.get('TELEGRAM_MENSAGENS_POR_MINUTO', 20),
+    rajada_chat=app.config.get('TELEGRAM_RAJADA', 3),
+    tamanho_pool=app.config.get('NOTIFICACOES_TRABALHADORES', 4),
+    cliente=app.config.get('TELEGRAM_CLIENTE', 'requests')
+)
+
+def enviar_telegram_notificacoes(notificacoes):
+    """Alertas vencidos juntos → o menor número de mensagens (até 4096 caracteres cada)"""
+    config = _configuracao_envio()
+    servico_notificacoes.enviar_telegram([n.mensagem for n in notificacoes], config)
+
+def enviar_email_notificacoes(notificacoes):
+    """Um email por grupo: o alerta sozinho ou um resumo de todos os alertas da janela"""
+    config = _configuracao_envio()
+    if len(notificacoes) == 1:
+        servico_notificacoes.enviar_email(notificacoes[0].tipo, notificacoes[0].mensagem, config)
+        return
+
+    contagem = {}
+    for n in notificacoes:
+        contagem[n.tipo] = contagem.get(n.tipo, 0) + 1
+    resumo = ", ".join(f"{total}× {tipo}" for tipo, total in contagem.items())
+    mensagem = f"📬 {len(notificacoes)} alertas ({resumo})\n\n" + "\n\n".join(
+        f"🕒 {n.criado_em.strftime('%d/%m %H:%M')} UTC\n{n.mensagem}" for n in notificacoes
+    )
+    servico_notificacoes.enviar_email('resumo', mensagem, config)
+
+# Envio real de cada canal (lê a configuração atual no momento do envio);
+# alertas vencidos ao mesmo tempo seguem num único envio por canal
+despachante_notificacoes = DespachanteNotificacoes(
+    db, NotificacaoSaida, app.app_context,
+    enviadores={
+        "telegram": enviar_telegram_notificacoes,
+        "email": enviar_email_notificacoes
+    },
+    agrupar=("email", "telegram"),
+    trabalhadores=app.config.get('NOTIFICACOES_TRABALHADORES', 4),
+    tentativas_maximas=app.config.get('NOTIFICACOES_TENTATIVAS', 5),
+    backoff_base=app.config.get('NOTIFICACOES_BACKOFF_BASE', 30),
+    backoff_maximo=app.config.get('NOTIFICACOES_BACKOFF_MAXIMO', 3600),
+    intervalo=app.config.get('NOTIFICACOES_INTERVALO', 10)
+)
+
 
 # ==========================================================
 # SISTEMA COMPLETO DE PICOS (DIÁRIO, SEMANAL, MENSAL)
@@ -1903,78 +1965,31 @@ def obter_energia_atual():
 # CONTROLE DE RELES
 # ==========================================================
 
-def verificar_e_controlar_reles():
-    """Liga ou desliga relés AUTOMÁTICOS baseado no saldo kWh"""
-    
-    config = Configuracao.query.first()
-    print("🔍 INICIANDO CONTROLE AUTOMÁTICO DE RELÉS")
-    if not config:
-        print("❌ Sem configuração encontrada")
-        return
-
-    saldo = config.saldo_kwh
-    print(f"🔋 SALDO ATUAL: {saldo:.2f} kWh")
-    
-    reles = Rele.query.all()
-    
-    for rele in reles:
-        print(f"🔌 Analisando {rele.nome}: modo_auto={rele.modo_automatico}, estado={rele.estado}, limite={rele.limite_individual}")
-
-        # 1️⃣ Se está MANUAL → ignorar limites
-        if not rele.modo_automatico:
-            continue
-
-        # 2️⃣ Proteção contra toque manual
-        if rele.ultima_alteracao_manual:
-            delta = (datetime.utcnow() - rele.ultima_alteracao_manual).total_seconds()
-            if delta < 30:
-                print(f"🛡️ Ignorando '{rele.nome}' (alterado manualmente há {delta:.1f}s)")
-                continue
-
-        estado_anterior = rele.estado
-
-        # 3️⃣ DESLIGAR se saldo baixo
-        if saldo <= rele.limite_individual and rele.estado:
-            print(f"⚠️ DESLIGANDO '{rele.nome}' — SALDO({saldo:.2f}) ≤ LIMITE({rele.limite_individual})")
-            rele.estado = False
-
-            # 🔥 REGISTRAR LOG
-            registrar_log_rele(
-                rele.id, 
-                True, 
-                False, 
-                'saldo_baixo', 
-                'automatico'
-            )
-
-            with dados_lock:
-                comandos_pendentes.append(f"RELE{rele.id}_OFF")
-            continue
-
-        # 4️⃣ LIGAR se saldo alto
-        if saldo > rele.limite_individual and not rele.estado:
-            print(f"🟢 LIGANDO '{rele.nome}' — SALDO({saldo:.2f}) > LIMITE({rele.limite_individual})")
-            rele.estado = True
+# Relés automáticos em memória ordenados pelo limite: só há trabalho quando o saldo cruza um
+motor_reles = MotorReles(
+    db, Rele, ReleLog, versoes_dados, fila_comandos,
+    histerese_kwh=app.config.get('RELES_HISTERESE_KWH', 0.0),
+    tempo_minimo_ligado=app.config.get('RELES_TEMPO_MINIMO_LIGADO', 0),
+    tempo_minimo_desligado=app.config.get('RELES_TEMPO_MINIMO_DESLIGADO', 0)
+)
 
-            # 🔥 REGISTRAR LOG
-            registrar_log_rele(
-                rele.id, 
-                False, 
-                True, 
-                'saldo_suficiente', 
-                'automatico'
-            )
 
-            with dados_lock:
-                comandos_pendentes.append(f"RELE{rele.id}_ON")
-            continue
+def verificar_e_controlar_reles(saldo=None, rever_todos=False):
+    """Liga ou desliga relés AUTOMÁTICOS baseado no saldo kWh (motor de limiares ordenados);
+    rever_todos=True reavalia todos os relés e não só os que o saldo cruzou"""
+    if saldo is None:
+        config = Configuracao.query.first()
+        if not config:
+            print("❌ Sem configuração encontrada")
+            return
+        saldo = config.saldo_kwh
 
     try:
-        db.session.commit()
-        print("💾 BD actualizada com sucesso!")
+        alterados = motor_reles.controlar(saldo, rever_todos)
+        if alterados:
+            print(f"💾 {len(alterados)} relé(s) atualizado(s) com saldo {saldo:.2f} kWh")
     except Exception as e:
         print(f"❌ Erro ao salvar controle automático: {e}")
-        db.session.rollback()
 # ==========================================================
 
 def verificar_e_controlar_reles_DEBUG():
@@ -2025,8 +2040,7 @@ def verificar_e_controlar_reles_DEBUG():
             comando = f"RELE{rele.id}_OFF"
             print(f"➡️ ENVIAR PARA ESP: {comando}")
 
-            with dados_lock:
-                comandos_pendentes.append(comando)
+            fila_comandos.enfileirar(comando, origem='automatico')
             continue
 
         # 4️⃣ LIGAR se saldo alto
@@ -2037,8 +2051,7 @@ def verificar_e_controlar_reles_DEBUG():
             comando = f"RELE{rele.id}_ON"
             print(f"➡️ ENVIAR PARA ESP: {comando}")
 
-            with dados_lock:
-                comandos_pendentes.append(comando)
+            fila_comandos.enfileirar(comando, origem='automatico')
             continue
 
         print("✔ Sem mudanças — Estado já correcto.")
@@ -2082,7 +2095,7 @@ def verificar_automatico_esp():
     print("====================")
 
     # AQUI → Chama a função que gera comandos!
-    verificar_e_controlar_reles()
+    verificar_e_controlar_reles(rever_todos=True)
 
     return jsonify({"success": True, "message": "Verificação executada com API_KEY"})
 
@@ -2147,8 +2160,7 @@ def toggle_rele_state(rele_id):
     acao = "ON" if novo_estado else "OFF"
     comando = f"RELE{rele.id}_{acao}"
 
-    with dados_lock:
-        comandos_pendentes.append(comando)
+    fila_comandos.enfileirar(comando, origem='manual')
 
     try:
         db.session.commit()
@@ -2212,8 +2224,7 @@ def alterar_estado_rele(rele_id):
     # Envia comando para o ESP
     acao = "ON" if novo_estado else "OFF"
     comando = f"RELE{rele.id}_{acao}"
-    with dados_lock:
-        comandos_pendentes.append(comando)
+    fila_comandos.enfileirar(comando, origem='manual')
     
     try:
         db.session.commit()
@@ -2235,7 +2246,7 @@ def alterar_estado_rele(rele_id):
 def forcar_verificacao_reles():
     """Força a verificação e controle dos relés automáticos"""
     try:
-        verificar_e_controlar_reles()
+        verificar_e_controlar_reles(rever_todos=True)
         return jsonify({
             "success": True, 
             "message": "Verificação de relés automáticos executada"
@@ -2441,16 +2452,18 @@ def criar_recarga():
         taxa_radio=config.taxa_radio,
         iva_percent=config.iva_percent,
         preco_kwh=config.preco_kwh,
-        kwh_creditados=calculo['kwh_creditados'],
-        saldo_anterior=config.saldo_kwh,
-        saldo_atual=config.saldo_kwh + calculo['kwh_creditados']
+        kwh_creditados=calculo['kwh_creditados']
     )
     
-    # Atualizar saldo
-    config.saldo_kwh = recarga.saldo_atual
-    
     try:
         db.session.add(recarga)
+        db.session.flush()
+        
+        # Atualizar saldo (soma atómica no banco + movimento no livro do saldo)
+        recarga.saldo_anterior, recarga.saldo_atual = livro_saldo.creditar(
+            config.id, calculo['kwh_creditados'], recarga_id=recarga.id
+        )
+        saldo_alterado(config, recarga.saldo_atual)
         db.session.commit()
         
         return jsonify({
@@ -2611,107 +2624,88 @@ def logout():
 # ==========================================================
 # FUNÇÃO DE DECREMENTO DE ENERGIA EM TEMPO REAL
 # ==========================================================
+# Base dos contadores e saldo ficam na base de dados (servicos/saldo.py):
+# correto com qualquer número de workers
+livro_saldo = LivroSaldo(
+    db, MovimentoSaldo, ContadorEnergia, Configuracao,
+    passo_kwh=app.config.get('SALDO_PASSO_KWH', 0.01)
+)
+
+def total_contador_inicial(pzem_id):
+    """Estado do contador perdido (ex.: reinício do mmap): continua da base já descontada do saldo"""
+    contador = db.session.get(ContadorEnergia, pzem_id)
+    return contador.energia_kwh if contador else 0.0
+
+def criar_normalizador(estado, total_inicial=None):
+    return NormalizadorContador(
+        estado,
+        rollover_kwh=app.config.get('CONTADOR_ROLLOVER_KWH', 10000),
+        potencia_maxima_w=app.config.get('CONTADOR_POTENCIA_MAXIMA_W', 25000),
+        confirmacoes=app.config.get('CONTADOR_CONFIRMACOES', 3),
+        total_inicial=total_inicial
+    )
+
+# Contador acumulado dos PZEMs → delta_kwh por amostra e total normalizado (estado ao vivo)
+normalizador_contador = criar_normalizador(estado_vivo, total_contador_inicial)
+
+def limiares_saldo(config):
+    """Saldos (kWh) em que algo muda: limite de cada relé automático, saldo baixo e zero"""
+    return motor_reles.limites() + [config.saldo_baixo_limite or 5.0, 0.0]
+
+# Consumo integrado em memória: o saldo só é escrito por passo/intervalo ou ao cruzar um limiar
+acumulador_saldo = AcumuladorSaldo(
+    livro_saldo, versoes_dados, limiares_saldo,
+    passo_kwh=app.config.get('SALDO_ESCRITA_KWH', 0.05),
+    intervalo=app.config.get('SALDO_ESCRITA_SEGUNDOS', 60)
+)
+
+def saldo_alterado(config, saldo):
+    """Saldo mudado por UPDATE direto: sincroniza o objeto da sessão e publica o evento depois do commit"""
+    set_committed_value(config, 'saldo_kwh', saldo)
+    db.session.info.setdefault("eventos_pendentes", {})[("saldo", config.id)] = evento_saldo(config)
+    db.session.info.setdefault("versoes_pendentes", set()).add("config")
 
 def atualizar_saldo_com_consumo():
     """
     ATUALIZA O SALDO DE ENERGIA USANDO A DIFERENÇA DO CONSUMO ACUMULADO
-    Versão otimizada para evitar timeout
+    (consumo integrado em memória; desconto atómico no banco por passo, intervalo
+    ou assim que o saldo estimado cruza um limiar)
     """
     try:
         config = Configuracao.query.first()
         if not config:
             return
         
-        consumo_desta_vez = 0.0
         saldo_anterior = config.saldo_kwh
         
-        # Para cada PZEM, calcula quanto consumiu desde a última vez
-        for pzem_id in [1, 2]:
-            pzem_key = f'pzem{pzem_id}'
-            
-            # Verifica se o PZEM está conectado e tem dados válidos
-            if (dados_pzem[pzem_key]['conectado'] and 
-                dados_pzem[pzem_key].get('energy', 0) > 0):
-                
-                consumo_atual = dados_pzem[pzem_key]['energy']
-                consumo_anterior = ultimo_consumo_conhecido[pzem_key]
-                
-                # Calcula quanto foi consumido desde a última vez
-                if consumo_atual >= consumo_anterior:
-                    diferenca_consumo = consumo_atual - consumo_anterior
-                    consumo_desta_vez += diferenca_consumo
-                
-                # Atualiza o último consumo conhecido
-                ultimo_consumo_conhecido[pzem_key] = consumo_atual
+        # Total normalizado de cada PZEM (o mesmo que alimenta delta_kwh e os rollups)
+        leituras = normalizador_contador.totais([1, 2])
         
-        # Subtrai o consumo desde a última vez do saldo atual
-        if consumo_desta_vez > 0.001:  # Só atualiza se consumo > 1 Wh
-            config.saldo_kwh -= consumo_desta_vez
-            config.saldo_kwh = max(0, config.saldo_kwh)
-            
-            # Commit rápido apenas se houver mudança significativa
-            db.session.commit()
-            
-            print(f"📉 Consumo: {consumo_desta_vez:.3f} kWh | Saldo: {saldo_anterior:.2f} → {config.saldo_kwh:.2f} kWh")
-            
-            # ✅✅✅ CORREÇÃO CRÍTICA: Chamar controle de relés após atualizar saldo
-            verificar_e_controlar_reles()
-            
-        else:
-            # Rollback para liberar a transação se não houve consumo significativo
+        resultado = acumulador_saldo.registar(config, leituras)
+        if not resultado["gravou"]:
+            # Nada escrito: o consumo fica pendente em memória até ao próximo passo/limiar
             db.session.rollback()
-            
-    except Exception as e:
-        print(f"❌ Erro ao atualizar saldo: {e}")
-        db.session.rollback()
-    """
-    ATUALIZA O SALDO DE ENERGIA USANDO A DIFERENÇA DO CONSUMO ACUMULADO
-    Versão otimizada para evitar timeout
-    """
-    
-    try:
-        config = Configuracao.query.first()
-        if not config:
+            # Relés à espera (permanência mínima, proteção manual) são revistos a cada lote
+            if motor_reles.tem_pendentes():
+                verificar_e_controlar_reles(saldo_anterior)
             return
         
-        consumo_desta_vez = 0.0
-        saldo_anterior = config.saldo_kwh
+        consumo_desta_vez, saldo = resultado["escrito"] or (0.0, None)
+        if saldo is not None:
+            saldo_alterado(config, saldo)
         
-        # Para cada PZEM, calcula quanto consumiu desde a última vez
-        for pzem_id in [1, 2]:
-            pzem_key = f'pzem{pzem_id}'
-            
-            # Verifica se o PZEM está conectado e tem dados válidos
-            if (dados_pzem[pzem_key]['conectado'] and 
-                dados_pzem[pzem_key].get('energy', 0) > 0):
-                
-                consumo_atual = dados_pzem[pzem_key]['energy']
-                consumo_anterior = ultimo_consumo_conhecido[pzem_key]
-                
-                # Calcula quanto foi consumido desde a última vez
-                if consumo_atual >= consumo_anterior:
-                    diferenca_consumo = consumo_atual - consumo_anterior
-                    consumo_desta_vez += diferenca_consumo
-                    
-                    # DEBUG: Mostrar apenas se houve consumo significativo
-                    if diferenca_consumo > 0.001:  # Mais de 1 Wh
-                        print(f"📊 PZEM{pzem_id}: +{diferenca_consumo:.3f} kWh")
-                
-                # Atualiza o último consumo conhecido
-                ultimo_consumo_conhecido[pzem_key] = consumo_atual
+        # Commit rápido (também grava a linha de base do primeiro contador):
+        # linhas do contador e da configuração ficam bloqueadas só até aqui
+        db.session.commit()
         
-        # Subtrai o consumo desde a última vez do saldo atual
-        if consumo_desta_vez > 0.001:  # Só atualiza se consumo > 1 Wh
-            config.saldo_kwh -= consumo_desta_vez
-            config.saldo_kwh = max(0, config.saldo_kwh)
-            
-            # Commit rápido apenas se houver mudança significativa
-            db.session.commit()
+        if consumo_desta_vez > 0:
+            limiar = " (limiar cruzado)" if resultado["cruzou_limiar"] else ""
+            print(f"📉 Consumo: {consumo_desta_vez:.3f} kWh | Saldo: {saldo_anterior:.2f} → {saldo:.2f} kWh{limiar}")
             
-            print(f"📉 Consumo: {consumo_desta_vez:.3f} kWh | Saldo: {saldo_anterior:.2f} → {config.saldo_kwh:.2f} kWh")
-        else:
-            # Rollback para liberar a transação se não houve consumo significativo
-            db.session.rollback()
+            # ✅✅✅ CORREÇÃO CRÍTICA: Chamar controle de relés após atualizar saldo
+            verificar_e_controlar_reles(saldo)
+        elif motor_reles.tem_pendentes():
+            verificar_e_controlar_reles(saldo_anterior if saldo is None else saldo)
             
     except Exception as e:
         print(f"❌ Erro ao atualizar saldo: {e}")
@@ -2730,55 +2724,6 @@ def validar_payload(data):
 
     return True, None
 
-def preparar_energy_entries(data):
-    energy_data_entries = []
-    for i in [1, 2]:
-        pzem_key = f'pzem{i}'
-        if pzem_key in data:
-            print(f"📦 Atualizando {pzem_key}: {data[pzem_key]}")
-            
-            # Atualiza dados em memória
-            for k, v in data[pzem_key].items():
-                if k in dados_pzem[pzem_key]:
-                    dados_pzem[pzem_key][k] = v
-
-            dados_pzem[pzem_key]['conectado'] = True
-            dados_pzem[pzem_key]['ultima_atualizacao'] = datetime.now(timezone.utc)
-
-            # SEMPRE cria entrada no banco se o PZEM estiver conectado
-            if dados_pzem[pzem_key]['conectado']:
-                try:
-                    energy_data = EnergyData(
-                        pzem_id=i,
-                        voltage=float(data[pzem_key].get('voltage', 0)),
-                        current=float(data[pzem_key].get('current', 0)),
-                        power=float(data[pzem_key].get('power', 0)),
-                        energy=float(data[pzem_key].get('energy', 0)),
-                        frequency=float(data[pzem_key].get('frequency', 0)),
-                        pf=float(data[pzem_key].get('pf', 0)),
-                        timestamp=datetime.now(timezone.utc)
-                    )
-                    energy_data_entries.append(energy_data)
-                    print(f"✅ Dados do {pzem_key} preparados para salvar no banco")
-                except Exception as e:
-                    print(f"❌ Erro ao criar EnergyData para {pzem_key}: {e}")
-    
-    return energy_data_entries
-
-def salvar_energy_entries(entries):
-    if not entries:
-        return True
-    try:
-        for e in entries:
-            db.session.add(e)
-        db.session.commit()
-        print(f"✅ {len(entries)} registros salvos no banco de dados")
-        return True
-    except Exception as e:
-        print(f"❌ Erro ao salvar EnergyData no banco: {e}")
-        db.session.rollback()
-        return False
-
 def atualizar_reles_payload(data):
     """Atualiza estados vindos do ESP — SEM sobrescrever ações manuais"""
     if "reles" not in data:
@@ -2788,11 +2733,21 @@ def atualizar_reles_payload(data):
 
     PROTECAO = 30  # segundos
 
+    # ✅ Confirmação implícita: relé já no estado pedido → comando cumprido
+    aguardando = set()
+    if fila_comandos.ha_abertos():
+        fila_comandos.confirmar_estados(data["reles"])
+        aguardando = fila_comandos.reles_aguardando()
+
     for r_data in data["reles"]:
         rele = Rele.query.get(r_data["id"])
         if not rele:
             continue
 
+        # ⏳ Comando ainda não executado pelo ESP → estado reportado é o antigo
+        if rele.id in aguardando:
+            continue
+
         estado_esp = r_data.get("estado", rele.estado)
 
         # 🛑 1. Se está em MODO MANUAL → ignorar ESP
@@ -2872,54 +2827,166 @@ def debug_sincronizacao_rele(rele_id):
 
 
 # ==========================================================
-# PROCESSADOR DE PAYLOAD - VERSÃO CORRIGIDA
+# FILA DE INGESTÃO - GRAVAÇÃO EM LOTE (WRITE-BEHIND)
 # ==========================================================
-def processar_payload(data):
-    try:
-        with dados_lock:
-            print("🔄 Processando payload dos PZEMs...")
+def montar_registro_energia(pzem_id, leitura, timestamp):
+    """Converte a leitura de um PZEM numa linha de EnergyData (dict, timestamp UTC sem tz)"""
+    return {
+        "pzem_id": pzem_id,
+        "voltage": float(leitura.get('voltage', 0)),
+        "current": float(leitura.get('current', 0)),
+        "power": float(leitura.get('power', 0)),
+        "energy": float(leitura.get('energy', 0)),
+        "frequency": float(leitura.get('frequency', 0)),
+        "pf": float(leitura.get('pf', 0)),
+        "timestamp": timestamp.replace(tzinfo=None)
+    }
 
-            # PASSO 1: Atualizar saldo baseado no consumo acumulado
-            atualizar_saldo_com_consumo()  # DESCOMENTE ESTA LINHA!
+def atualizar_pzem_em_memoria(pzem_key, leitura, agora, so_mais_recente=False):
+    """Substitui o snapshot do PZEM no estado ao vivo (atómico entre workers)
+    e publica-o no /api/eventos. Com so_mais_recente=True ignora leituras
+    mais antigas que a atual."""
+    alterado = []
+
+    def aplicar(atual):
+        ultima = atual.get('ultima_atualizacao')
+        if so_mais_recente and ultima is not None and agora < ultima:
+            return None
+        for k, v in leitura.items():
+            if k in atual:
+                atual[k] = v
+        atual['conectado'] = True
+        atual['ultima_atualizacao'] = agora
+        alterado.append(True)
+        return atual
+
+    snapshot = estado_vivo.modificar(pzem_key, aplicar)
+    if alterado:
+        hub_eventos.publicar("pzem", evento_pzem(pzem_key, snapshot))
+    return snapshot
+
+def atualizar_dados_em_memoria(data, agora):
+    """Atualiza dados_pzem com o payload e devolve as linhas de EnergyData a gravar"""
+    registros = []
+    for i in [1, 2]:
+        pzem_key = f'pzem{i}'
+        if pzem_key not in data:
+            continue
 
-            # PASSO 2: Preparar registros EnergyData
-            energy_entries = preparar_energy_entries(data)
+        atualizar_pzem_em_memoria(pzem_key, data[pzem_key], agora)
 
-            # PASSO 3: Salvar registros no banco
-            success = salvar_energy_entries(energy_entries)
-            
-            if not success:
-                print("❌ Falha ao salvar dados no banco")
-                return False
+        try:
+            registros.append(montar_registro_energia(i, data[pzem_key], agora))
+        except (TypeError, ValueError) as e:
+            print(f"❌ Erro ao preparar EnergyData para {pzem_key}: {e}")
+
+    return registros
+
+def gravar_energy_rows(registros, normalizador=None):
+    """Grava linhas de EnergyData pelo carregador em massa (COPY no Postgres) e
+    atualiza rollups e picos na mesma transação (um único commit)"""
+    if not registros:
+        return 0
+    normalizador = normalizador or normalizador_contador
+    if not isinstance(registros, list):
+        registros = list(registros)
+
+    # delta_kwh calculado sobre o estado lido; o contador só avança se a versão não mudou
+    # e volta atrás se o commit falhar (a nova tentativa do lote dá os mesmos deltas)
+    for tentativa in range(3):
+        lancamento = normalizador.calcular(registros)
+        try:
+            normalizador.reservar(lancamento)
+            break
+        except ConflitoContador:
+            if tentativa == 2:
+                raise
 
-            # PASSO 4: Atualizar estados dos relés (payload)
-            atualizar_reles_payload(data)
+    try:
+        conexao = db.session.connection()
+        total, metodo = gravar_registros(conexao, EnergyData.__table__, registros)
+        atualizar_rollups(conexao, registros, tabelas_rollup())
+        atualizar_picos(conexao, registros, tabelas_picos())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        normalizador.desfazer(lancamento)
+        raise
+    historico_recente.registar(registros)
+    try:
+        serie_viva.adicionar(registros, idade_maxima=app.config.get('SERIE_VIVA_JANELA'))
+    except Exception as e:
+        print(f"⚠️ Série ao vivo não atualizada: {e}")
+    versoes_dados.incrementar("energia")
+    return total
 
-            # PASSO 5: Verificar e controlar relés em modo automático
-            verificar_e_controlar_reles()
+def processar_lote_ingestao(registros, contextos):
+    """Escritor da fila: grava o lote e atualiza saldo, relés e notificações uma vez por lote"""
+    with app.app_context(), hub_eventos.lote():
+        try:
+            if gravar_energy_rows(registros):
+                print(f"💾 {len(registros)} registros salvos em lote")
+        except Exception:
+            db.session.rollback()
+            raise
 
-            # PASSO 6: Persistir mudanças dos relés
-            try:
-                db.session.commit()
-                print("✅ Estados dos relés atualizados no banco")
-            except Exception as e:
-                print(f"❌ Erro ao salvar estados dos relés: {e}")
-                db.session.rollback()
-                return False
+        try:
+            # Apenas o estado mais recente dos relés enviado pelo ESP interessa
+            reles = next((c["reles"] for c in reversed(contextos) if c and c.get("reles")), None)
+            if reles:
+                atualizar_reles_payload({"reles": reles})
+
+            atualizar_saldo_com_consumo()
+            despachante_notificacoes.iniciar()
+            servico_notificacoes.verificar_todas_notificacoes()
+        except Exception as e:
+            print(f"❌ Erro no pós-processamento do lote: {e}")
+            db.session.rollback()
+
+fila_ingestao = FilaIngestao(
+    processar_lote_ingestao,
+    lote_maximo=app.config.get('INGESTAO_LOTE_MAXIMO', 200),
+    intervalo_flush=app.config.get('INGESTAO_INTERVALO_FLUSH', 2.0),
+    tamanho_maximo=app.config.get('INGESTAO_FILA_MAXIMA', 10000),
+    espera_maxima=app.config.get('INGESTAO_ESPERA_MAXIMA', 30.0),
+    erros_permanentes=(IntegrityError, DataError)
+)
 
-            print("✅ Payload processado com sucesso")
-            return True
+def anexar_comandos(resposta, ack_seq=None, ack=None):
+    """Piggyback: confirma os comandos que o ESP diz ter executado (`ack` = lista de seq;
+    `ack_seq` do firmware antigo só confirma essa seq) e junta à resposta todos os
+    comandos pendentes (já coalescidos pela fila) com a nova sequência"""
+    try:
+        ack_seq = int(ack_seq or 0)
+        ack = [int(i) for i in ack or []]
+    except (TypeError, ValueError):
+        ack_seq, ack = 0, []
 
+    try:
+        if ack_seq:
+            ack.append(ack_seq)
+        if ack and fila_comandos.ha_abertos():
+            fila_comandos.confirmar_ids(ack)
+            db.session.commit()
+        entregues = fila_comandos.entregar(limite=None)
     except Exception as e:
-        print(f"❌ Erro inesperado durante o processamento: {e}")
         db.session.rollback()
-        return False
+        print(f"❌ Erro ao anexar comandos à resposta: {e}")
+        entregues = []
+
+    for e in entregues:
+        print(f"➡️ ENTREGANDO COMANDO AO ESP: {e['comando']}")
+
+    resposta["comandos"] = [{"seq": e["id"], "comando": e["comando"]} for e in entregues]
+    resposta["seq"] = max([e["id"] for e in entregues], default=ack_seq)
+    return resposta
+
 # ==========================================================
 # ROTA REFACTORADA
 # ==========================================================
 @app.route('/api/dados', methods=['POST'])
 def receber_dados():
-    """Rota OTIMIZADA para Railway - Recebe dados do ESP8266"""
+    """Recebe dados do ESP8266 e responde logo; a gravação fica com a fila de ingestão"""
     start_time = datetime.now()
     
     try:
@@ -2932,97 +2999,135 @@ def receber_dados():
     if not data or 'api_key' not in data or data['api_key'] not in API_KEYS:
         return jsonify({"error": "Unauthorized"}), 401
 
-    print(f"📡 Dados recebidos do ESP8266 no Railway")
-
     try:
-        # ✅✅✅ PROCESSAMENTO OTIMIZADO PARA RAILWAY
-        
         # PASSO 1: Atualizar dados em memória (MUITO RÁPIDO)
-        for i in [1, 2]:
-            pzem_key = f'pzem{i}'
-            if pzem_key in data:
-                # Atualização direta sem prints para ser mais rápido
-                for k, v in data[pzem_key].items():
-                    if k in dados_pzem[pzem_key]:
-                        dados_pzem[pzem_key][k] = v
-                dados_pzem[pzem_key]['conectado'] = True
-                dados_pzem[pzem_key]['ultima_atualizacao'] = datetime.now(timezone.utc)
-
-        # PASSO 2: ✅ ATUALIZAR SALDO (CRÍTICO)
-        atualizar_saldo_com_consumo()
-
-        # PASSO 3: Salvar dados históricos de forma ASSÍNCRONA
-        energy_entries = []
-        for i in [1, 2]:
-            pzem_key = f'pzem{i}'
-            if pzem_key in data and dados_pzem[pzem_key]['conectado']:
-                try:
-                    energy_data = EnergyData(
-                        pzem_id=i,
-                        voltage=float(data[pzem_key].get('voltage', 0)),
-                        current=float(data[pzem_key].get('current', 0)),
-                        power=float(data[pzem_key].get('power', 0)),
-                        energy=float(data[pzem_key].get('energy', 0)),
-                        frequency=float(data[pzem_key].get('frequency', 0)),
-                        pf=float(data[pzem_key].get('pf', 0)),
-                        timestamp=datetime.now(timezone.utc)
-                    )
-                    energy_entries.append(energy_data)
-                except Exception as e:
-                    print(f"❌ Erro ao criar EnergyData para {pzem_key}: {e}")
-
-        # ✅ SALVAMENTO EM LOTE (mais eficiente)
-        if energy_entries:
-            try:
-                db.session.bulk_save_objects(energy_entries)
-                db.session.commit()
-                print(f"💾 {len(energy_entries)} registros salvos no Railway")
-            except Exception as e:
-                print(f"❌ Erro ao salvar no Railway: {e}")
-                db.session.rollback()
-
-        # PASSO 4: Atualizar estados dos relés (SE HOUVER DADOS)
-        if 'reles' in data:
-            for r in data['reles']:
-                rele = Rele.query.get(r['id'])
-                if rele and rele.estado != r.get('estado', rele.estado):
-                    rele.estado = r.get('estado', rele.estado)
-                    # ✅ Log apenas se mudou
-                    print(f"🔌 Relé '{rele.nome}': {'LIGADO' if rele.estado else 'DESLIGADO'}")
-
-            # ✅ Commit único para todos os relés
-            try:
-                db.session.commit()
-            except Exception as e:
-                print(f"❌ Erro ao salvar estados dos relés: {e}")
-                db.session.rollback()
+        registros = atualizar_dados_em_memoria(data, datetime.now(timezone.utc))
 
-        # PASSO 5: ✅ VERIFICAÇÃO DE NOTIFICAÇÕES (fora do tempo crítico)
-        # Mover para fora do tempo de resposta do ESP
-        servico_notificacoes.verificar_todas_notificacoes()
+        # PASSO 2: Enfileirar EnergyData, estados dos relés, saldo e notificações
+        # (gravados pela thread da fila em commits agrupados)
+        fila_ingestao.enfileirar(registros, {"reles": data.get('reles')})
 
         # ✅ RESPOSTA IMEDIATA para o ESP (CRÍTICO)
         response_time = (datetime.now() - start_time).total_seconds()
         
-        return jsonify({
+        return jsonify(anexar_comandos({
             "status": "success", 
             "message": "Dados recebidos no Railway",
-            "records_saved": len(energy_entries),
+            "records_queued": len(registros),
             "processing_time": f"{response_time:.2f}s",
             "environment": "railway"
-        }), 200
+        }, data.get('ack_seq'), data.get('ack'))), 200
 
     except Exception as e:
         print(f"❌ Erro no processamento Railway: {e}")
-        db.session.rollback()
         return jsonify({"error": "Internal server error"}), 500
 
+# ==========================================================
+# 🔹 /api/dados/lote → Várias amostras por pedido (buffer do ESP)
+# ==========================================================
+def resolver_timestamp_amostra(amostra, agora, agora_ms):
+    """Timestamp UTC da amostra: 'timestamp' ISO, 'ts' epoch ou 'ms' relativo a 'agora_ms'"""
+    if amostra.get('timestamp'):
+        ts = datetime.fromisoformat(str(amostra['timestamp']).replace('Z', '+00:00'))
+        return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+    if amostra.get('ts') is not None:
+        return datetime.fromtimestamp(float(amostra['ts']), tz=timezone.utc)
+
+    if amostra.get('ms') is not None and agora_ms is not None:
+        idade_ms = float(agora_ms) - float(amostra['ms'])
+        if idade_ms >= 0:
+            return agora - timedelta(milliseconds=idade_ms)
+
+    return agora
+
+@app.route('/api/dados/lote', methods=['POST'])
+def receber_dados_lote():
+    """Recebe um array de amostras pzem1/pzem2 com timestamp e grava tudo numa única carga em massa"""
+    start_time = datetime.now()
+
+    data = request.get_json(force=True, silent=True)
+    if not data or 'api_key' not in data or data['api_key'] not in API_KEYS:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    amostras = data.get('amostras')
+    if not isinstance(amostras, list) or not amostras:
+        return jsonify({"error": "Campo 'amostras' deve ser uma lista não vazia"}), 400
+
+    max_amostras = app.config.get('LOTE_MAX_AMOSTRAS', 5000)
+    if len(amostras) > max_amostras:
+        return jsonify({"error": f"Máximo de {max_amostras} amostras por pedido"}), 413
+
+    agora = datetime.now(timezone.utc)
+    limite_futuro = agora + timedelta(minutes=5)
+    agora_ms = data.get('agora_ms')
+
+    registros = []
+    mais_recente = {}
+    rejeitadas = 0
+
+    for amostra in amostras:
+        try:
+            ts = resolver_timestamp_amostra(amostra, agora, agora_ms)
+            if ts > limite_futuro:
+                rejeitadas += 1
+                continue
+
+            for i in [1, 2]:
+                pzem_key = f'pzem{i}'
+                if not isinstance(amostra.get(pzem_key), dict):
+                    continue
+                registros.append(montar_registro_energia(i, amostra[pzem_key], ts))
+
+                if pzem_key not in mais_recente or ts >= mais_recente[pzem_key][0]:
+                    mais_recente[pzem_key] = (ts, amostra[pzem_key])
+        except (TypeError, ValueError, OverflowError) as e:
+            rejeitadas += 1
+            print(f"⚠️ Amostra inválida ignorada: {e}")
+
+    try:
+        gravar_energy_rows(registros)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro ao gravar lote de amostras: {e}")
+        return jsonify({"error": "Erro ao gravar amostras"}), 500
+
+    # Estado ao vivo só avança com a amostra mais recente de cada PZEM
+    with hub_eventos.lote():
+        for pzem_key, (ts, leitura) in mais_recente.items():
+            atualizar_pzem_em_memoria(pzem_key, leitura, ts, so_mais_recente=True)
+
+    # Saldo, relés e notificações seguem pela fila de ingestão
+    fila_ingestao.enfileirar([], {"reles": data.get('reles')})
+
+    response_time = (datetime.now() - start_time).total_seconds()
+    print(f"📦 Lote recebido: {len(registros)} registros gravados, {rejeitadas} amostras rejeitadas")
+
+    return jsonify(anexar_comandos({
+        "status": "success",
+        "records_saved": len(registros),
+        "amostras_rejeitadas": rejeitadas,
+        "processing_time": f"{response_time:.2f}s"
+    }, data.get('ack_seq'), data.get('ack'))), 200
+
+@app.route('/api/ingestao/status', methods=['GET'])
+@login_required
+def status_ingestao():
+    """Estado da fila de ingestão, do acumulador de consumo e do motor de relés (debug)"""
+    return jsonify({"success": True, "fila": fila_ingestao.status(), "saldo": acumulador_saldo.status(),
+                    "contador": normalizador_contador.status(), "reles": motor_reles.status(),
+                    "estado_vivo": estado_vivo.status()})
+
 # ==========================================================
 @app.route('/api/debug-dados')
 def debug_dados():
     """Rota para debug - mostra últimos registros no banco"""
     try:
-        latest_records = EnergyData.query.order_by(EnergyData.timestamp.desc()).limit(10).all()
+        # Só as últimas 24h: o filtro por intervalo usa o índice em vez de varrer a tabela
+        desde = datetime.utcnow() - timedelta(hours=24)
+        recentes = EnergyData.query.filter(EnergyData.timestamp >= desde)
+
+        latest_records = recentes.order_by(EnergyData.timestamp.desc()).limit(10).all()
         result = []
         for record in latest_records:
             result.append({
@@ -3034,43 +3139,60 @@ def debug_dados():
             })
         
         return jsonify({
-            'total_records': EnergyData.query.count(),
+            'total_records': recentes.count(),
+            'desde': desde.isoformat(),
             'latest': result
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-# Função separada para processamento pesado (pode ser chamada em background)
-def processar_dados_em_background(data):
-    """Processa dados pesados como salvar no banco"""
-    try:
-        with app.app_context():
-            # Atualizar saldo
-            atualizar_saldo_com_consumo()
-            
-            # Salvar no banco
-            energy_entries = preparar_energy_entries(data)
-            salvar_energy_entries(energy_entries)
-            
-            # Controlar relés
-            verificar_e_controlar_reles()
-            db.session.commit()
-            
-            print("✅ Processamento em background concluído")
-    except Exception as e:
-        print(f"❌ Erro em background: {e}")
 #======================================
     # ENVIO DE COMANDOS
 #======================================
 @app.route('/api/comandos', methods=['GET'])
 def obter_comandos():
+    """Sem `espera`: 1 comando por pedido (firmware antigo).
+    Com ?espera=N: long-poll até N segundos, devolve todos os comandos em `comandos`."""
     api_key = request.args.get('api_key')
     if not api_key or api_key not in API_KEYS:
         return jsonify({"error": "Unauthorized"}), 401
 
-    with dados_lock:
-        if comandos_pendentes:
-            return jsonify({"comando": comandos_pendentes.pop(0)})
-    return jsonify({"comando": ""})
+    try:
+        # ?ack=12,13 → confirmação explícita de comandos já executados
+        # ?ack_seq=13 → firmware antigo: confirma só a sequência 13
+        ack = [int(i) for i in request.args.get('ack', '').split(',') if i.strip()]
+        ack_seq = int(request.args.get('ack_seq', 0))
+        espera = float(request.args.get('espera', 0))
+    except ValueError:
+        return jsonify({"error": "ack/espera inválidos"}), 400
+
+    espera = max(0.0, min(espera, app.config.get('COMANDOS_ESPERA_MAXIMA', 25)))
+
+    try:
+        if ack_seq:
+            ack.append(ack_seq)
+        if ack:
+            fila_comandos.confirmar_ids(ack)
+            db.session.commit()
+
+        if espera:
+            entregues = fila_comandos.aguardar(espera)
+        else:
+            entregues = fila_comandos.entregar(limite=1)
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Erro ao entregar comando: {e}")
+        entregues = []
+
+    for e in entregues:
+        print(f"➡️ ENTREGANDO COMANDO AO ESP: {e['comando']}")
+
+    resposta = {"comando": entregues[0]["comando"] if entregues else ""}
+    if entregues and not espera:
+        resposta["id"] = entregues[0]["id"]
+    if espera:
+        resposta["comandos"] = [{"seq": e["id"], "comando": e["comando"]} for e in entregues]
+        resposta["seq"] = max([e["id"] for e in entregues], default=ack_seq)
+    return jsonify(resposta)
 
 # -----------------------------
 # Rotas de dashboard e status
@@ -3100,43 +3222,236 @@ def dashboard():
                                pzem_status=pzem_status,
                                last_update=last_update)
 
-@app.route('/api/dashboard-data')
-@login_required
-def dashboard_data():
-    with dados_lock:
-        reles_db = Rele.query.all()
-        
-        # Obter dados do banco/histórico
-        pico_hoje = obter_pico_do_dia()
-        pico_semanal = obter_pico_semanal()
-        pico_mensal = obter_pico_mensal()
-        picos_semana_atual = obter_picos_semana_atual()
-        energia_atual = obter_energia_atual()
-        
-        # Dados históricos (exemplo - você pode implementar a lógica real)
-        historical = {
-            "labels": [f"{i}:00" for i in range(24)],
-            "values": [dados_pzem['pzem1']['power'] + dados_pzem['pzem2']['power'] for i in range(24)]
+def _semear_anel(anel, modelo):
+    """Primeiro uso do anel (ex.: estado partilhado novo): carrega só a janela a partir do rollup"""
+    inicio = datetime.utcnow() - anel.passo * anel.posicoes
+    anel.semear(modelo.query.filter(modelo.inicio > inicio).with_entities(
+        modelo.pzem_id, modelo.inicio, modelo.power_soma, modelo.amostras
+    ).all())
+
+def _serie_historico(anel, modelo, rotulo):
+    if not anel.semeado():
+        _semear_anel(anel, modelo)
+
+    serie = anel.serie()
+    por_pzem = sorted({pzem_id for _, medias in serie for pzem_id in medias})
+    return {
+        "labels": [rotulo(inicio) for inicio, _ in serie],
+        # Soma das potências médias dos PZEMs em cada intervalo
+        "values": [round(sum(medias.values(), 0.0), 1) for _, medias in serie],
+        "pzems": {
+            f"pzem{pzem_id}": [round(medias.get(pzem_id, 0.0), 1) for _, medias in serie]
+            for pzem_id in por_pzem
         }
-        
-        reles_chart = {
+    }
+
+def obter_historico_24h():
+    """Potência média (W, soma dos PZEMs) de cada uma das últimas 24 horas, do anel horário"""
+    return _serie_historico(historico_recente.horas, EnergiaHora, lambda h: f"{h.hour}:00")
+
+def obter_historico_minutos():
+    """Potência média (W) de cada um dos últimos 60 minutos, do anel de minutos"""
+    return _serie_historico(historico_recente.minutos, EnergiaMinuto, lambda m: m.strftime("%H:%M"))
+
+# ==========================================================
+# 🔹 SNAPSHOT DO DASHBOARD (cache versionado + ETag)
+# ==========================================================
+# Reúne dashboard-data, status-completo, status-pzem, get_ldr e
+# sistema/info numa resposta. A parte do banco só é reconstruída
+# quando muda a versão (reles/config/energia) ou o dia; leituras e
+# históricos recentes vêm do estado partilhado. Pedido com If-None-Match igual → 304.
+
+def _snapshot_reles_config():
+    reles_db = Rele.query.order_by(Rele.id).all()
+    config = Configuracao.query.first()
+    energia_atual = obter_energia_atual()
+    saldo_global = config.saldo_kwh if config else 0
+
+    return {
+        "reles": [r.to_dict() for r in reles_db],
+        "reles_chart": {
             "labels": [r.nome for r in reles_db],
             "values": [r.estado for r in reles_db]
+        },
+        "reles_status": [
+            formatar_status_rele(r, saldo_global)
+            for r in sorted(reles_db, key=lambda r: (r.prioridade or 0, r.id))
+        ],
+        "energia_atual": energia_atual
+    }
+
+def _snapshot_energia():
+    return {
+        "peaks": obter_picos_semana_atual(),  # ✅ picos de cada dia da semana
+        "peak_today": obter_pico_do_dia(),
+        "peak_weekly": obter_pico_semanal(),
+        "peak_monthly": obter_pico_mensal()
+    }
+
+def _snapshot_ao_vivo(energia_atual):
+    """Parte sem banco: leituras e históricos recentes do estado partilhado
+    (mesmos campos de status-pzem/get_ldr/sistema/info)"""
+    pzem1, pzem2 = dados_pzem['pzem1'], dados_pzem['pzem2']
+    consumo_total = pzem1['power'] + pzem2['power']
+    saldo = energia_atual['saldo_kwh'] or 0
+
+    return {
+        "pzem1": pzem1,
+        "pzem2": pzem2,
+        "status_pzem": {
+            "pzem1": evento_pzem("pzem1", pzem1)["online"],
+            "pzem2": evento_pzem("pzem2", pzem2)["online"]
+        },
+        "ldr": estado_vivo.ler("ldr"),
+        "historical": obter_historico_24h(),
+        "historical_minutes": obter_historico_minutos(),
+        "sistema": {
+            "saldo_kwh": round(saldo, 2),
+            "consumo_atual": round(consumo_total, 1),
+            "previsao": f"{saldo / (consumo_total / 1000):.1f}h" if consumo_total > 0 else "Indeterminado",
+            "preco_kwh": energia_atual['preco_kwh'],
+            "valor_restante_mzn": round(energia_atual['valor_mzn'] or 0, 2)
         }
-        
-        return jsonify({
-            "pzem1": dados_pzem['pzem1'],
-            "pzem2": dados_pzem['pzem2'],
-            "reles": [r.to_dict() for r in reles_db],
-            "historical": historical,
-            "peaks": picos_semana_atual,  # ✅ Agora vem do banco - picos de cada dia da semana
-            "reles_chart": reles_chart,
-            "peak_today": pico_hoje,  # ✅ Pico do dia do banco
-            "peak_weekly": pico_semanal,  # ✅ Novo: Pico semanal
-            "peak_monthly": pico_mensal,  # ✅ Novo: Pico mensal
-            "energia_atual": energia_atual,  # ✅ Energia atual (saldo)
-            "savings": 15  # Mantido para compatibilidade
-        })
+    }
+
+def montar_snapshot(ao_vivo):
+    """Snapshot completo; só toca no banco quando a respetiva versão mudou"""
+    versoes = versoes_dados.atuais()
+    agora = datetime.utcnow()
+
+    dados = {"savings": 15}  # Mantido para compatibilidade
+    dados.update(cache_dashboard.obter(
+        "reles_config",
+        (versoes.get("reles"), versoes.get("config")),
+        _snapshot_reles_config
+    ))
+    dados.update(cache_dashboard.obter(
+        "energia",
+        # Os picos mudam de período ao dia
+        (versoes.get("energia"), agora.date()),
+        _snapshot_energia
+    ))
+    dados.update(ao_vivo)
+    return dados
+
+@app.route('/api/dashboard-data')
+@app.route('/api/dashboard/snapshot')
+@login_required
+def dashboard_data():
+    versoes = versoes_dados.atuais()
+    agora = datetime.utcnow()
+    energia_atual = cache_dashboard.obter(
+        "reles_config",
+        (versoes.get("reles"), versoes.get("config")),
+        _snapshot_reles_config
+    )["energia_atual"]
+    ao_vivo = _snapshot_ao_vivo(energia_atual)
+
+    etag = etag_de(
+        sorted(versoes.items()), agora.date(),
+        sorted((k, repr(v)) for k, v in ao_vivo.items())
+    )
+    if request.if_none_match.contains(etag):
+        resposta = Response(status=304)
+    else:
+        resposta = jsonify(montar_snapshot(ao_vivo))
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+# ==========================================================
+# 🔹 /api/live/series → últimas amostras por PZEM (anel em memória)
+# ==========================================================
+@app.route('/api/live/series', methods=['GET'])
+@login_required
+def serie_ao_vivo():
+    """?pzem=1|2 (padrão: todos), ?segundos=600 (janela), ?pontos=N (reduz por média em blocos)"""
+    janela = app.config.get('SERIE_VIVA_JANELA', 6 * 3600)
+    segundos = min(max(request.args.get('segundos', 600, type=int) or 600, 1), janela)
+    pontos = request.args.get('pontos', type=int)
+    if pontos is not None:
+        pontos = min(max(pontos, 2), serie_viva.capacidade)
+
+    pzem = request.args.get('pzem', type=int)
+    if pzem is not None and pzem not in serie_viva.pzems:
+        return jsonify({"success": False, "message": f"PZEM {pzem} inválido"}), 400
+
+    desde = time.time() - segundos
+    series = {}
+    for pzem_id in ([pzem] if pzem else serie_viva.pzems):
+        colunas = reduzir(serie_viva.ler(pzem_id, desde=desde), pontos)
+        series[f"pzem{pzem_id}"] = {
+            campo: [round(valor, 3) for valor in colunas[campo]] for campo in CAMPOS_SERIE
+        }
+
+    return jsonify({
+        "success": True,
+        "segundos": segundos,
+        "pontos": pontos,
+        "series": series
+    })
+
+# ==========================================================
+# 🔹 /api/energia/serie → intervalo arbitrário reduzido por LTTB
+# ==========================================================
+def ler_serie_energia(grao, pzem_id, campo, inicio, fim):
+    """(epoch s, valor) de um PZEM no intervalo, do grão pedido (médias nos rollups)"""
+    if grao == "bruto":
+        coluna_ts, valor = EnergyData.timestamp, getattr(EnergyData, campo)
+        consulta = db.session.query(coluna_ts, valor).filter(EnergyData.pzem_id == pzem_id)
+    else:
+        modelo = {"minuto": EnergiaMinuto, "hora": EnergiaHora, "dia": EnergiaDia}[grao]
+        coluna_ts = modelo.inicio
+        valor = getattr(modelo, f"{campo}_soma") / modelo.amostras
+        consulta = db.session.query(coluna_ts, valor).filter(modelo.pzem_id == pzem_id, modelo.amostras > 0)
+
+    linhas = consulta.filter(coluna_ts >= inicio, coluna_ts < fim).order_by(coluna_ts).yield_per(5000)
+    tempos, valores = [], []
+    for ts, v in linhas:
+        tempos.append(ts.replace(tzinfo=timezone.utc).timestamp())
+        valores.append(v or 0.0)
+    return tempos, valores
+
+@app.route('/api/energia/serie', methods=['GET'])
+@login_required
+def serie_energia():
+    """?inicio=ISO&fim=ISO (UTC) &pontos=1000 &pzem=1|2 &campo=power|voltage"""
+    try:
+        fim = datetime.fromisoformat(request.args['fim']) if request.args.get('fim') else datetime.utcnow()
+        inicio = datetime.fromisoformat(request.args['inicio']) if request.args.get('inicio') else fim - timedelta(days=1)
+    except ValueError:
+        return jsonify({"success": False, "message": "inicio/fim devem estar em ISO 8601"}), 400
+    inicio = inicio.astimezone(timezone.utc).replace(tzinfo=None) if inicio.tzinfo else inicio
+    fim = fim.astimezone(timezone.utc).replace(tzinfo=None) if fim.tzinfo else fim
+    if inicio >= fim:
+        return jsonify({"success": False, "message": "inicio deve ser anterior a fim"}), 400
+
+    campo = request.args.get('campo', 'power')
+    if campo not in ('power', 'voltage'):
+        return jsonify({"success": False, "message": "campo deve ser power ou voltage"}), 400
+
+    pzem = request.args.get('pzem', type=int)
+    pzems = [pzem] if pzem else [1, 2]
+    pontos = min(max(request.args.get('pontos', 1000, type=int), 3), app.config.get('SERIE_PONTOS_MAXIMO', 5000))
+    grao = escolher_grao((fim - inicio).total_seconds(), app.config.get('SERIE_LIMITE_LINHAS', 20000))
+
+    def series():
+        for pzem_id in pzems:
+            tempos, valores = ler_serie_energia(grao, pzem_id, campo, inicio, fim)
+            yield (f"pzem{pzem_id}", *reduzir_lttb(tempos, valores, pontos))
+
+    cabecalho = {
+        "success": True,
+        "grao": grao,
+        "campo": campo,
+        "inicio": inicio.isoformat(),
+        "fim": fim.isoformat(),
+        "pontos": pontos
+    }
+    return Response(
+        stream_with_context(gerar_json(cabecalho, series())),
+        mimetype='application/json'
+    )
 
 @app.route('/api/status-pzem')
 @login_required
@@ -3144,10 +3459,38 @@ def status_pzem():
     with dados_lock:
         agora = datetime.now(timezone.utc)
         return jsonify({
-            "pzem1": dados_pzem['pzem1']['ultima_atualizacao'] and (agora - dados_pzem['pzem1']['ultima_atualizacao']).total_seconds() < 60,
-            "pzem2": dados_pzem['pzem2']['ultima_atualizacao'] and (agora - dados_pzem['pzem2']['ultima_atualizacao']).total_seconds() < 60
+            "pzem1": pzem_online(dados_pzem['pzem1']['ultima_atualizacao'], agora),
+            "pzem2": pzem_online(dados_pzem['pzem2']['ultima_atualizacao'], agora)
         })
 
+@app.route('/api/eventos')
+@login_required
+def eventos_ao_vivo():
+    """SSE: pzem, ldr, rele, saldo e alerta à medida que acontecem.
+    O estado atual vai no início do stream; depois nenhum tick consulta o banco."""
+    iniciais = [("pzem", evento_pzem(k, dados_pzem[k])) for k in ("pzem1", "pzem2")]
+    iniciais.append(("ldr", estado_vivo.ler("ldr")))
+
+    config = Configuracao.query.first()
+    if config:
+        iniciais.append(("saldo", evento_saldo(config)))
+    iniciais.extend(("rele", evento_rele(rele)) for rele in Rele.query.all())
+
+    # O stream pode durar minutos: devolve já a conexão ao pool
+    db.session.close()
+
+    resposta = Response(
+        stream_with_context(hub_eventos.transmitir(
+            iniciais,
+            duracao=app.config.get('EVENTOS_DURACAO_STREAM', 300),
+            batimento=app.config.get('EVENTOS_BATIMENTO', 15)
+        )),
+        mimetype='text/event-stream'
+    )
+    resposta.headers['Cache-Control'] = 'no-cache'
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
+
                         # -----------------------------
                         # CRUD Relés
                         # -----------------------------
@@ -3164,23 +3507,13 @@ def enviar_comando():
     if not comando:
         return jsonify({"success": False, "error": "Comando inválido"}), 400
 
-    with dados_lock:
-        comandos_pendentes.append(comando)
+    try:
+        fila_comandos.enfileirar(comando, origem='dashboard')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": str(e)}), 500
     return jsonify({"success": True, "message": "Comando enviado com sucesso"})
-@app.route('/api/comandos', methods=['GET'])
-def obter_comando_esp():
-    api_key = request.args.get("api_key")
-
-    if api_key not in API_KEYS:
-        return jsonify({"comando": ""})
-
-    with dados_lock:
-        if comandos_pendentes:
-            comando = comandos_pendentes.pop(0)
-            print(f"➡️ ENTREGANDO COMANDO AO ESP: {comando}")
-            return jsonify({"comando": comando})
-
-    return jsonify({"comando": ""})
 
 @app.route('/api/debug/comandos', methods=['GET'])
 def debug_comandos():
@@ -3192,12 +3525,13 @@ def debug_comandos():
     else:
         auth = "anónimo"
 
-    with dados_lock:
-        return jsonify({
-            "auth": auth,
-            "quantidade": len(comandos_pendentes),
-            "comandos": list(comandos_pendentes)
-        })
+    abertos = fila_comandos.abertos()
+    return jsonify({
+        "auth": auth,
+        "quantidade": len(abertos),
+        "comandos": [c.comando for c in abertos],
+        "detalhes": [c.to_dict() for c in abertos]
+    })
 
 # ==========================================================
 # 🔹 /api/reles (GET) → Listar relés (para ESP e web)
@@ -3304,7 +3638,15 @@ def deletar_rele(rele_id):
 # ==========================================================
 # 🔹 /api/reles/<id>/config  → Configurar limites de um relé - CORRIGIDA
 # ==========================================================
-@app.route('/api/reles/<int:rele_id>/config', methods=['POST'])
+def padroes_anti_oscilacao():
+    """Valores usados quando histerese/tempos do relé estão vazios"""
+    return {
+        "histerese_kwh": motor_reles.histerese_kwh,
+        "tempo_minimo_ligado": motor_reles.tempo_minimo_ligado,
+        "tempo_minimo_desligado": motor_reles.tempo_minimo_desligado
+    }
+
+@app.route('/api/reles/<int:rele_id>/config', methods=['GET', 'POST'])
 @login_required
 def configurar_rele(rele_id):
     """Configurar todos os parâmetros de um relé via web"""
@@ -3312,6 +3654,9 @@ def configurar_rele(rele_id):
     if not rele:
         return jsonify({"success": False, "error": "Relé não encontrado"}), 404
 
+    if request.method == 'GET':
+        return jsonify({"success": True, "rele": rele.to_dict(), "padroes": padroes_anti_oscilacao()})
+
     data = request.get_json()
     
     if not data:
@@ -3351,6 +3696,25 @@ def configurar_rele(rele_id):
         except ValueError:
             return jsonify({"success": False, "error": "Limite individual deve ser um número"}), 400
 
+    # Anti-oscilação: histerese (kWh) e permanência mínima (s); null = padrão do sistema
+    for campo, tipo, nome in (
+        ('histerese_kwh', float, "Histerese"),
+        ('tempo_minimo_ligado', int, "Tempo mínimo ligado"),
+        ('tempo_minimo_desligado', int, "Tempo mínimo desligado")
+    ):
+        if campo not in data:
+            continue
+        if data[campo] is None or data[campo] == "":
+            setattr(rele, campo, None)
+            continue
+        try:
+            valor = tipo(data[campo])
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "error": f"{nome} deve ser um número"}), 400
+        if valor < 0:
+            return jsonify({"success": False, "error": f"{nome} não pode ser negativo"}), 400
+        setattr(rele, campo, valor)
+
     # ✅ CORREÇÃO: Atualizar modo usando o campo correto
     if 'modo_automatico' in data:
         rele.modo_automatico = bool(data['modo_automatico'])
@@ -3372,6 +3736,7 @@ def configurar_rele(rele_id):
             "success": True, 
             "message": f"Configurações do relé '{rele.nome}' salvas com sucesso!",
             "rele": rele.to_dict(),
+            "padroes": padroes_anti_oscilacao(),
             "descricoes": {
                 "modo": modo_texto,
                 "prioridade": prioridade_desc
@@ -3538,6 +3903,37 @@ def obter_limites_globais():
 # ==========================================================
 # 🔹 /api/reles/status-completo → Status completo para dashboard
 # ==========================================================
+def formatar_status_rele(rele, saldo_global):
+    """Linha de /api/reles/status-completo (também usada no snapshot do dashboard)"""
+    # Calcular status do limite
+    atingiu_limite = saldo_global <= rele.limite_individual
+    status_limite = "🔴 CRÍTICO" if atingiu_limite else "🟢 NORMAL"
+    
+    modo_texto = "Automático" if rele.modo_automatico else "Manual"
+    prioridade_desc = {
+        1: "Máxima 🔴",
+        2: "Alta 🟠", 
+        3: "Média 🟡",
+        4: "Baixa 🟢",
+        5: "Mínima ⚪"
+    }.get(rele.prioridade, "Desconhecida")
+    
+    return {
+        "id": rele.id,
+        "nome": rele.nome,
+        "pzem_id": rele.pzem_id,
+        "estado": rele.estado,
+        "prioridade": rele.prioridade,
+        "prioridade_desc": prioridade_desc,
+        "limite_individual": rele.limite_individual,
+        "saldo_global": round(saldo_global, 2),
+        "status_limite": status_limite,
+        "atingiu_limite": atingiu_limite,
+        "modo_automatico": rele.modo_automatico,
+        "modo_desc": modo_texto,
+        "pode_controlar_manual": not rele.modo_automatico
+    }
+
 @app.route('/api/reles/status-completo', methods=['GET'])
 @login_required
 def status_reles_completo():
@@ -3546,37 +3942,7 @@ def status_reles_completo():
     config = Configuracao.query.first()
     
     saldo_global = config.saldo_kwh if config else 0
-    reles_formatados = []
-    
-    for rele in reles:
-        # Calcular status do limite
-        atingiu_limite = saldo_global <= rele.limite_individual
-        status_limite = "🔴 CRÍTICO" if atingiu_limite else "🟢 NORMAL"
-        
-        modo_texto = "Automático" if rele.modo_automatico else "Manual"
-        prioridade_desc = {
-            1: "Máxima 🔴",
-            2: "Alta 🟠", 
-            3: "Média 🟡",
-            4: "Baixa 🟢",
-            5: "Mínima ⚪"
-        }.get(rele.prioridade, "Desconhecida")
-        
-        reles_formatados.append({
-            "id": rele.id,
-            "nome": rele.nome,
-            "pzem_id": rele.pzem_id,
-            "estado": rele.estado,
-            "prioridade": rele.prioridade,
-            "prioridade_desc": prioridade_desc,
-            "limite_individual": rele.limite_individual,
-            "saldo_global": round(saldo_global, 2),
-            "status_limite": status_limite,
-            "atingiu_limite": atingiu_limite,
-            "modo_automatico": rele.modo_automatico,
-            "modo_desc": modo_texto,
-            "pode_controlar_manual": not rele.modo_automatico
-        })
+    reles_formatados = [formatar_status_rele(rele, saldo_global) for rele in reles]
     
     return jsonify({
         "success": True,
@@ -3697,6 +4063,7 @@ def health_check():
         return jsonify({
             "status": "healthy",
             "database": db_status,
+            "estado_vivo": estado_vivo.status(),
             "timestamp": datetime.now().isoformat(),
             "environment": "production" if os.environ.get('RAILWAY_ENVIRONMENT') else "development"
         }), 200
@@ -3718,6 +4085,11 @@ def init_db():
         db.create_all()
         print("✅ Tabelas criadas/verificadas com sucesso!")
 
+        # create_all não altera tabelas existentes: colunas/restrições novas só via migrações
+        faltas = diferencas_esquema(db.engine, db.metadata)
+        if faltas:
+            print(f"❌ Esquema desatualizado ({len(faltas)}): {', '.join(faltas[:10])} - corre 'flask atualizar-banco'")
+
         # Criar usuário admin se não existir
         if not User.query.filter_by(email='admin@example.com').first():
             admin_user = User(
@@ -3750,6 +4122,149 @@ def init_db_command():
         init_db()
 
 
+# Última revisão cujas tabelas o create_all do código antigo já criava
+REVISAO_BASE_CREATE_ALL = '79fcae7bdac5'
+
+@app.cli.command("atualizar-banco")
+def atualizar_banco_command():
+    """Aplica as migrações pendentes e falha se o esquema continuar diferente dos modelos"""
+    from alembic.runtime.migration import MigrationContext
+
+    with app.app_context():
+        with db.engine.connect() as conexao:
+            revisao = MigrationContext.configure(conexao).get_current_revision()
+        tabelas = set(inspect(db.engine).get_table_names()) - {'alembic_version'}
+
+        if revisao is None and tabelas:
+            # Criado pelo create_all antigo, sem histórico: as migrações seguintes ainda faltam
+            print(f"📌 Banco sem versão de migração - marcado em {REVISAO_BASE_CREATE_ALL} e atualizado")
+            stamp(revision=REVISAO_BASE_CREATE_ALL)
+        elif revisao is None:
+            # Banco vazio: os modelos já são o esquema da última migração
+            print("🆕 Banco vazio - tabelas criadas a partir dos modelos (stamp head)")
+            db.create_all()
+            stamp()
+        upgrade()
+
+        faltas = diferencas_esquema(db.engine, db.metadata)
+        if faltas:
+            for falta in faltas:
+                print(f"❌ Falta no banco: {falta}")
+            raise click.ClickException("Esquema do banco desatualizado - arranque cancelado")
+    print("✅ Esquema do banco atualizado")
+
+
+@app.cli.command("importar-energia")
+@click.argument("arquivo", type=click.File("r", encoding="utf-8"))
+@click.option("--lote", default=50000, show_default=True, help="Linhas por transação")
+def importar_energia_command(arquivo, lote):
+    """Importa histórico de EnergyData de um CSV (pzem_id,voltage,current,power,energy,frequency,pf,timestamp)"""
+    inicio = time.time()
+    total = 0
+    bloco = []
+    # Histórico: contador próprio (não mexe no contador ao vivo nem no saldo)
+    normalizador = criar_normalizador(EstadoVivoMemoria())
+
+    with app.app_context():
+        for registro in ler_csv_energia(arquivo):
+            bloco.append(registro)
+            if len(bloco) >= lote:
+                total += gravar_energy_rows(bloco, normalizador)
+                bloco = []
+                print(f"📥 {total} registros importados...")
+
+        total += gravar_energy_rows(bloco, normalizador)
+
+    print(f"✅ Importação concluída: {total} registros em {time.time() - inicio:.1f}s")
+
+
+@app.cli.command("recalcular-deltas")
+@click.option("--lote", default=10000, show_default=True, help="Linhas por transação")
+def recalcular_deltas_command(lote):
+    """Recalcula energy_data.delta_kwh de todo o histórico (por PZEM, em ordem de timestamp)"""
+    inicio = time.time()
+    total = 0
+    t = EnergyData.__table__
+
+    with app.app_context():
+        pzems = [p for (p,) in db.session.query(EnergyData.pzem_id).distinct().order_by(EnergyData.pzem_id)]
+        normalizador = criar_normalizador(EstadoVivoMemoria())
+
+        for pzem_id in pzems:
+            ultimo = (None, 0)  # (timestamp, id) da última linha processada
+            while True:
+                consulta = db.session.query(EnergyData.id, EnergyData.pzem_id, EnergyData.energy, EnergyData.timestamp).filter(
+                    EnergyData.pzem_id == pzem_id
+                )
+                if ultimo[0] is not None:
+                    consulta = consulta.filter(tuple_(EnergyData.timestamp, EnergyData.id) > ultimo)
+                linhas = consulta.order_by(EnergyData.timestamp, EnergyData.id).limit(lote).all()
+                if not linhas:
+                    break
+
+                registros = [dict(linha._mapping) for linha in linhas]
+                normalizador.processar(registros)
+                db.session.execute(
+                    t.update().where(t.c.id == bindparam("_id")).values(delta_kwh=bindparam("_delta")),
+                    [{"_id": r["id"], "_delta": r["delta_kwh"]} for r in registros]
+                )
+                db.session.commit()
+
+                total += len(registros)
+                ultimo = (linhas[-1].timestamp, linhas[-1].id)
+                print(f"🔢 {total} registros recalculados (PZEM{pzem_id})...")
+
+    print(f"✅ delta_kwh recalculado ({total} registros) em {time.time() - inicio:.1f}s")
+    print(f"   Contadores: {normalizador.status()} - corre 'flask reconstruir-rollups' para atualizar os rollups")
+
+
+@app.cli.command("reconstruir-rollups")
+@click.option("--desde", default=None, help="Data inicial (YYYY-MM-DD); padrão = primeiro registro")
+@click.option("--ate", default=None, help="Data final inclusiva (YYYY-MM-DD); padrão = último registro")
+def reconstruir_rollups_command(desde, ate):
+    """Apaga e recalcula os rollups minuto/hora/dia (e completa os picos) a partir de energy_data"""
+    inicio_execucao = time.time()
+    total = 0
+
+    with app.app_context():
+        primeiro, ultimo = db.session.query(func.min(EnergyData.timestamp), func.max(EnergyData.timestamp)).one()
+        if primeiro is None:
+            print("ℹ️ energy_data vazio - nada a reconstruir")
+            return
+
+        dt_desde = datetime.strptime(desde, "%Y-%m-%d").date() if desde else primeiro.date()
+        dt_ate = datetime.strptime(ate, "%Y-%m-%d").date() if ate else ultimo.date()
+
+        dia = dt_desde
+        while dia <= dt_ate:
+            ts_inicio, ts_fim = intervalo_datas(dia)
+
+            for modelo in (EnergiaMinuto, EnergiaHora, EnergiaDia):
+                modelo.query.filter(modelo.inicio >= ts_inicio, modelo.inicio < ts_fim).delete(synchronize_session=False)
+
+            linhas = db.session.query(
+                *(getattr(EnergyData, coluna) for coluna in COLUNAS_ENERGIA)
+            ).filter(
+                EnergyData.timestamp >= ts_inicio,
+                EnergyData.timestamp < ts_fim
+            ).all()
+
+            registros = [dict(linha._mapping) for linha in linhas]
+            atualizar_rollups(db.session.connection(), registros, tabelas_rollup())
+            # Picos são monotónicos: reprocessar só pode completar o que faltava
+            atualizar_picos(db.session.connection(), registros, tabelas_picos())
+            db.session.commit()
+
+            total += len(registros)
+            if registros:
+                print(f"📊 {dia}: {len(registros)} registros agregados")
+            dia += timedelta(days=1)
+
+        versoes_dados.incrementar("energia")
+
+    print(f"✅ Rollups reconstruídos ({total} registros) em {time.time() - inicio_execucao:.1f}s")
+
+
 # -----------------------------
 # Inicialização do sistema de notificações
 # -----------------------------
@@ -3763,9 +4278,13 @@ def init_notificacoes():
 # -----------------------------
 # Inicialização automática em produção (Railway / Gunicorn)
 # -----------------------------
-with app.app_context():
-    init_db()
-    init_notificacoes()
+# Nos comandos de migração o esquema vem das migrações, não do create_all
+COMANDOS_MIGRACAO = {'atualizar-banco', 'db'}
+
+if not COMANDOS_MIGRACAO & set(sys.argv[1:]):
+    with app.app_context():
+        init_db()
+        init_notificacoes()
 
 # -----------------------------
 # Execução local (python app.py)
@@ -44,3 +44,143 @@ class Config:
     API_KEYS = {
         "SUA_CHAVE_API_SECRETA": "ESP8266"
     }
+
+    # =========================================================
+    # 📥 FILA DE INGESTÃO (/api/dados)
+    # =========================================================
+    # Gravação em lote dos EnergyData: grava quando o lote chega ao
+    # tamanho máximo ou quando passa o intervalo (segundos)
+    INGESTAO_LOTE_MAXIMO = int(os.environ.get('INGESTAO_LOTE_MAXIMO', 200))
+    INGESTAO_INTERVALO_FLUSH = float(os.environ.get('INGESTAO_INTERVALO_FLUSH', 2.0))
+    INGESTAO_FILA_MAXIMA = int(os.environ.get('INGESTAO_FILA_MAXIMA', 10000))
+    # Lote que falha é repetido sem limite, com backoff até INGESTAO_ESPERA_MAXIMA (s)
+    INGESTAO_ESPERA_MAXIMA = float(os.environ.get('INGESTAO_ESPERA_MAXIMA', 30.0))
+
+    # Máximo de amostras aceites por pedido em /api/dados/lote
+    # (o ESP envia o buffer acumulado, inclusive depois de ficar sem WiFi)
+    LOTE_MAX_AMOSTRAS = int(os.environ.get('LOTE_MAX_AMOSTRAS', 5000))
+    # O ESP envia um lote a cada LOTE_INTERVALO_SEGUNDOS (12 amostras x 5s);
+    # o PZEM conta como online enquanto a amostra mais recente tiver menos de
+    # PZEM_ONLINE_SEGUNDOS (padrão: dois lotes + 30s de folga para rede/TLS)
+    LOTE_INTERVALO_SEGUNDOS = float(os.environ.get('LOTE_INTERVALO_SEGUNDOS', 60))
+    PZEM_ONLINE_SEGUNDOS = float(os.environ.get('PZEM_ONLINE_SEGUNDOS', 2 * LOTE_INTERVALO_SEGUNDOS + 30))
+
+    # =========================================================
+    # 📡 ESTADO AO VIVO PARTILHADO (dados_pzem, LDR)
+    # =========================================================
+    # memoria → só o próprio worker | mmap → workers da mesma máquina
+    # postgres → várias instâncias (tabela estado_vivo)
+    ESTADO_VIVO_BACKEND = os.environ.get('ESTADO_VIVO_BACKEND', 'mmap')
+    ESTADO_VIVO_ARQUIVO = os.environ.get(
+        'ESTADO_VIVO_ARQUIVO',
+        '/dev/shm/automacao_estado_vivo' if os.path.isdir('/dev/shm') else '/tmp/automacao_estado_vivo'
+    )
+    ESTADO_VIVO_CACHE_TTL = float(os.environ.get('ESTADO_VIVO_CACHE_TTL', 1.0))
+    # Workers do gunicorn (Procfile/railway.json): com mais de um, um backend
+    # partilhado que não arranca cancela o arranque em vez de cair para memória
+    PROCESSOS_WEB = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+    # =========================================================
+    # 🔌 FILA DE COMANDOS DOS RELÉS (/api/comandos)
+    # =========================================================
+    # Comando não confirmado pelo ESP expira após COMANDOS_VALIDADE (s);
+    # entregue sem confirmação é reenviado após COMANDOS_REENTREGA (s)
+    COMANDOS_VALIDADE = int(os.environ.get('COMANDOS_VALIDADE', 120))
+    COMANDOS_REENTREGA = int(os.environ.get('COMANDOS_REENTREGA', 10))
+    # Com a fila vazia o polling só consulta o banco a cada COMANDOS_VARREDURA (s)
+    COMANDOS_VARREDURA = int(os.environ.get('COMANDOS_VARREDURA', 30))
+    # Long-poll (/api/comandos?espera=N): tempo máximo que o pedido fica seguro
+    COMANDOS_ESPERA_MAXIMA = int(os.environ.get('COMANDOS_ESPERA_MAXIMA', 25))
+
+    # =========================================================
+    # 📺 EVENTOS AO VIVO (SSE /api/eventos)
+    # =========================================================
+    # Cada stream fica aberto no máximo EVENTOS_DURACAO_STREAM segundos
+    # (o browser religa sozinho) e manda um ping a cada EVENTOS_BATIMENTO
+    EVENTOS_DURACAO_STREAM = int(os.environ.get('EVENTOS_DURACAO_STREAM', 300))
+    EVENTOS_BATIMENTO = int(os.environ.get('EVENTOS_BATIMENTO', 15))
+    # Cada stream prende uma thread gthread: no máximo EVENTOS_MAX_STREAMS por
+    # worker (as restantes das 16 ficam para a ingestão e a API); os browsers a
+    # mais recebem o estado atual e religam após EVENTOS_RETRY_CHEIO segundos
+    EVENTOS_MAX_STREAMS = int(os.environ.get('EVENTOS_MAX_STREAMS', 8))
+    EVENTOS_RETRY_CHEIO = int(os.environ.get('EVENTOS_RETRY_CHEIO', 30))
+
+    # =========================================================
+    # 📈 SÉRIE AO VIVO (/api/live/series)
+    # =========================================================
+    # Anel de SERIE_VIVA_CAPACIDADE amostras por PZEM (4320 = 6h a 5s);
+    # partilhado entre workers em SERIE_VIVA_ARQUIVO com o backend mmap
+    SERIE_VIVA_CAPACIDADE = int(os.environ.get('SERIE_VIVA_CAPACIDADE', 4320))
+    SERIE_VIVA_JANELA = int(os.environ.get('SERIE_VIVA_JANELA', 6 * 3600))
+    SERIE_VIVA_ARQUIVO = os.environ.get(
+        'SERIE_VIVA_ARQUIVO',
+        '/dev/shm/automacao_serie_viva' if os.path.isdir('/dev/shm') else '/tmp/automacao_serie_viva'
+    )
+
+    # =========================================================
+    # 💰 LIVRO DO SALDO (contadores_energia / movimentos_saldo)
+    # =========================================================
+    # O contador de um PZEM só é descontado do saldo quando avança pelo
+    # menos SALDO_PASSO_KWH (o resto fica a acumular para a vez seguinte)
+    SALDO_PASSO_KWH = float(os.environ.get('SALDO_PASSO_KWH', 0.01))
+    # O consumo fica em memória e só é escrito no saldo a cada SALDO_ESCRITA_KWH
+    # ou SALDO_ESCRITA_SEGUNDOS (ou logo que o saldo estimado cruza um limite)
+    SALDO_ESCRITA_KWH = float(os.environ.get('SALDO_ESCRITA_KWH', 0.05))
+    SALDO_ESCRITA_SEGUNDOS = float(os.environ.get('SALDO_ESCRITA_SEGUNDOS', 60))
+
+    # =========================================================
+    # 🔢 CONTADOR DE ENERGIA DOS PZEMs (energy_data.delta_kwh)
+    # =========================================================
+    # O contador do PZEM dá a volta em CONTADOR_ROLLOVER_KWH; um salto maior
+    # do que CONTADOR_POTENCIA_MAXIMA_W permite no tempo decorrido é glitch
+    # (consumo 0) até se repetir CONTADOR_CONFIRMACOES vezes (nova base)
+    CONTADOR_ROLLOVER_KWH = float(os.environ.get('CONTADOR_ROLLOVER_KWH', 10000))
+    CONTADOR_POTENCIA_MAXIMA_W = float(os.environ.get('CONTADOR_POTENCIA_MAXIMA_W', 25000))
+    CONTADOR_CONFIRMACOES = int(os.environ.get('CONTADOR_CONFIRMACOES', 3))
+
+    # =========================================================
+    # 🔌 CONTROLO AUTOMÁTICO DOS RELÉS (anti-oscilação)
+    # =========================================================
+    # Padrões para relés sem valor próprio (/api/reles/<id>/config):
+    # desliga com saldo <= limite e só volta a ligar acima de limite +
+    # RELES_HISTERESE_KWH; cada estado dura pelo menos RELES_TEMPO_MINIMO_* s
+    # (contados da última mudança real de estado). 0 = desativado, o
+    # comportamento de sempre; ativar por relé ou aqui para todos
+    RELES_HISTERESE_KWH = float(os.environ.get('RELES_HISTERESE_KWH', 0))
+    RELES_TEMPO_MINIMO_LIGADO = int(os.environ.get('RELES_TEMPO_MINIMO_LIGADO', 0))
+    RELES_TEMPO_MINIMO_DESLIGADO = int(os.environ.get('RELES_TEMPO_MINIMO_DESLIGADO', 0))
+
+    # =========================================================
+    # 📉 SÉRIES DE INTERVALO (/api/energia/serie, LTTB)
+    # =========================================================
+    # Lê do grão mais fino com até SERIE_LIMITE_LINHAS linhas por PZEM
+    # e reduz a no máximo SERIE_PONTOS_MAXIMO pontos
+    SERIE_LIMITE_LINHAS = int(os.environ.get('SERIE_LIMITE_LINHAS', 20000))
+    SERIE_PONTOS_MAXIMO = int(os.environ.get('SERIE_PONTOS_MAXIMO', 5000))
+
+    # =========================================================
+    # 📮 DESPACHANTE DE NOTIFICAÇÕES (caixa de saída)
+    # =========================================================
+    # Telegram/email são enviados por NOTIFICACOES_TRABALHADORES threads;
+    # falhas repetem com backoff NOTIFICACOES_BACKOFF_BASE × 2^n (até
+    # NOTIFICACOES_BACKOFF_MAXIMO s) e desistem após NOTIFICACOES_TENTATIVAS
+    NOTIFICACOES_TRABALHADORES = int(os.environ.get('NOTIFICACOES_TRABALHADORES', 4))
+    NOTIFICACOES_TENTATIVAS = int(os.environ.get('NOTIFICACOES_TENTATIVAS', 5))
+    NOTIFICACOES_BACKOFF_BASE = float(os.environ.get('NOTIFICACOES_BACKOFF_BASE', 30))
+    NOTIFICACOES_BACKOFF_MAXIMO = float(os.environ.get('NOTIFICACOES_BACKOFF_MAXIMO', 3600))
+    # Com a caixa vazia cada worker só a consulta a cada NOTIFICACOES_INTERVALO (s)
+    NOTIFICACOES_INTERVALO = float(os.environ.get('NOTIFICACOES_INTERVALO', 10))
+    # Conexões SMTP autenticadas mantidas abertas e reutilizadas entre envios
+    SMTP_POOL_TAMANHO = int(os.environ.get('SMTP_POOL_TAMANHO', 2))
+    SMTP_OCIOSO_MAXIMO = float(os.environ.get('SMTP_OCIOSO_MAXIMO', 240))
+    # email_frequency = 'daily' → resumo enviado a esta hora (UTC)
+    EMAIL_RESUMO_HORA = int(os.environ.get('EMAIL_RESUMO_HORA', 6))
+    # Chave de alerta já enviado fica na tabela alertas_enviados durante ALERTAS_TTL (s)
+    ALERTAS_TTL = float(os.environ.get('ALERTAS_TTL', 86400))
+    # Telegram: alertas dos últimos TELEGRAM_AGRUPAR_SEGUNDOS seguem numa só mensagem;
+    # no máximo TELEGRAM_MENSAGENS_POR_MINUTO por chat (limite dos grupos) com rajada
+    # de TELEGRAM_RAJADA; TELEGRAM_CLIENTE = requests | python-telegram-bot
+    TELEGRAM_AGRUPAR_SEGUNDOS = float(os.environ.get('TELEGRAM_AGRUPAR_SEGUNDOS', 3))
+    TELEGRAM_MENSAGENS_POR_MINUTO = float(os.environ.get('TELEGRAM_MENSAGENS_POR_MINUTO', 20))
+    TELEGRAM_RAJADA = int(os.environ.get('TELEGRAM_RAJADA', 3))
+    TELEGRAM_CLIENTE = os.environ.get('TELEGRAM_CLIENTE', 'requests')
@@ -37,15 +37,26 @@ String nomesReles[NUM_RELES] = {
 };
 
 // Intervalos de tempo
-const unsigned long intervaloEnvio = 5000;
-const unsigned long intervaloComandos = 2000;
+const unsigned long intervaloEnvio = 5000;        // Intervalo entre amostras guardadas no buffer
+// Comandos chegam na resposta de cada lote; /api/comandos é só reserva quando
+// não há lote confirmado há semLoteParaComandos (servidor fora, WiFi instável...)
+const unsigned long semLoteParaComandos = 90000;    // 1,5 x o intervalo dos lotes
+const unsigned long intervaloComandos = 30000;      // Pausa entre pedidos de reserva a /api/comandos
+const unsigned long esperaMaximaComandos = 25000;   // Long-poll: servidor segura o pedido até haver comando
 const unsigned long intervaloAtualizarNomes = 30000;
 const float LIMITE_POTENCIA_SEGURANCA = 2000.0;
 
 //Tempos e intervalos de resposta do sistema
 // ==================== VARIÁVEIS GLOBAIS ====================
 unsigned long ultimoEnvio = 0;
+unsigned long ultimoEnvioLote = 0;
+unsigned long ultimoLoteConfirmado = 0;  // Último lote aceite pelo servidor (resposta já traz os comandos)
+bool falhaEnvioLote = false;
 unsigned long ultimaLeituraComandos = 0;
+// Sequências dos comandos executados ainda não confirmadas ao servidor (enviadas em "ack")
+const int MAX_ACKS = 16;
+unsigned long acksPendentes[MAX_ACKS];
+int totalAcks = 0;
 unsigned long ultimaAtualizacaoNomes = 0;
 unsigned long ultimaInfoSistema = 0;
 //InicializaçãoInicia o LCD;Inicia o WiFi; Inicializa relésTesta comunicação com os PZEMs; Busca nomes dos relés do servidor;Prepara o sistema para operar
@@ -61,6 +72,24 @@ struct DadosPZEM {
 
 DadosPZEM dadosPzem1, dadosPzem2;
 
+// ==================== BUFFER DE AMOSTRAS (ENVIO EM LOTE) ====================
+// As leituras ficam num buffer circular e são enviadas em lote para /api/dados/lote.
+// Sem WiFi o buffer continua a encher (as mais antigas são descartadas quando cheio)
+// e o atraso é enviado quando a ligação voltar.
+struct AmostraPZEM {
+  unsigned long ms;   // millis() no momento da leitura
+  DadosPZEM p1;
+  DadosPZEM p2;
+};
+
+const int MAX_AMOSTRAS_BUFFER = 60;   // 5 minutos de leituras
+const int AMOSTRAS_POR_LOTE = 12;     // 12 x 5s = 1 envio por minuto
+const int MAX_AMOSTRAS_POR_ENVIO = 12;   // Limita o JSON (heap do ESP8266)
+
+AmostraPZEM bufferAmostras[MAX_AMOSTRAS_BUFFER];
+int inicioBuffer = 0;
+int totalAmostras = 0;
+
 //INICIO DO CODIGO
 
 void setup() {
@@ -124,7 +153,11 @@ mostrarPZEMnoLCD(dadosPzem1);
   Serial.println(valorLuz);
 
   if (deveEnviarDados()) {
-    enviarDadosServidor();
+    guardarAmostra();
+  }
+
+  if (deveEnviarLote()) {
+    enviarLoteServidor();
   }
 
   // ====================== ENVIO DO LDR + R1 ======================
@@ -345,40 +378,66 @@ HTTPClient http;
   ultimaAtualizacaoNomes = millis();
 }
 
-// ==================== FUNÇÃO ATUALIZADA: ENVIAR DADOS ====================
-void enviarDadosServidor() {
-  if (WiFi.status() != WL_CONNECTED) {
-    Serial.println("WiFi desconectado - dados não enviados");
+// ==================== BUFFER: GUARDAR AMOSTRA ====================
+void guardarAmostra() {
+  int posicao;
+
+  if (totalAmostras < MAX_AMOSTRAS_BUFFER) {
+    posicao = (inicioBuffer + totalAmostras) % MAX_AMOSTRAS_BUFFER;
+    totalAmostras++;
+  } else {
+    // Buffer cheio: sobrescreve a amostra mais antiga
+    posicao = inicioBuffer;
+    inicioBuffer = (inicioBuffer + 1) % MAX_AMOSTRAS_BUFFER;
+    Serial.println("Buffer cheio - amostra mais antiga descartada");
+  }
+
+  bufferAmostras[posicao].ms = millis();
+  bufferAmostras[posicao].p1 = dadosPzem1;
+  bufferAmostras[posicao].p2 = dadosPzem2;
+
+  ultimoEnvio = millis();
+}
+
+void adicionarLeituraJson(JsonObject destino, const DadosPZEM &dados) {
+  destino["voltage"] = dados.conectado ? round(dados.voltage * 10) / 10.0 : 0.0;
+  destino["current"] = dados.conectado ? round(dados.current * 1000) / 1000.0 : 0.0;
+  destino["power"] = dados.conectado ? round(dados.power * 10) / 10.0 : 0.0;
+  destino["energy"] = dados.conectado ? round(dados.energy * 1000) / 1000.0 : 0.0;
+  destino["frequency"] = dados.conectado ? round(dados.frequency * 10) / 10.0 : 0.0;
+  destino["pf"] = dados.conectado ? round(dados.pf * 100) / 100.0 : 0.0;
+  destino["conectado"] = dados.conectado;
+}
+
+// ==================== FUNÇÃO ATUALIZADA: ENVIAR LOTE ====================
+void enviarLoteServidor() {
+  if (WiFi.status() != WL_CONNECTED || totalAmostras == 0) {
     return;
   }
-  
- WiFiClientSecure client;
-client.setInsecure();
 
-HTTPClient http;
+  WiFiClientSecure client;
+  client.setInsecure();
+
+  HTTPClient http;
+
+  int quantidade = totalAmostras < MAX_AMOSTRAS_POR_ENVIO ? totalAmostras : MAX_AMOSTRAS_POR_ENVIO;
 
-  DynamicJsonDocument doc(2048);
+  DynamicJsonDocument doc(6144);
   doc["api_key"] = apiKey;
-  
-  // Dados PZEM 001
-  JsonObject pzem1Data = doc.createNestedObject("pzem1");
-  pzem1Data["voltage"] = dadosPzem1.conectado ? round(dadosPzem1.voltage * 10) / 10.0 : 0.0;
-  pzem1Data["current"] = dadosPzem1.conectado ? round(dadosPzem1.current * 1000) / 1000.0 : 0.0;
-  pzem1Data["power"] = dadosPzem1.conectado ? round(dadosPzem1.power * 10) / 10.0 : 0.0;
-  pzem1Data["energy"] = dadosPzem1.conectado ? round(dadosPzem1.energy * 1000) / 1000.0 : 0.0;
-  pzem1Data["frequency"] = dadosPzem1.conectado ? round(dadosPzem1.frequency * 10) / 10.0 : 0.0;
-  pzem1Data["pf"] = dadosPzem1.conectado ? round(dadosPzem1.pf * 100) / 100.0 : 0.0;
-  pzem1Data["conectado"] = dadosPzem1.conectado;
-  
-  // Dados PZEM 002
-  JsonObject pzem2Data = doc.createNestedObject("pzem2");
-  pzem2Data["voltage"] = dadosPzem2.conectado ? round(dadosPzem2.voltage * 10) / 10.0 : 0.0;
-  pzem2Data["current"] = dadosPzem2.conectado ? round(dadosPzem2.current * 1000) / 1000.0 : 0.0;
-  pzem2Data["power"] = dadosPzem2.conectado ? round(dadosPzem2.power * 10) / 10.0 : 0.0;
-  pzem2Data["energy"] = dadosPzem2.conectado ? round(dadosPzem2.energy * 1000) / 1000.0 : 0.0;
-  pzem2Data["frequency"] = dadosPzem2.conectado ? round(dadosPzem2.frequency * 10) / 10.0 : 0.0;
-  pzem2Data["pf"] = dadosPzem2.conectado ? round(dadosPzem2.pf * 100) / 100.0 : 0.0;
-  pzem2Data["conectado"] = dadosPzem2.conectado;
+  doc["agora_ms"] = millis();
+  int acksEnviados = totalAcks;
+  JsonArray ack = doc.createNestedArray("ack");
+  for (int i = 0; i < acksEnviados; i++) ack.add(acksPendentes[i]);
+
+  // Amostras (o servidor calcula o timestamp de cada uma a partir de agora_ms - ms)
+  JsonArray amostras = doc.createNestedArray("amostras");
+  for (int i = 0; i < quantidade; i++) {
+    AmostraPZEM &amostra = bufferAmostras[(inicioBuffer + i) % MAX_AMOSTRAS_BUFFER];
+    JsonObject item = amostras.createNestedObject();
+    item["ms"] = amostra.ms;
+    adicionarLeituraJson(item.createNestedObject("pzem1"), amostra.p1);
+    adicionarLeituraJson(item.createNestedObject("pzem2"), amostra.p2);
+  }
   
   // Estados dos relés
   JsonArray reles = doc.createNestedArray("reles");
@@ -393,28 +452,42 @@ HTTPClient http;
   String jsonString;
   serializeJson(doc, jsonString);
   
-  String urlCompleta = String(serverURL) + "/api/dados";
+  String urlCompleta = String(serverURL) + "/api/dados/lote";
   http.begin(client, urlCompleta);
   http.addHeader("Content-Type", "application/json");
   http.setTimeout(15000);
   
-  Serial.print("Enviando dados para: ");
+  Serial.printf("Enviando lote de %d amostras para: ", quantidade);
   Serial.println(urlCompleta);
   
   int httpCode = http.POST(jsonString);
   
   if (httpCode == HTTP_CODE_OK) {
-    Serial.println("Dados enviados com sucesso para o servidor!");
+    // Só remove do buffer depois de o servidor confirmar
+    inicioBuffer = (inicioBuffer + quantidade) % MAX_AMOSTRAS_BUFFER;
+    totalAmostras -= quantidade;
+    falhaEnvioLote = false;
+    ultimoLoteConfirmado = millis();
+    removerAcks(acksEnviados);
+    Serial.println("Lote enviado com sucesso para o servidor!");
+
+    // Comandos pendentes vêm na própria resposta (sem pedido extra)
+    doc.clear();
+    if (!deserializeJson(doc, http.getString())) {
+      executarComandosResposta(doc);
+    }
   } else if (httpCode > 0) {
+    falhaEnvioLote = true;
     Serial.print("Erro HTTP no envio: ");
     Serial.println(httpCode);
   } else {
+    falhaEnvioLote = true;
     Serial.print("Falha de conexão: ");
     Serial.println(http.errorToString(httpCode).c_str());
   }
   
   http.end();
-  ultimoEnvio = millis();
+  ultimoEnvioLote = millis();
 }
 
 // ==================== FUNÇÕES AUXILIARES ====================
@@ -460,7 +533,17 @@ void verificarConexaoWiFi() {
 }
 
 bool deveEnviarDados() { return (millis() - ultimoEnvio >= intervaloEnvio); }
-bool deveVerificarComandos() { return (millis() - ultimaLeituraComandos >= intervaloComandos); }
+// Envia quando o lote está completo; com atraso acumulado (pós-queda de WiFi) continua a esvaziar
+bool deveEnviarLote() {
+  unsigned long espera = falhaEnvioLote ? 10000 : 1000;
+  if (totalAmostras >= AMOSTRAS_POR_LOTE) return (millis() - ultimoEnvioLote >= espera);
+  return false;
+}
+// Reserva: só consulta /api/comandos quando os lotes deixaram de ser confirmados
+bool deveVerificarComandos() {
+  if (millis() - ultimoLoteConfirmado < semLoteParaComandos) return false;
+  return (millis() - ultimaLeituraComandos >= intervaloComandos);
+}
 bool deveAtualizarNomes() { return (millis() - ultimaAtualizacaoNomes >= intervaloAtualizarNomes); }
 bool deveMostrarInformacoes() { return (millis() - ultimaInfoSistema >= 300000); }
 
@@ -471,18 +554,35 @@ WiFiClientSecure client;
 client.setInsecure();
 HTTPClient http;
 
-  String url = String(serverURL) + "/api/comandos?api_key=" + apiKey;
+  // Long-poll: o pedido fica seguro no servidor até chegar um comando, mas
+  // nunca para além da próxima amostra (o loop é bloqueado durante a espera)
+  unsigned long decorrido = millis() - ultimoEnvio;
+  unsigned long espera = decorrido < intervaloEnvio ? intervaloEnvio - decorrido : 0;
+  if (espera > esperaMaximaComandos) espera = esperaMaximaComandos;
+  espera = espera > 1500 ? espera - 1500 : 0;  // margem para o TLS e a resposta
+
+  int acksEnviados = totalAcks;
+  String listaAcks = "";
+  for (int i = 0; i < acksEnviados; i++) {
+    if (i > 0) listaAcks += ",";
+    listaAcks += String(acksPendentes[i]);
+  }
+  String url = String(serverURL) + "/api/comandos?api_key=" + apiKey + "&espera=" + String(espera / 1000.0, 1)
+             + "&ack=" + listaAcks;
   http.begin(client, url);
-  http.setTimeout(3000);
+  http.setTimeout(espera + 5000);
   
   int httpCode = http.GET();
   
   if (httpCode == HTTP_CODE_OK) {
+    removerAcks(acksEnviados);
     String response = http.getString();
-    DynamicJsonDocument doc(256);
+    DynamicJsonDocument doc(1024);
     deserializeJson(doc, response);
     
-    if (doc.containsKey("comando") && doc["comando"] != "") {
+    if (doc.containsKey("comandos")) {
+      executarComandosResposta(doc);
+    } else if (doc.containsKey("comando") && doc["comando"] != "") {
       Serial.print("Comando recebido: ");
       Serial.println(doc["comando"].as<String>());
       executarComando(doc["comando"].as<String>());
@@ -493,6 +593,25 @@ HTTPClient http;
   ultimaLeituraComandos = millis();
 }
 
+// Executa todos os comandos de uma resposta do servidor e guarda a sequência de cada um para o ack
+void executarComandosResposta(JsonDocument &doc) {
+  for (JsonObject item : doc["comandos"].as<JsonArray>()) {
+    Serial.print("Comando recebido: ");
+    Serial.println(item["comando"].as<String>());
+    executarComando(item["comando"].as<String>());
+
+    // Sem espaço: o comando fica por confirmar e o servidor reenvia-o (ON/OFF repetido é inócuo)
+    unsigned long seq = item["seq"] | 0UL;
+    if (seq && totalAcks < MAX_ACKS) acksPendentes[totalAcks++] = seq;
+  }
+}
+
+// Retira os primeiros `quantidade` acks (já recebidos pelo servidor)
+void removerAcks(int quantidade) {
+  for (int i = quantidade; i < totalAcks; i++) acksPendentes[i - quantidade] = acksPendentes[i];
+  totalAcks -= quantidade;
+}
+
 void executarComando(String comando) {
     comando.trim();
     comando.toUpperCase();
@@ -0,0 +1,47 @@
+"""Índices de energy_data (pzem_id, timestamp) e BRIN em timestamp
+
+Revision ID: 7b4fd29eb7b4
+Revises: 79fcae7bdac5
+Create Date: 2026-10-18 10:40:12.518204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7b4fd29eb7b4'
+down_revision = '79fcae7bdac5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY não corre dentro de transação e evita bloquear a ingestão
+    # enquanto os índices são construídos sobre a tabela já cheia.
+    # if_not_exists cobre bancos criados pelo db.create_all() automático.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_energy_data_pzem_id_timestamp',
+            'energy_data',
+            ['pzem_id', 'timestamp'],
+            unique=False,
+            if_not_exists=True,
+            postgresql_concurrently=True
+        )
+        # BRIN: minúsculo e ideal para dados inseridos em ordem cronológica
+        # (fora do PostgreSQL vira um índice comum)
+        op.create_index(
+            'ix_energy_data_timestamp_brin',
+            'energy_data',
+            ['timestamp'],
+            unique=False,
+            if_not_exists=True,
+            postgresql_using='brin',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_energy_data_timestamp_brin', table_name='energy_data', if_exists=True, postgresql_concurrently=True)
+        op.drop_index('ix_energy_data_pzem_id_timestamp', table_name='energy_data', if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,51 @@
+"""energy_data.delta_kwh e energia_soma nos rollups (consumo normalizado)
+
+Revision ID: a8c3e6f1d7b4
+Revises: f3a7d2c9e5b1
+Create Date: 2026-10-18 21:04:12.530718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c3e6f1d7b4'
+down_revision = 'f3a7d2c9e5b1'
+branch_labels = None
+depends_on = None
+
+ROLLUPS = ('energia_minuto', 'energia_hora', 'energia_dia')
+
+
+def _colunas(tabela):
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(tabela)}
+
+
+def upgrade():
+    # O app corre db.create_all() no arranque: as colunas podem já existir
+    if 'delta_kwh' not in _colunas('energy_data'):
+        with op.batch_alter_table('energy_data', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('delta_kwh', sa.Float(), nullable=True))
+
+    for tabela in ROLLUPS:
+        if 'energia_soma' in _colunas(tabela):
+            continue
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('energia_soma', sa.Float(), nullable=False, server_default='0'))
+
+        # Histórico: mantém o consumo que os relatórios já mostravam (máximo - mínimo);
+        # `flask recalcular-deltas` + `flask reconstruir-rollups` corrigem reinícios antigos
+        op.execute(
+            f"UPDATE {tabela} SET energia_soma = "
+            "CASE WHEN energy_max > energy_min THEN energy_max - energy_min ELSE 0 END"
+        )
+
+
+def downgrade():
+    for tabela in ROLLUPS:
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.drop_column('energia_soma')
+
+    with op.batch_alter_table('energy_data', schema=None) as batch_op:
+        batch_op.drop_column('delta_kwh')
@@ -0,0 +1,39 @@
+"""Histerese e permanência mínima dos relés automáticos
+
+Revision ID: b6d1f4a9c2e8
+Revises: a8c3e6f1d7b4
+Create Date: 2026-10-18 22:17:39.104286
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1f4a9c2e8'
+down_revision = 'a8c3e6f1d7b4'
+branch_labels = None
+depends_on = None
+
+COLUNAS = (
+    ('histerese_kwh', sa.Float()),
+    ('tempo_minimo_ligado', sa.Integer()),
+    ('tempo_minimo_desligado', sa.Integer()),
+    ('estado_alterado_em', sa.DateTime()),
+)
+
+
+def upgrade():
+    # O app corre db.create_all() no arranque: as colunas podem já existir
+    existentes = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('reles')}
+
+    with op.batch_alter_table('reles', schema=None) as batch_op:
+        for nome, tipo in COLUNAS:
+            if nome not in existentes:
+                batch_op.add_column(sa.Column(nome, tipo, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('reles', schema=None) as batch_op:
+        for nome, _ in reversed(COLUNAS):
+            batch_op.drop_column(nome)
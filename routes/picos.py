@@ -1,12 +1,39 @@
 from datetime import datetime, timedelta
-from flask import Blueprint, jsonify
-from app import db, dados_pzem       # db e dados_pzem vêm do app.py
-from app import EnergyData        # modelo do banco
+from flask import Blueprint, jsonify, request
+from app import dados_pzem           # dados_pzem vem do app.py
+from app import DailyPeak, WeeklyPeak, MonthlyPeak  # picos mantidos pela ingestão
 
 # Cria blueprint para picos
 picos_bp = Blueprint('picos', __name__)
 
 
+# ============================================
+# AUXILIARES
+# ============================================
+def formatar_maior_pico(picos, com_data=False):
+    """Escolhe o maior pico entre os PZEMs (linhas de DailyPeak/WeeklyPeak/MonthlyPeak)"""
+    if not picos:
+        return None
+
+    pico = max(picos, key=lambda p: p.value)
+    if com_data and getattr(pico, "date", None):
+        momento = datetime.combine(pico.date, pico.time).strftime("%d/%m %H:%M")
+    else:
+        momento = pico.time.strftime("%H:%M")
+
+    return {"value": pico.value, "time": momento, "pzem": pico.pzem_id}
+
+
+def pico_tempo_real(formato):
+    """Fallback quando ainda não há pico gravado no período"""
+    pico_atual = max(dados_pzem["pzem1"]["power"], dados_pzem["pzem2"]["power"])
+    return {
+        "value": pico_atual,
+        "time": datetime.now().strftime(formato),
+        "pzem": 1 if dados_pzem["pzem1"]["power"] >= dados_pzem["pzem2"]["power"] else 2
+    }
+
+
 # ============================================
 # FUNÇÃO 1 – PICO DO DIA
 # ============================================
@@ -14,44 +41,9 @@ def obter_pico_do_dia():
     try:
         hoje = datetime.utcnow().date()
 
-        # PZEM 1
-        pico_pzem1 = EnergyData.query.filter(
-            EnergyData.pzem_id == 1,
-            db.func.date(EnergyData.timestamp) == hoje
-        ).order_by(EnergyData.power.desc()).first()
-
-        # PZEM 2
-        pico_pzem2 = EnergyData.query.filter(
-            EnergyData.pzem_id == 2,
-            db.func.date(EnergyData.timestamp) == hoje
-        ).order_by(EnergyData.power.desc()).first()
-
-        picos = []
-
-        if pico_pzem1:
-            picos.append({
-                "value": pico_pzem1.power,
-                "time": pico_pzem1.timestamp.strftime("%H:%M"),
-                "pzem": 1
-            })
-
-        if pico_pzem2:
-            picos.append({
-                "value": pico_pzem2.power,
-                "time": pico_pzem2.timestamp.strftime("%H:%M"),
-                "pzem": 2
-            })
-
-        if picos:
-            return max(picos, key=lambda x: x["value"])
-
-        # Fallback em tempo real
-        pico_atual = max(dados_pzem["pzem1"]["power"], dados_pzem["pzem2"]["power"])
-        return {
-            "value": pico_atual,
-            "time": datetime.now().strftime("%H:%M"),
-            "pzem": 1 if dados_pzem["pzem1"]["power"] >= dados_pzem["pzem2"]["power"] else 2
-        }
+        # Uma linha por PZEM, pela chave única (date, pzem_id)
+        pico = formatar_maior_pico(DailyPeak.query.filter_by(date=hoje).all())
+        return pico or pico_tempo_real("%H:%M")
 
     except Exception as e:
         print("❌ Erro obter pico do dia:", e)
@@ -59,41 +51,76 @@ def obter_pico_do_dia():
 
 
 # ============================================
-# FUNÇÃO 2 – PICOS DA SEMANA
+# FUNÇÃO 2 – SÉRIE DE PICOS (DIA / SEMANA / MÊS)
 # ============================================
+GRANULARIDADES = {
+    "dia": "dia", "day": "dia",
+    "semana": "semana", "week": "semana",
+    "mes": "mes", "month": "mes"
+}
+MAX_DIAS_SERIE = 1096  # ~3 anos de daily_peaks por pedido
+
+
+def inicio_do_periodo(data, granularidade):
+    if granularidade == "semana":
+        return data - timedelta(days=data.weekday())
+    if granularidade == "mes":
+        return data.replace(day=1)
+    return data
+
+
+def proximo_periodo(data, granularidade):
+    if granularidade == "semana":
+        return data + timedelta(days=7)
+    if granularidade == "mes":
+        return (data.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return data + timedelta(days=1)
+
+
+def obter_serie_picos(inicio, fim, pzems=None, granularidade="dia"):
+    """Maior pico (valor, hora e PZEM) de cada dia/semana/mês entre inicio e fim (datas inclusivas).
+    Uma única consulta a daily_peaks; períodos sem dados vêm com valor 0."""
+    consulta = DailyPeak.query.filter(DailyPeak.date >= inicio, DailyPeak.date <= fim)
+    if pzems:
+        consulta = consulta.filter(DailyPeak.pzem_id.in_(pzems))
+
+    maiores = {}
+    for pico in consulta:
+        periodo = inicio_do_periodo(pico.date, granularidade)
+        atual = maiores.get(periodo)
+        if atual is None or pico.value > atual.value:
+            maiores[periodo] = pico
+
+    pontos = []
+    periodo = inicio_do_periodo(inicio, granularidade)
+    while periodo <= fim:
+        pico = maiores.get(periodo)
+        pontos.append({
+            "periodo": periodo.isoformat(),
+            "value": pico.value if pico else 0,
+            "time": datetime.combine(pico.date, pico.time).strftime("%d/%m %H:%M") if pico else None,
+            "pzem": pico.pzem_id if pico else None
+        })
+        periodo = proximo_periodo(periodo, granularidade)
+
+    return pontos
+
+
 def obter_picos_semana_atual():
     try:
         hoje = datetime.utcnow().date()
         inicio_semana = hoje - timedelta(days=hoje.weekday())
 
+        pontos = obter_serie_picos(inicio_semana, inicio_semana + timedelta(days=6))
+
         nomes_dias = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
         labels = []
         valores = []
 
-        for i in range(7):
+        for i, ponto in enumerate(pontos):
             data = inicio_semana + timedelta(days=i)
             labels.append(f"{nomes_dias[i]} ({data.day})")
-
-            if data > hoje:
-                valores.append(0)
-                continue
-
-            pico1 = EnergyData.query.filter(
-                EnergyData.pzem_id == 1,
-                db.func.date(EnergyData.timestamp) == data
-            ).order_by(EnergyData.power.desc()).first()
-
-            pico2 = EnergyData.query.filter(
-                EnergyData.pzem_id == 2,
-                db.func.date(EnergyData.timestamp) == data
-            ).order_by(EnergyData.power.desc()).first()
-
-            valor = max(
-                [p.power for p in [pico1, pico2] if p],
-                default=0
-            )
-
-            valores.append(valor)
+            valores.append(ponto["value"])
 
         return {"labels": labels, "values": valores}
 
@@ -110,42 +137,8 @@ def obter_pico_semanal():
         hoje = datetime.utcnow().date()
         inicio_semana = hoje - timedelta(days=hoje.weekday())
 
-        pico1 = EnergyData.query.filter(
-            EnergyData.pzem_id == 1,
-            EnergyData.timestamp >= inicio_semana
-        ).order_by(EnergyData.power.desc()).first()
-
-        pico2 = EnergyData.query.filter(
-            EnergyData.pzem_id == 2,
-            EnergyData.timestamp >= inicio_semana
-        ).order_by(EnergyData.power.desc()).first()
-
-        picos = []
-
-        if pico1:
-            picos.append({
-                "value": pico1.power,
-                "time": pico1.timestamp.strftime("%d/%m %H:%M"),
-                "pzem": 1
-            })
-
-        if pico2:
-            picos.append({
-                "value": pico2.power,
-                "time": pico2.timestamp.strftime("%d/%m %H:%M"),
-                "pzem": 2
-            })
-
-        if picos:
-            return max(picos, key=lambda x: x["value"])
-
-        # fallback
-        pico_atual = max(dados_pzem["pzem1"]["power"], dados_pzem["pzem2"]["power"])
-        return {
-            "value": pico_atual,
-            "time": datetime.now().strftime("%d/%m %H:%M"),
-            "pzem": 1 if dados_pzem["pzem1"]["power"] >= dados_pzem["pzem2"]["power"] else 2
-        }
+        pico = formatar_maior_pico(WeeklyPeak.query.filter_by(week_start=inicio_semana).all(), com_data=True)
+        return pico or pico_tempo_real("%d/%m %H:%M")
 
     except Exception as e:
         print("❌ Erro pico semanal:", e)
@@ -158,44 +151,9 @@ def obter_pico_semanal():
 def obter_pico_mensal():
     try:
         hoje = datetime.utcnow().date()
-        inicio_mes = hoje.replace(day=1)
-
-        pico1 = EnergyData.query.filter(
-            EnergyData.pzem_id == 1,
-            EnergyData.timestamp >= inicio_mes
-        ).order_by(EnergyData.power.desc()).first()
-
-        pico2 = EnergyData.query.filter(
-            EnergyData.pzem_id == 2,
-            EnergyData.timestamp >= inicio_mes
-        ).order_by(EnergyData.power.desc()).first()
-
-        picos = []
-
-        if pico1:
-            picos.append({
-                "value": pico1.power,
-                "time": pico1.timestamp.strftime("%d/%m %H:%M"),
-                "pzem": 1
-            })
-
-        if pico2:
-            picos.append({
-                "value": pico2.power,
-                "time": pico2.timestamp.strftime("%d/%m %H:%M"),
-                "pzem": 2
-            })
-
-        if picos:
-            return max(picos, key=lambda x: x["value"])
-
-        # fallback
-        pico_atual = max(dados_pzem["pzem1"]["power"], dados_pzem["pzem2"]["power"])
-        return {
-            "value": pico_atual,
-            "time": datetime.now().strftime("%d/%m %H:%M"),
-            "pzem": 1 if dados_pzem["pzem1"]["power"] >= dados_pzem["pzem2"]["power"] else 2
-        }
+
+        pico = formatar_maior_pico(MonthlyPeak.query.filter_by(year=hoje.year, month=hoje.month).all(), com_data=True)
+        return pico or pico_tempo_real("%d/%m %H:%M")
 
     except Exception as e:
         print("❌ Erro pico mensal:", e)
@@ -220,3 +178,39 @@ def api_pico_semanal():
 @picos_bp.route("/api/pico/mensal")
 def api_pico_mensal():
     return jsonify(obter_pico_mensal())
+
+@picos_bp.route("/api/pico/serie")
+def api_pico_serie():
+    """?inicio=YYYY-MM-DD&fim=YYYY-MM-DD&pzems=1,2&granularidade=dia|semana|mes"""
+    hoje = datetime.utcnow().date()
+    granularidade = GRANULARIDADES.get(request.args.get("granularidade", "dia").lower())
+    if not granularidade:
+        return jsonify({"error": "granularidade deve ser dia, semana ou mes"}), 400
+
+    try:
+        inicio = datetime.strptime(request.args["inicio"], "%Y-%m-%d").date() if request.args.get("inicio") else hoje - timedelta(days=hoje.weekday())
+        fim = datetime.strptime(request.args["fim"], "%Y-%m-%d").date() if request.args.get("fim") else hoje
+        pzems = [int(p) for p in request.args.get("pzems", "").split(",") if p.strip()]
+    except ValueError as e:
+        return jsonify({"error": f"Parâmetro inválido: {e}"}), 400
+
+    if fim < inicio:
+        return jsonify({"error": "fim deve ser igual ou posterior a inicio"}), 400
+    if (fim - inicio).days > MAX_DIAS_SERIE:
+        return jsonify({"error": f"Intervalo máximo é de {MAX_DIAS_SERIE} dias"}), 400
+
+    try:
+        pontos = obter_serie_picos(inicio, fim, pzems or None, granularidade)
+    except Exception as e:
+        print("❌ Erro série de picos:", e)
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "inicio": inicio.isoformat(),
+        "fim": fim.isoformat(),
+        "granularidade": granularidade,
+        "pzems": pzems or "all",
+        "labels": [p["periodo"] for p in pontos],
+        "values": [p["value"] for p in pontos],
+        "pontos": pontos
+    })
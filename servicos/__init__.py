@@ -0,0 +1 @@
+# Serviços de apoio ao app principal (filas, caches e processamento em background)
@@ -0,0 +1,116 @@
+# ==========================================================
+# REGISTO DE ALERTAS ENVIADOS (DEDUPLICAÇÃO ENTRE WORKERS)
+# ==========================================================
+# Cada alerta tem uma chave (ex.: saldo_baixo_2026101814). Reservar a
+# chave = INSERT ... ON CONFLICT (chave) DO UPDATE ... WHERE expirada
+# na tabela alertas_enviados, na mesma transação que enfileira as
+# notificações:
+# • só uma transação consegue a linha (a outra espera pelo commit da
+#   primeira e não altera nada) → o alerta sai uma única vez, mesmo com
+#   vários workers ou instâncias;
+# • rollback do envio → a reserva desaparece com ele e o alerta volta a
+#   ser tentado na verificação seguinte;
+# • cada chave expira ao fim de `ttl` s (limpeza = DELETE pelo índice
+#   de expira_em, no máximo uma vez por `intervalo_limpeza`);
+# • cache local de chaves já reservadas: verificações repetidas do
+#   mesmo alerta não vão à base de dados.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from servicos.esquema import insert_upsert
+
+
+class RegistoAlertas:
+    """Chaves de alertas já enviados, partilhadas por todos os workers (com TTL)"""
+
+    def __init__(self, db, modelo, ttl=86400, intervalo_limpeza=600, tamanho_cache=1024):
+        self.db = db
+        self.modelo = modelo
+        self.ttl = float(ttl)
+        self.intervalo_limpeza = float(intervalo_limpeza)
+        self.tamanho_cache = int(tamanho_cache)
+        self._conhecidas = {}  # chave → expira_em (monotonic) das reservas já confirmadas
+        self._ultima_limpeza = None
+        self._lock = threading.Lock()
+
+        event.listen(Session, "after_commit", self._confirmar_reservas)
+        event.listen(Session, "after_rollback", self._descartar_reservas)
+
+    def _conhecida(self, chave):
+        with self._lock:
+            expira = self._conhecidas.get(chave)
+            if expira is None:
+                return False
+            if expira > time.monotonic():
+                return True
+            del self._conhecidas[chave]
+            return False
+
+    def _lembrar(self, chaves, segundos):
+        expira = time.monotonic() + segundos
+        with self._lock:
+            if len(self._conhecidas) + len(chaves) > self.tamanho_cache:
+                agora = time.monotonic()
+                self._conhecidas = {c: e for c, e in self._conhecidas.items() if e > agora}
+            for chave in chaves:
+                self._conhecidas[chave] = expira
+
+    def _confirmar_reservas(self, sessao):
+        reservas = sessao.info.pop("alertas_reservados", None)
+        if reservas:
+            self._lembrar(reservas, self.ttl)
+
+    def _descartar_reservas(self, sessao):
+        sessao.info.pop("alertas_reservados", None)
+
+    def reservar(self, chave, ttl=None):
+        """True se este processo ficou com o alerta (deve enviá-lo e fazer commit);
+        False se já foi enviado por alguém e ainda não expirou"""
+        if self._conhecida(chave):
+            return False
+
+        sessao = self.db.session
+        agora = datetime.utcnow()
+        expira_em = agora + timedelta(seconds=ttl or self.ttl)
+        tabela = self.modelo.__table__
+
+        stmt = insert_upsert(sessao.get_bind().dialect.name, tabela).values(chave=chave, criado_em=agora, expira_em=expira_em)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[tabela.c.chave],
+            set_={"criado_em": stmt.excluded.criado_em, "expira_em": stmt.excluded.expira_em},
+            where=tabela.c.expira_em <= agora
+        )
+        if sessao.execute(stmt).rowcount == 1:
+            sessao.info.setdefault("alertas_reservados", []).append(chave)
+            return True
+
+        # Reservada (e já confirmada) por outro worker
+        self._lembrar([chave], ttl or self.ttl)
+        return False
+
+    def limpar(self, forcar=False):
+        """Apaga as chaves expiradas (no máximo uma vez por intervalo_limpeza neste worker)"""
+        agora = time.monotonic()
+        if not forcar and self._ultima_limpeza and agora - self._ultima_limpeza < self.intervalo_limpeza:
+            return 0
+        self._ultima_limpeza = agora
+
+        m = self.modelo
+        try:
+            apagadas = m.query.filter(m.expira_em <= datetime.utcnow()).delete(synchronize_session=False)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+        if apagadas:
+            print(f"🧹 {apagadas} alerta(s) expirado(s) removido(s)")
+        return apagadas
+
+    def ativos(self):
+        m = self.modelo
+        return self.db.session.query(func.count(m.chave)).filter(m.expira_em > datetime.utcnow()).scalar()
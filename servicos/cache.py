@@ -0,0 +1,64 @@
+# ==========================================================
+# CACHE VERSIONADO (SNAPSHOT DO DASHBOARD)
+# ==========================================================
+# Cada grupo de dados tem um contador de versão no estado ao vivo
+# partilhado (reles, config, energia). Quem grava incrementa a versão
+# depois do commit; quem lê só volta ao banco quando a versão mudou.
+# A mesma chave de versões dá o ETag forte do snapshot, por isso um
+# pedido com If-None-Match igual é respondido sem trabalho nenhum.
+
+import hashlib
+import threading
+
+CHAVE_VERSOES = "versoes"
+
+
+class Versoes:
+    """Contadores de versão partilhados entre workers"""
+
+    def __init__(self, estado, chave=CHAVE_VERSOES):
+        self.estado = estado
+        self.chave = chave
+
+    def incrementar(self, *grupos):
+        if not grupos:
+            return None
+
+        def somar(versoes):
+            for grupo in grupos:
+                versoes[grupo] = versoes.get(grupo, 0) + 1
+            return versoes
+
+        return self.estado.modificar(self.chave, somar)
+
+    def atuais(self):
+        return self.estado.ler(self.chave)
+
+
+class CacheVersionado:
+    """Guarda o último valor construído por chave; reconstrói só quando a chave muda"""
+
+    def __init__(self):
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def obter(self, nome, chave, construir):
+        with self._lock:
+            guardado = self._valores.get(nome)
+            if guardado is not None and guardado[0] == chave:
+                return guardado[1]
+
+        # Constrói fora do lock (consulta ao banco); o último a terminar fica
+        valor = construir()
+        with self._lock:
+            self._valores[nome] = (chave, valor)
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._valores.clear()
+
+
+def etag_de(*partes):
+    """ETag forte a partir dos componentes que determinam o conteúdo"""
+    return hashlib.sha1(repr(partes).encode("utf-8")).hexdigest()
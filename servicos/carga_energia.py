@@ -0,0 +1,152 @@
+# ==========================================================
+# CARGA EM MASSA DE ENERGY_DATA (COPY FROM STDIN)
+# ==========================================================
+# Caminho de escrita sem passar pelo unit of work do ORM.
+#   • PostgreSQL + psycopg2 → COPY ... FROM STDIN (CSV em streaming)
+#   • PostgreSQL sem COPY   → psycopg2.extras.execute_values
+#   • Outros bancos         → executemany do SQLAlchemy
+# As funções não fazem commit: quem chama controla a transação.
+
+import csv
+import io
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert
+
+COLUNAS_ENERGIA = ("pzem_id", "voltage", "current", "power", "energy", "frequency", "pf", "timestamp", "delta_kwh")
+
+
+class _LeitorCSV(io.TextIOBase):
+    """Objeto tipo ficheiro que gera o CSV sob demanda para o copy_expert"""
+
+    def __init__(self, registros, colunas):
+        self._registros = iter(registros)
+        self._colunas = colunas
+        self._buffer = ""
+        self._saida = io.StringIO()
+        self._escritor = csv.writer(self._saida, lineterminator="\n")
+        self.total = 0
+
+    def readable(self):
+        return True
+
+    def _proxima_linha(self):
+        registro = next(self._registros, None)
+        if registro is None:
+            return None
+
+        self._escritor.writerow([_valor_csv(registro.get(c)) for c in self._colunas])
+        linha = self._saida.getvalue()
+        self._saida.seek(0)
+        self._saida.truncate(0)
+        self.total += 1
+        return linha
+
+    def read(self, tamanho=-1):
+        if tamanho is None or tamanho < 0:
+            partes = [self._buffer]
+            while (linha := self._proxima_linha()) is not None:
+                partes.append(linha)
+            self._buffer = ""
+            return "".join(partes)
+
+        while len(self._buffer) < tamanho:
+            linha = self._proxima_linha()
+            if linha is None:
+                break
+            self._buffer += linha
+
+        dados, self._buffer = self._buffer[:tamanho], self._buffer[tamanho:]
+        return dados
+
+
+def _valor_csv(valor):
+    # Campo vazio sem aspas = NULL no COPY em modo CSV
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return valor.replace(tzinfo=None).isoformat(sep=" ")
+    return valor
+
+
+def _em_blocos(registros, tamanho):
+    iterador = iter(registros)
+    while bloco := list(islice(iterador, tamanho)):
+        yield bloco
+
+
+def _usa_psycopg2(conexao):
+    return conexao.dialect.name == "postgresql" and conexao.dialect.driver == "psycopg2"
+
+
+def copiar_registros(conexao, tabela, registros, colunas=COLUNAS_ENERGIA):
+    """COPY FROM STDIN dos registros (dicts) na transação da conexão; devolve o total"""
+    leitor = _LeitorCSV(registros, colunas)
+    sql = f"COPY {tabela.name} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = conexao.connection.cursor()
+    try:
+        cursor.copy_expert(sql, leitor, size=64 * 1024)
+    finally:
+        cursor.close()
+    return leitor.total
+
+
+def inserir_execute_values(conexao, tabela, registros, colunas=COLUNAS_ENERGIA, tamanho_pagina=1000):
+    """INSERT multi-linha com psycopg2.extras.execute_values; devolve o total"""
+    from psycopg2.extras import execute_values
+
+    sql = f"INSERT INTO {tabela.name} ({', '.join(colunas)}) VALUES %s"
+    total = 0
+    cursor = conexao.connection.cursor()
+    try:
+        for bloco in _em_blocos(registros, tamanho_pagina):
+            execute_values(cursor, sql, [tuple(r.get(c) for c in colunas) for r in bloco], page_size=tamanho_pagina)
+            total += len(bloco)
+    finally:
+        cursor.close()
+    return total
+
+
+def inserir_executemany(conexao, tabela, registros, tamanho_bloco=1000):
+    """executemany genérico do SQLAlchemy (SQLite e outros); devolve o total"""
+    total = 0
+    for bloco in _em_blocos(registros, tamanho_bloco):
+        conexao.execute(insert(tabela), bloco)
+        total += len(bloco)
+    return total
+
+
+def gravar_registros(conexao, tabela, registros, colunas=COLUNAS_ENERGIA):
+    """Escolhe o caminho mais rápido para o banco da conexão; devolve (total, metodo)"""
+    if not _usa_psycopg2(conexao):
+        return inserir_executemany(conexao, tabela, registros), "executemany"
+
+    # Materializa para poder repetir no fallback se o COPY falhar
+    if not isinstance(registros, (list, tuple)):
+        registros = list(registros)
+
+    try:
+        with conexao.begin_nested():
+            return copiar_registros(conexao, tabela, registros, colunas), "copy"
+    except Exception as e:
+        print(f"⚠️ COPY indisponível ({e}) - usando execute_values")
+
+    return inserir_execute_values(conexao, tabela, registros, colunas), "execute_values"
+
+
+def ler_csv_energia(ficheiro):
+    """Lê um CSV com cabeçalho (colunas de COLUNAS_ENERGIA, sem delta_kwh) e gera registros prontos a gravar"""
+    for linha in csv.DictReader(ficheiro):
+        yield {
+            "pzem_id": int(linha["pzem_id"]),
+            "voltage": float(linha.get("voltage") or 0),
+            "current": float(linha.get("current") or 0),
+            "power": float(linha.get("power") or 0),
+            "energy": float(linha.get("energy") or 0),
+            "frequency": float(linha.get("frequency") or 0),
+            "pf": float(linha.get("pf") or 0),
+            "timestamp": datetime.fromisoformat(linha["timestamp"].replace("Z", "+00:00")).replace(tzinfo=None),
+            "delta_kwh": None  # calculado na gravação (contador normalizado)
+        }
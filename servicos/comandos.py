@@ -0,0 +1,312 @@
+# ==========================================================
+# FILA DURÁVEL DE COMANDOS PARA O ESP (comandos_reles)
+# ==========================================================
+# • Tabela = fonte da verdade; qualquer worker entrega qualquer comando.
+# • Um comando novo para o mesmo relé substitui os que ainda estão
+#   abertos (last write wins) → o ESP nunca executa ON/OFF obsoletos.
+# • Entrega com UPDATE otimista (WHERE estado = lido) → dois workers
+#   nunca entregam o mesmo comando na mesma ronda.
+# • Confirmação: explícita (ids que o ESP executou, ecoados em `ack`) ou
+#   implícita quando o ESP reporta o relé já no estado pedido;
+#   entregues sem confirmação são reenviados.
+# • Índice partilhado (estado ao vivo) com os comandos abertos: com a
+#   fila vazia o polling do ESP nem chega a consultar o banco.
+# • Long-poll: aguardar() segura o pedido até haver comando ou acabar a
+#   espera; acorda logo no mesmo worker (Condition) e, entre workers,
+#   vigia o índice partilhado a cada INTERVALO_VIGIA segundos.
+# As funções usam a sessão do chamador; enfileirar() não faz commit.
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, or_, update
+from sqlalchemy.orm import Session
+
+PADRAO_RELE = re.compile(r"^RELE(\d+)_(ON|OFF)$")
+ABERTOS = ("pendente", "entregue")
+CHAVE_INDICE = "comandos"
+INTERVALO_VIGIA = 0.25  # segundos entre leituras do índice durante o long-poll
+
+
+def interpretar_comando(comando):
+    """'RELE3_ON' → (3, True); comandos avulsos → (None, None)"""
+    correspondencia = PADRAO_RELE.match((comando or "").strip().upper())
+    if not correspondencia:
+        return None, None
+    return int(correspondencia.group(1)), correspondencia.group(2) == "ON"
+
+
+def comando_para_estado(rele_id, ligar):
+    return f"RELE{rele_id}_{'ON' if ligar else 'OFF'}"
+
+
+def filtro_abertos(m):
+    """Pendentes + entregues de relé ainda sem confirmação (avulsos fecham na entrega)"""
+    return or_(m.estado == "pendente", (m.estado == "entregue") & m.rele_id.isnot(None))
+
+
+class FilaComandos:
+    """Fila de comandos persistida em tabela com índice partilhado entre workers"""
+
+    def __init__(self, db, modelo, estado, validade_segundos=120,
+                 reentrega_segundos=10, varredura_segundos=30):
+        self.db = db
+        self.modelo = modelo
+        self.estado = estado
+        self.validade = timedelta(seconds=validade_segundos)
+        self.reentrega = timedelta(seconds=reentrega_segundos)
+        self.varredura = timedelta(seconds=varredura_segundos)
+        self._condicao = threading.Condition()
+
+        # O índice só muda depois do commit de quem enfileirou/confirmou
+        event.listen(Session, "after_commit", self._aplicar_indice)
+        event.listen(Session, "after_rollback", self._descartar_indice)
+
+    # ------------------------------------------------------
+    # ÍNDICE PARTILHADO
+    # ------------------------------------------------------
+    def _registar(self, abrir=(), fechar=()):
+        alteracoes = self.db.session.info.setdefault("comandos_indice", [])
+        alteracoes.append((dict(abrir), list(fechar)))
+
+    def _aplicar_indice(self, sessao):
+        alteracoes = sessao.info.pop("comandos_indice", None)
+        if not alteracoes:
+            return
+
+        def aplicar(indice):
+            abertos = indice.setdefault("abertos", {})
+            for abrir, fechar in alteracoes:
+                for comando_id in fechar:
+                    abertos.pop(str(comando_id), None)
+                for comando_id, rele_id in abrir.items():
+                    abertos[str(comando_id)] = rele_id
+            return indice
+
+        try:
+            self.estado.modificar(CHAVE_INDICE, aplicar)
+        except Exception as e:
+            # Índice é só um atalho: sem ele o próximo polling varre o banco
+            print(f"⚠️ Índice de comandos não atualizado ({e}) - forçando varredura")
+            self.estado.gravar(CHAVE_INDICE, {"abertos": {}, "varrido_em": None})
+
+        # Acorda long-polls deste worker (os outros veem o índice mudar)
+        with self._condicao:
+            self._condicao.notify_all()
+
+    def _descartar_indice(self, sessao):
+        sessao.info.pop("comandos_indice", None)
+
+    def _reconstruir_indice(self, agora):
+        """Junta ao índice o que o banco tem aberto; ids mais novos que a leitura
+        (enfileirados por outro worker entretanto) ficam como estão"""
+        m = self.modelo
+        maior_id = self.db.session.query(func.max(m.id)).scalar() or 0
+        lidos = {
+            str(c.id): c.rele_id
+            for c in m.query.filter(filtro_abertos(m), m.id <= maior_id).with_entities(m.id, m.rele_id)
+        }
+
+        def juntar(indice):
+            novos = {i: r for i, r in indice.get("abertos", {}).items() if int(i) > maior_id}
+            indice["abertos"] = {**lidos, **novos}
+            indice["varrido_em"] = agora
+            return indice
+
+        return self.estado.modificar(CHAVE_INDICE, juntar)["abertos"]
+
+    def ha_abertos(self):
+        return bool(self.estado.ler(CHAVE_INDICE).get("abertos"))
+
+    # ------------------------------------------------------
+    # ENFILEIRAR
+    # ------------------------------------------------------
+    def enfileirar(self, comando, origem="sistema"):
+        """Adiciona o comando à sessão atual (o commit do chamador torna-o visível ao ESP)"""
+        m = self.modelo
+        agora = datetime.utcnow()
+        comando = (comando or "").strip()
+        rele_id, _ = interpretar_comando(comando)
+        if rele_id is not None:
+            comando = comando.upper()
+
+        substituidos = []
+        if rele_id is not None:
+            substituidos = [
+                c.id for c in m.query.filter(m.rele_id == rele_id, m.estado.in_(ABERTOS)).with_entities(m.id)
+            ]
+            if substituidos:
+                self.db.session.execute(
+                    update(m).where(m.id.in_(substituidos), m.estado.in_(ABERTOS))
+                    .values(estado="substituido")
+                )
+
+        novo = m(
+            rele_id=rele_id,
+            comando=comando,
+            estado="pendente",
+            origem=origem,
+            criado_em=agora,
+            expira_em=agora + self.validade
+        )
+        self.db.session.add(novo)
+        self.db.session.flush()
+
+        self._registar(abrir={novo.id: rele_id}, fechar=substituidos)
+        if substituidos:
+            print(f"♻️ {comando} substitui {len(substituidos)} comando(s) aberto(s) do relé {rele_id}")
+        return novo
+
+    # ------------------------------------------------------
+    # ENTREGA AO ESP
+    # ------------------------------------------------------
+    def expirar(self, agora=None):
+        m = self.modelo
+        agora = agora or datetime.utcnow()
+        expirados = [
+            c.id for c in m.query.filter(filtro_abertos(m), m.expira_em < agora).with_entities(m.id)
+        ]
+        if expirados:
+            self.db.session.execute(
+                update(m).where(m.id.in_(expirados), m.estado.in_(ABERTOS)).values(estado="expirado")
+            )
+            self._registar(fechar=expirados)
+            print(f"⌛ {len(expirados)} comando(s) expirado(s) sem confirmação do ESP")
+        return expirados
+
+    def entregar(self, limite=1):
+        """Reserva até `limite` comandos (None = todos) para o ESP (pendentes e reenvios vencidos) e faz commit"""
+        agora = datetime.utcnow()
+        indice = self.estado.ler(CHAVE_INDICE)
+        varrido_em = indice.get("varrido_em")
+        if not indice.get("abertos") and varrido_em and agora - varrido_em < self.varredura:
+            return []
+
+        m = self.modelo
+        try:
+            self.expirar(agora)
+
+            candidatos = m.query.filter(
+                or_(
+                    m.estado == "pendente",
+                    (m.estado == "entregue") & m.rele_id.isnot(None) & (m.entregue_em < agora - self.reentrega)
+                )
+            ).order_by(m.id).limit(limite).all()
+
+            entregues = []
+            for c in candidatos:
+                # UPDATE otimista: só fica com o comando quem mudar a linha
+                resultado = self.db.session.execute(
+                    update(m).where(
+                        m.id == c.id,
+                        m.estado == c.estado,
+                        m.tentativas == c.tentativas
+                    ).values(
+                        estado="entregue",
+                        entregue_em=agora,
+                        tentativas=m.tentativas + 1
+                    ).execution_options(synchronize_session=False)
+                )
+                if resultado.rowcount == 1:
+                    entregues.append({"id": c.id, "comando": c.comando, "rele_id": c.rele_id})
+
+            # Comandos avulsos não têm confirmação: fecham ao serem entregues
+            self._registar(fechar=[e["id"] for e in entregues if e["rele_id"] is None])
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+        if not varrido_em or agora - varrido_em >= self.varredura or not candidatos:
+            self._reconstruir_indice(agora)
+
+        return entregues
+
+    def aguardar(self, espera, limite=None):
+        """Long-poll: entrega os comandos disponíveis ou espera até `espera` segundos por um"""
+        fim = time.monotonic() + espera
+        entregues = self.entregar(limite)
+        visto = self.estado.ler(CHAVE_INDICE).get("abertos")
+        ultima_consulta = time.monotonic()
+
+        while not entregues:
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                break
+
+            with self._condicao:
+                self._condicao.wait(min(restante, INTERVALO_VIGIA))
+
+            # Só volta ao banco se o índice mudou ou se pode haver reenvio vencido
+            abertos = self.estado.ler(CHAVE_INDICE).get("abertos")
+            if abertos != visto or time.monotonic() - ultima_consulta >= self.reentrega.total_seconds():
+                entregues = self.entregar(limite)
+                visto = self.estado.ler(CHAVE_INDICE).get("abertos")
+                ultima_consulta = time.monotonic()
+
+        return entregues
+
+    # ------------------------------------------------------
+    # CONFIRMAÇÃO
+    # ------------------------------------------------------
+    def confirmar_estados(self, reles):
+        """Confirmação implícita: [{'id': 1, 'estado': True}, ...] vindo do ESP (sem commit)"""
+        m = self.modelo
+        agora = datetime.utcnow()
+        confirmados = []
+
+        for r in reles or []:
+            try:
+                rele_id = int(r["id"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if "estado" not in r:
+                continue
+
+            comando = comando_para_estado(rele_id, bool(r["estado"]))
+            confirmados.extend(self.db.session.execute(
+                update(m).where(m.rele_id == rele_id, m.comando == comando, m.estado.in_(ABERTOS))
+                .values(estado="confirmado", confirmado_em=agora)
+                .returning(m.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all())
+
+        if confirmados:
+            self._registar(fechar=confirmados)
+        return confirmados
+
+    def confirmar_ids(self, ids):
+        """Confirmação explícita de comandos entregues; devolve os ids que estavam
+        mesmo entregues (pendentes, substituídos e repetidos ficam como estão). Sem commit."""
+        m = self.modelo
+        ids = [int(i) for i in ids or []]
+        if not ids:
+            return []
+        confirmados = self.db.session.execute(
+            update(m).where(m.id.in_(ids), m.estado == "entregue")
+            .values(estado="confirmado", confirmado_em=datetime.utcnow())
+            .returning(m.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if confirmados:
+            self._registar(fechar=confirmados)
+        return confirmados
+
+    # ------------------------------------------------------
+    # CONSULTA
+    # ------------------------------------------------------
+    def reles_aguardando(self):
+        """Relés com comando ainda por executar (o estado reportado pelo ESP está desatualizado)"""
+        m = self.modelo
+        return {
+            c.rele_id for c in m.query.filter(
+                m.estado.in_(ABERTOS), m.rele_id.isnot(None)
+            ).with_entities(m.rele_id)
+        }
+
+    def abertos(self):
+        """Comandos ainda não confirmados/expirados, do mais antigo para o mais novo"""
+        m = self.modelo
+        return m.query.filter(filtro_abertos(m)).order_by(m.id).all()
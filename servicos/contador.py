@@ -0,0 +1,180 @@
+# ==========================================================
+# CONTADOR DE ENERGIA DOS PZEMs → CONSUMO NORMALIZADO (delta_kwh)
+# ==========================================================
+# energy do PZEM é um contador acumulado: pode reiniciar (reset no
+# ESP/PZEM, troca do módulo), dar a volta em 9999.99 kWh (rollover) ou
+# trazer leituras erradas isoladas (glitch). Cada amostra gravada leva
+# delta_kwh = consumo desde a amostra anterior do mesmo PZEM:
+# • normal     → energy - anterior (se plausível para a potência máxima
+#                no intervalo decorrido);
+# • rollover   → (rollover - anterior) + energy, com anterior perto do fim;
+# • reinicio   → energy (contador recomeçou do zero);
+# • glitch     → 0, e a base mantém-se; a mesma leitura "impossível"
+#                confirmada `confirmacoes` vezes vira a nova base;
+# • fora de ordem (mais antiga que a última) → 0.
+# O estado (última leitura e total normalizado por PZEM) fica no estado
+# ao vivo partilhado, com uma `versao`. Gravar um lote:
+#   calcular()  → deltas sobre uma cópia do estado (nada é alterado);
+#   reservar()  → troca atómica só se a versão ainda é a lida (senão
+#                 ConflitoContador: outro worker avançou → recalcular);
+#   desfazer()  → se o commit do banco falhar, repõe o estado lido, e a
+#                 nova tentativa do lote dá exatamente os mesmos deltas.
+# Assim dois workers nunca contam o mesmo intervalo e o contador só fica
+# adiantado enquanto as linhas estão a ser gravadas. Somas de consumo =
+# somas de delta_kwh (rollups, relatórios) e o saldo desconta o `total`.
+
+from datetime import datetime, timezone
+
+TOLERANCIA_KWH = 0.002  # arredondamento do PZEM (0.001 kWh) + folga
+
+
+class ConflitoContador(RuntimeError):
+    """O estado do contador mudou entre calcular() e reservar()"""
+
+
+def _epoch(ts):
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class NormalizadorContador:
+    """Calcula delta_kwh de cada amostra a partir do contador acumulado do PZEM"""
+
+    def __init__(self, estado, rollover_kwh=10000.0, potencia_maxima_w=25000.0, confirmacoes=3,
+                 total_inicial=None):
+        self.estado = estado
+        self.rollover_kwh = float(rollover_kwh)
+        self.potencia_maxima_kw = float(potencia_maxima_w) / 1000
+        self.confirmacoes = max(1, int(confirmacoes))
+        self.total_inicial = total_inicial  # funcao(pzem_id) → total já contado (estado perdido)
+        self.estatisticas = {}
+
+    @staticmethod
+    def chave(pzem_id):
+        return f"contador_pzem{pzem_id}"
+
+    def _limite(self, segundos):
+        """Maior consumo plausível em `segundos` (potência máxima do PZEM + 20%)"""
+        return self.potencia_maxima_kw * max(segundos, 1.0) / 3600 * 1.2 + TOLERANCIA_KWH
+
+    def _classificar(self, atual, energia, ts):
+        """(evento, delta_kwh) da amostra; atualiza `atual` (estado do PZEM) no lugar"""
+        anterior = atual.get("energia")
+        if anterior is None:
+            atual.update(energia=energia, ts=ts, suspeita=None, vezes=0)
+            return "base", 0.0
+        if ts < atual["ts"]:
+            return "fora_de_ordem", 0.0
+
+        limite = self._limite(ts - atual["ts"])
+        diferenca = energia - anterior
+
+        if 0 <= diferenca <= limite:
+            evento, delta = "normal", diferenca
+        elif -TOLERANCIA_KWH <= diferenca < 0:
+            # Oscilação de arredondamento: nada consumido, base não recua
+            atual.update(ts=ts, suspeita=None, vezes=0)
+            return "normal", 0.0
+        elif diferenca < 0 and (self.rollover_kwh - anterior) + energia <= limite:
+            evento, delta = "rollover", (self.rollover_kwh - anterior) + energia
+        elif diferenca < 0 and energia <= limite:
+            evento, delta = "reinicio", energia
+        else:
+            # Salto impossível para o tempo decorrido: só vira base se se repetir
+            suspeita = atual.get("suspeita")
+            if suspeita is not None and abs(energia - suspeita) <= limite:
+                atual["vezes"] = atual.get("vezes", 0) + 1
+            else:
+                atual["vezes"] = 1
+            atual["suspeita"] = energia
+            if atual["vezes"] < self.confirmacoes:
+                return "glitch", 0.0
+            evento, delta = "nova_base", 0.0
+
+        atual.update(energia=energia, ts=ts, suspeita=None, vezes=0)
+        return evento, delta
+
+    def calcular(self, registros):
+        """Preenche r["delta_kwh"] em cada registro (dicts de EnergyData) sem alterar o estado;
+        devolve o lançamento {pzem_id: (estado_lido, estado_novo, eventos)} para reservar()"""
+        por_pzem = {}
+        for r in registros:
+            por_pzem.setdefault(int(r["pzem_id"]), []).append(r)
+
+        lancamento = {}
+        for pzem_id, linhas in por_pzem.items():
+            linhas.sort(key=lambda r: _epoch(r["timestamp"]))
+            lido = self.estado.ler(self.chave(pzem_id))
+            atual = dict(lido, versao=lido.get("versao", 0))
+            if "total" not in atual:
+                atual["total"] = float(self.total_inicial(pzem_id) or 0.0) if self.total_inicial else 0.0
+
+            eventos = []
+            for r in linhas:
+                evento, delta = self._classificar(atual, float(r.get("energy") or 0), _epoch(r["timestamp"]))
+                r["delta_kwh"] = round(delta, 6)
+                atual["total"] += delta
+                eventos.append((evento, r))
+            atual["versao"] += 1
+            lancamento[pzem_id] = (lido, atual, eventos)
+        return lancamento
+
+    def reservar(self, lancamento):
+        """Grava os estados novos se ninguém mexeu desde calcular(); senão ConflitoContador"""
+        reservados = {}
+        for pzem_id, (lido, novo, _) in lancamento.items():
+            trocado = []
+
+            def trocar(atual):
+                trocado.clear()
+                if atual.get("versao", 0) != novo["versao"] - 1:
+                    return None
+                trocado.append(True)
+                return novo
+
+            self.estado.modificar(self.chave(pzem_id), trocar)
+            if not trocado:
+                self.desfazer(reservados)
+                self.estatisticas["conflitos"] = self.estatisticas.get("conflitos", 0) + 1
+                raise ConflitoContador(f"Contador do PZEM{pzem_id} alterado por outro worker")
+            reservados[pzem_id] = lancamento[pzem_id]
+
+        for pzem_id, (_, _, eventos) in lancamento.items():
+            for evento, r in eventos:
+                self.estatisticas[evento] = self.estatisticas.get(evento, 0) + 1
+                if evento not in ("normal", "base", "fora_de_ordem"):
+                    print(f"⚠️ Contador PZEM{pzem_id}: {evento} (energy={r.get('energy')}, delta={r['delta_kwh']:.3f} kWh)")
+
+    def desfazer(self, lancamento):
+        """Repõe o estado lido (lote não gravado); só se ainda for o que reservar() deixou"""
+        for pzem_id, (lido, novo, _) in lancamento.items():
+            def repor(atual):
+                return lido if atual.get("versao") == novo["versao"] else None
+            self.estado.modificar(self.chave(pzem_id), repor)
+
+    def processar(self, registros, tentativas=3):
+        """calcular() + reservar() (sem banco pelo meio); devolve {pzem_id: total}"""
+        for tentativa in range(tentativas):
+            lancamento = self.calcular(registros)
+            try:
+                self.reservar(lancamento)
+            except ConflitoContador:
+                if tentativa == tentativas - 1:
+                    raise
+                continue
+            return {pzem_id: novo["total"] for pzem_id, (_, novo, _) in lancamento.items()}
+
+    def totais(self, pzems):
+        """{pzem_id: total normalizado} dos PZEMs que já têm contador"""
+        totais = {}
+        for pzem_id in pzems:
+            atual = self.estado.ler(self.chave(pzem_id))
+            if "total" in atual:
+                totais[pzem_id] = atual["total"]
+        return totais
+
+    def status(self):
+        return dict(self.estatisticas)
@@ -0,0 +1,203 @@
+# ==========================================================
+# MOTOR DE CONTROLO AUTOMÁTICO DOS RELÉS (LIMIARES ORDENADOS)
+# ==========================================================
+# Um relé automático deve estar ligado com saldo > limite_individual e
+# desligado com saldo <= limite_individual. Em vez de ler e percorrer
+# todos os relés a cada leitura:
+# • os relés automáticos ficam em memória, ordenados pelo limite, e só
+#   são relidos quando a versão "reles" muda (qualquer worker);
+# • entre duas leituras de saldo só podem mudar os relés cujo limite
+#   está entre o saldo anterior e o atual → bisect no índice ordenado;
+# • relés que ainda não puderam ser tratados (proteção manual, cache
+#   acabado de carregar) ficam em `pendentes` e são revistos a seguir;
+# • todas as mudanças, logs (ReleLog) e comandos para o ESP vão numa só
+#   transação, com as linhas dos relés bloqueadas (dois workers nunca
+#   geram o mesmo comando).
+# Custo por leitura: O(log n + mudanças), sem consultas quando nada muda.
+#
+# Anti-oscilação (por relé, NULL = padrão do sistema):
+# • histerese_kwh: desliga com saldo <= limite, mas só volta a ligar com
+#   saldo > limite + histerese (dois limiares por relé no índice);
+# • tempo_minimo_ligado / tempo_minimo_desligado (s): permanência mínima
+#   num estado, contada desde estado_alterado_em (última mudança real;
+#   NULL = nunca mudou → sem espera), antes de o motor o trocar (o relé
+#   fica pendente até lá); saldo esgotado (<= 0) desliga sempre.
+
+import os
+from bisect import bisect_left
+from datetime import datetime
+
+
+class MotorReles:
+    """Liga/desliga os relés automáticos quando o saldo cruza o limite de cada um"""
+
+    def __init__(self, db, modelo, modelo_log, versoes, fila_comandos, protecao_manual=30,
+                 histerese_kwh=0.0, tempo_minimo_ligado=0, tempo_minimo_desligado=0):
+        self.db = db
+        self.modelo = modelo
+        self.modelo_log = modelo_log
+        self.versoes = versoes
+        self.fila_comandos = fila_comandos
+        self.protecao_manual = float(protecao_manual)  # s sem mexer num relé alterado à mão
+        self.histerese_kwh = float(histerese_kwh)
+        self.tempo_minimo_ligado = float(tempo_minimo_ligado)
+        self.tempo_minimo_desligado = float(tempo_minimo_desligado)
+        self._pid = None
+        self._versao = None
+        self._reles = {}  # id → dict do relé automático
+        self._limiares = []  # [(limite, id)] e [(limite + histerese, id)], ordenado
+        self._saldo = None  # último saldo já tratado
+        self._pendentes = set()
+        self.estatisticas = {"verificacoes": 0, "recargas_cache": 0, "mudancas": 0}
+
+    # ------------------------------------------------------
+    # CACHE DOS RELÉS AUTOMÁTICOS
+    # ------------------------------------------------------
+    def _atualizar_cache(self):
+        versao = self.versoes.atuais().get("reles")
+        if self._pid == os.getpid() and versao == self._versao:
+            return
+
+        m = self.modelo
+        linhas = self.db.session.query(
+            m.id, m.nome, m.estado, m.limite_individual, m.ultima_alteracao_manual,
+            m.estado_alterado_em, m.histerese_kwh, m.tempo_minimo_ligado, m.tempo_minimo_desligado
+        ).filter(m.modo_automatico.is_(True), m.limite_individual.isnot(None)).all()
+
+        self._reles = {linha.id: self._preparar(dict(linha._mapping)) for linha in linhas}
+        self._limiares = sorted(
+            (limiar, r["id"]) for r in self._reles.values() for limiar in {r["limite_individual"], r["limite_ligar"]}
+        )
+        self._pendentes = set(self._reles)  # estado lido de novo → rever todos uma vez
+        self._versao, self._pid = versao, os.getpid()
+        self.estatisticas["recargas_cache"] += 1
+
+    def _preparar(self, rele):
+        """Aplica os padrões do sistema às colunas anti-oscilação vazias"""
+        histerese = self.histerese_kwh if rele["histerese_kwh"] is None else rele["histerese_kwh"]
+        rele["limite_ligar"] = rele["limite_individual"] + max(histerese, 0.0)
+        rele["minimo_ligado"] = self.tempo_minimo_ligado if rele["tempo_minimo_ligado"] is None else rele["tempo_minimo_ligado"]
+        rele["minimo_desligado"] = (self.tempo_minimo_desligado if rele["tempo_minimo_desligado"] is None
+                                    else rele["tempo_minimo_desligado"])
+        return rele
+
+    def limites(self):
+        """Limiares (kWh) dos relés automáticos: desligar e voltar a ligar"""
+        self._atualizar_cache()
+        return [limite for limite, _ in self._limiares]
+
+    def _cruzados(self, antes, depois):
+        """Ids dos relés com limite entre os dois saldos (o estado desejado pode ter mudado)"""
+        if antes is None or antes == depois:
+            return set()
+        baixo, alto = min(antes, depois), max(antes, depois)
+        inicio = bisect_left(self._limiares, (baixo, -1))
+        fim = bisect_left(self._limiares, (alto, -1))
+        return {rele_id for _, rele_id in self._limiares[inicio:fim]}
+
+    # ------------------------------------------------------
+    # DECISÃO
+    # ------------------------------------------------------
+    @staticmethod
+    def desejado(rele, saldo):
+        """Ligado continua até saldo <= limite; desligado só liga acima de limite + histerese"""
+        if rele["estado"]:
+            return saldo > rele["limite_individual"]
+        return saldo > rele["limite_ligar"]
+
+    def _protegido(self, rele, agora):
+        ultima = rele.get("ultima_alteracao_manual")
+        return ultima is not None and (agora - ultima).total_seconds() < self.protecao_manual
+
+    @staticmethod
+    def _em_permanencia(rele, agora, saldo):
+        """Ainda dentro do tempo mínimo no estado atual?"""
+        if rele["estado"] and saldo <= 0:
+            return False  # sem saldo desliga sempre
+        mudou_em = rele.get("estado_alterado_em")
+        if mudou_em is None:
+            return False
+        minimo = rele["minimo_ligado"] if rele["estado"] else rele["minimo_desligado"]
+        return (agora - mudou_em).total_seconds() < minimo
+
+    def _decidir(self, saldo, agora):
+        """{id: estado_novo} dos relés a mudar; atualiza os pendentes"""
+        mudancas = {}
+        for rele_id in self._pendentes | self._cruzados(self._saldo, saldo):
+            rele = self._reles.get(rele_id)
+            if rele is None:
+                self._pendentes.discard(rele_id)
+                continue
+            estado = self.desejado(rele, saldo)
+            if bool(rele["estado"]) == estado:
+                self._pendentes.discard(rele_id)
+            elif self._protegido(rele, agora) or self._em_permanencia(rele, agora, saldo):
+                self._pendentes.add(rele_id)  # revisto quando a proteção/permanência acabar
+            else:
+                mudancas[rele_id] = estado
+        return mudancas
+
+    # ------------------------------------------------------
+    # APLICAÇÃO (UMA TRANSAÇÃO)
+    # ------------------------------------------------------
+    def _aplicar(self, mudancas, saldo, agora):
+        m = self.modelo
+        sessao = self.db.session
+        reles = sessao.query(m).filter(m.id.in_(list(mudancas))).with_for_update().all()
+
+        aplicadas = []
+        for rele in reles:
+            estado = mudancas[rele.id]
+            # Relido com a linha bloqueada: outro worker (ou o utilizador) pode ter mudado entretanto
+            if not rele.modo_automatico or bool(rele.estado) == estado:
+                continue
+            rele.estado = estado  # marca estado_alterado_em (evento do modelo)
+            sessao.add(self.modelo_log(
+                rele_id=rele.id, estado_anterior=not estado, estado_novo=estado,
+                motivo="saldo_suficiente" if estado else "saldo_baixo",
+                modo_operacao="automatico", saldo_kwh=saldo, timestamp=agora
+            ))
+            self.fila_comandos.enfileirar(f"RELE{rele.id}_{'ON' if estado else 'OFF'}", origem="automatico")
+            # Copiado antes do commit (que expira os objetos da sessão)
+            aplicadas.append({"id": rele.id, "nome": rele.nome, "estado": estado,
+                              "limite_individual": rele.limite_individual})
+
+        sessao.commit()
+        return aplicadas
+
+    def controlar(self, saldo, rever_todos=False):
+        """Aplica ao saldo atual; devolve [{id, nome, estado, limite_individual}] dos relés alterados"""
+        self.estatisticas["verificacoes"] += 1
+        self._atualizar_cache()
+        if rever_todos:
+            self._pendentes.update(self._reles)
+        agora = datetime.utcnow()
+        saldo = float(saldo or 0.0)
+
+        mudancas = self._decidir(saldo, agora)
+        aplicadas = []
+        if mudancas:
+            try:
+                aplicadas = self._aplicar(mudancas, saldo, agora)
+            except Exception:
+                self.db.session.rollback()
+                self._pendentes.update(mudancas)  # tentar de novo na próxima leitura
+                raise
+
+            for rele in aplicadas:
+                self._reles[rele["id"]].update(estado=rele["estado"], estado_alterado_em=agora)
+                acao = "🟢 LIGADO" if rele["estado"] else "⚠️ DESLIGADO"
+                print(f"{acao} '{rele['nome']}' — SALDO({saldo:.2f}) vs LIMITE({rele['limite_individual']})")
+            self._pendentes.difference_update(mudancas)
+            self.estatisticas["mudancas"] += len(aplicadas)
+
+        self._saldo = saldo
+        return aplicadas
+
+    def tem_pendentes(self):
+        """Há relés à espera (permanência, proteção manual) a rever mesmo sem o saldo mudar?"""
+        return bool(self._pendentes)
+
+    def status(self):
+        return {**self.estatisticas, "reles_automaticos": len(self._reles),
+                "pendentes": sorted(self._pendentes), "saldo": self._saldo}
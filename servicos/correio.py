@@ -0,0 +1,115 @@
+# ==========================================================
+# POOL DE CONEXÕES SMTP (KEEP-ALIVE)
+# ==========================================================
+# Abrir SMTP + STARTTLS + LOGIN custa vários round-trips (e o Gmail
+# limita logins): as conexões autenticadas ficam abertas e são
+# reutilizadas pelos envios seguintes.
+# • no máximo `tamanho` conexões em uso ao mesmo tempo;
+# • conexão ociosa há mais de `ocioso_maximo` s é fechada antes de
+#   reutilizar (o servidor costuma derrubá-la) e as restantes recebem
+#   NOOP para confirmar que ainda estão vivas;
+# • servidor fechou a conexão a meio → reabre e tenta uma vez mais;
+# • credenciais mudaram → as conexões antigas são descartadas.
+
+import smtplib
+import threading
+import time
+
+
+class PoolSMTP:
+    """Conexões SMTP autenticadas reutilizáveis, por (servidor, porta, utilizador)"""
+
+    def __init__(self, tamanho=2, ocioso_maximo=240, timeout=15):
+        self.tamanho = max(1, int(tamanho))
+        self.ocioso_maximo = float(ocioso_maximo)
+        self.timeout = timeout
+        self._vagas = threading.BoundedSemaphore(self.tamanho)
+        self._ociosas = []  # [(chave, conexão, devolvida_em)]
+        self._lock = threading.Lock()
+        self.estatisticas = {"envios": 0, "conexoes_abertas": 0, "reutilizacoes": 0}
+
+    @staticmethod
+    def _chave(config):
+        return (config.smtp_server, int(config.smtp_port or 587), config.email_sender, config.email_password)
+
+    def _abrir(self, chave):
+        servidor, porta, utilizador, senha = chave
+        if porta == 465:
+            conexao = smtplib.SMTP_SSL(servidor, porta, timeout=self.timeout)
+        else:
+            conexao = smtplib.SMTP(servidor, porta, timeout=self.timeout)
+            conexao.starttls()
+        conexao.login(utilizador, senha)
+        self.estatisticas["conexoes_abertas"] += 1
+        return conexao
+
+    @staticmethod
+    def _fechar(conexao):
+        try:
+            conexao.quit()
+        except Exception:
+            try:
+                conexao.close()
+            except Exception:
+                pass
+
+    def _obter(self, chave):
+        """Conexão ociosa ainda viva para a chave ou uma nova"""
+        agora = time.monotonic()
+        with self._lock:
+            descartar = [o for o in self._ociosas if o[0] != chave or agora - o[2] > self.ocioso_maximo]
+            self._ociosas = [o for o in self._ociosas if o not in descartar]
+            reutilizavel = self._ociosas.pop() if self._ociosas else None
+
+        for _, conexao, _ in descartar:
+            self._fechar(conexao)
+
+        if reutilizavel:
+            conexao = reutilizavel[1]
+            try:
+                if conexao.noop()[0] == 250:
+                    self.estatisticas["reutilizacoes"] += 1
+                    return conexao, True
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._fechar(conexao)
+
+        return self._abrir(chave), False
+
+    def _devolver(self, chave, conexao):
+        with self._lock:
+            self._ociosas.append((chave, conexao, time.monotonic()))
+
+    def enviar(self, config, destinatarios, mensagem):
+        """Envia `mensagem` (email.message) de config.email_sender para `destinatarios`"""
+        chave = self._chave(config)
+        with self._vagas:
+            for tentativa in (1, 2):
+                conexao, reutilizada = self._obter(chave)
+                try:
+                    conexao.sendmail(config.email_sender, destinatarios, mensagem.as_string())
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    self._fechar(conexao)
+                    # Só vale repetir se a conexão vinha do pool (pode ter expirado do lado do servidor)
+                    if reutilizada and tentativa == 1:
+                        print(f"🔌 Conexão SMTP reutilizada caiu ({e}) - reabrindo")
+                        continue
+                    raise
+                except Exception:
+                    self._fechar(conexao)
+                    raise
+
+                self._devolver(chave, conexao)
+                self.estatisticas["envios"] += 1
+                return
+
+    def fechar_todas(self):
+        with self._lock:
+            ociosas, self._ociosas = self._ociosas, []
+        for _, conexao, _ in ociosas:
+            self._fechar(conexao)
+
+    def status(self):
+        with self._lock:
+            ociosas = len(self._ociosas)
+        return {**self.estatisticas, "ociosas": ociosas, "tamanho": self.tamanho}
@@ -0,0 +1,185 @@
+# ==========================================================
+# ENVIO PARA O TELEGRAM (SESSÃO PARTILHADA + LIMITE DE TAXA)
+# ==========================================================
+# • Uma requests.Session por worker com pool de conexões: os alertas
+#   reutilizam a mesma conexão TLS a api.telegram.org.
+# • Balde de tokens por chat (o Telegram aceita ~1 msg/s por chat e
+#   20 msg/min em grupos) e outro global do bot (~30 msg/s).
+# • Rajada de alertas → juntar_mensagens() funde-os no menor número de
+#   mensagens de até 4096 caracteres.
+# • 429 (retry_after curto) → espera e repete uma vez; longo → lança
+#   exceção e o despachante agenda nova tentativa.
+# • cliente="python-telegram-bot" usa telegram.Bot (v13) em vez de
+#   requests; se a biblioteca não estiver disponível cai para requests.
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LIMITE_MENSAGEM = 4096
+URL_API = "https://api.telegram.org"
+
+
+class LimiteTaxaTelegram(RuntimeError):
+    """O Telegram (ou o balde local) pediu para esperar mais do que vale a pena segurar a thread"""
+
+    def __init__(self, espera):
+        super().__init__(f"Limite de taxa do Telegram: tentar de novo em {espera:.0f}s")
+        self.espera = espera
+
+
+class BaldeTokens:
+    """Token bucket: `taxa` tokens/s até `capacidade`; reservar() devolve quanto esperar"""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade)
+        self._tokens = self.capacidade
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        with self._lock:
+            agora = time.monotonic()
+            self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+            self._ultimo = agora
+            # Saldo negativo = tokens já prometidos a quem está à espera (ordem de chegada)
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.taxa
+
+    def devolver(self):
+        with self._lock:
+            self._tokens = min(self.capacidade, self._tokens + 1)
+
+
+def juntar_mensagens(mensagens, limite=LIMITE_MENSAGEM, separador="\n\n"):
+    """Funde mensagens na ordem em blocos de até `limite` caracteres"""
+    blocos = []
+    for mensagem in mensagens:
+        mensagem = mensagem[:limite]
+        if blocos and len(blocos[-1]) + len(separador) + len(mensagem) <= limite:
+            blocos[-1] += separador + mensagem
+        else:
+            blocos.append(mensagem)
+    return blocos
+
+
+class EnviadorTelegram:
+    """sendMessage com conexões reutilizadas, limite de taxa por chat e fusão de rajadas"""
+
+    def __init__(self, mensagens_por_minuto_chat=20, rajada_chat=3, mensagens_por_segundo=30,
+                 espera_maxima=30, tamanho_pool=4, cliente="requests", parse_mode="Markdown"):
+        self.mensagens_por_minuto_chat = float(mensagens_por_minuto_chat)
+        self.rajada_chat = rajada_chat
+        self.espera_maxima = float(espera_maxima)
+        self.tamanho_pool = int(tamanho_pool)
+        self.parse_mode = parse_mode
+        self.cliente = cliente
+        self._global = BaldeTokens(mensagens_por_segundo, mensagens_por_segundo)
+        self._chats = {}
+        self._bots = {}
+        self._sessao_pid = None
+        self._sessao = None
+        self._lock = threading.Lock()
+        self.estatisticas = {"mensagens": 0, "alertas": 0, "esperas_taxa": 0, "erros_429": 0}
+
+        if cliente == "python-telegram-bot":
+            try:
+                import telegram  # noqa: F401  (python-telegram-bot v13)
+            except ImportError as e:
+                print(f"⚠️ python-telegram-bot indisponível ({e}) - usando requests")
+                self.cliente = "requests"
+
+    # ------------------------------------------------------
+    # CLIENTES HTTP
+    # ------------------------------------------------------
+    def _obter_sessao(self):
+        """Session por processo (não partilhar sockets entre workers depois do fork)"""
+        if self._sessao_pid != os.getpid():
+            with self._lock:
+                if self._sessao_pid != os.getpid():
+                    sessao = requests.Session()
+                    sessao.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.tamanho_pool))
+                    self._sessao, self._sessao_pid = sessao, os.getpid()
+                    self._bots = {}
+        return self._sessao
+
+    def _obter_bot(self, token):
+        self._obter_sessao()
+        with self._lock:
+            bot = self._bots.get(token)
+            if bot is None:
+                from telegram import Bot
+                from telegram.utils.request import Request
+                bot = Bot(token=token, request=Request(
+                    con_pool_size=self.tamanho_pool, connect_timeout=5, read_timeout=10
+                ))
+                self._bots[token] = bot
+        return bot
+
+    def _post(self, token, chat_id, texto):
+        """Um sendMessage; devolve None se enviado ou os segundos pedidos num 429"""
+        if self.cliente == "python-telegram-bot":
+            from telegram.error import RetryAfter
+            try:
+                self._obter_bot(token).send_message(chat_id=chat_id, text=texto, parse_mode=self.parse_mode)
+                return None
+            except RetryAfter as e:
+                return float(e.retry_after)
+
+        resposta = self._obter_sessao().post(
+            f"{URL_API}/bot{token}/sendMessage",
+            json={"chat_id": chat_id, "text": texto, "parse_mode": self.parse_mode},
+            timeout=(5, 10)
+        )
+        dados = resposta.json()
+        if dados.get("ok"):
+            return None
+        if dados.get("error_code") == 429:
+            return float(dados.get("parameters", {}).get("retry_after", 1))
+        raise RuntimeError(f"Erro Telegram: {dados.get('description')}")
+
+    # ------------------------------------------------------
+    # ENVIO
+    # ------------------------------------------------------
+    def _aguardar_vez(self, chat_id):
+        with self._lock:
+            balde = self._chats.get(chat_id)
+            if balde is None:
+                balde = self._chats[chat_id] = BaldeTokens(self.mensagens_por_minuto_chat / 60, self.rajada_chat)
+
+        espera = max(balde.reservar(), self._global.reservar())
+        if espera > self.espera_maxima:
+            balde.devolver()
+            self._global.devolver()
+            raise LimiteTaxaTelegram(espera)
+        if espera > 0:
+            self.estatisticas["esperas_taxa"] += 1
+            time.sleep(espera)
+
+    def enviar(self, token, chat_id, texto):
+        chat_id = str(chat_id).strip()
+        self._aguardar_vez(chat_id)
+
+        retry_after = self._post(token, chat_id, texto)
+        if retry_after is not None:
+            self.estatisticas["erros_429"] += 1
+            if retry_after > self.espera_maxima:
+                raise LimiteTaxaTelegram(retry_after)
+            time.sleep(retry_after)
+            if self._post(token, chat_id, texto) is not None:
+                raise LimiteTaxaTelegram(retry_after)
+        self.estatisticas["mensagens"] += 1
+
+    def enviar_varias(self, token, chat_id, mensagens):
+        """Rajada de alertas → o menor número de mensagens possível"""
+        mensagens = list(mensagens)
+        for bloco in juntar_mensagens(mensagens):
+            self.enviar(token, chat_id, bloco)
+        self.estatisticas["alertas"] += len(mensagens)
+
+    def status(self):
+        return {**self.estatisticas, "cliente": self.cliente, "chats": len(self._chats)}
@@ -0,0 +1,61 @@
+# ==========================================================
+# VERIFICAÇÃO DO ESQUEMA (MODELOS × BANCO)
+# ==========================================================
+# db.create_all() só cria tabelas que faltam: não acrescenta colunas
+# nem restrições únicas a tabelas existentes. A ingestão depende de
+# colunas novas (ex.: energy_data.delta_kwh) e das restrições únicas
+# usadas pelos INSERT ... ON CONFLICT dos rollups e picos, por isso o
+# arranque compara os modelos com o banco e aponta o que falta.
+# Esses upserts (rollups, picos, alertas, livro do saldo) só existem nos
+# dialetos de DIALETOS_UPSERT: o arranque recusa outro banco logo à
+# partida em vez de falhar na primeira ingestão.
+
+from sqlalchemy import UniqueConstraint, inspect
+
+DIALETOS_UPSERT = ("postgresql", "sqlite")
+
+
+def verificar_dialeto(engine):
+    """Levanta RuntimeError se o banco não suporta INSERT ... ON CONFLICT"""
+    nome = engine.dialect.name
+    if nome not in DIALETOS_UPSERT:
+        raise RuntimeError(
+            f"Banco '{nome}' não suportado (DATABASE_URL): use {' ou '.join(DIALETOS_UPSERT)}"
+        )
+
+
+def insert_upsert(nome_dialeto, tabela):
+    """insert() com on_conflict_do_update/do_nothing do dialeto (ver verificar_dialeto)"""
+    if nome_dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif nome_dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Banco '{nome_dialeto}' não suportado: use {' ou '.join(DIALETOS_UPSERT)}")
+    return insert(tabela)
+
+
+def diferencas_esquema(engine, metadata):
+    """Lista de textos com colunas e restrições únicas dos modelos que o banco não tem"""
+    inspetor = inspect(engine)
+    existentes = set(inspetor.get_table_names())
+    faltas = []
+
+    for tabela in metadata.sorted_tables:
+        if tabela.name not in existentes:
+            faltas.append(f"tabela {tabela.name}")
+            continue
+
+        colunas = {c["name"] for c in inspetor.get_columns(tabela.name)}
+        faltas.extend(f"coluna {tabela.name}.{c.name}" for c in tabela.columns if c.name not in colunas)
+
+        unicas = {tuple(u["column_names"]) for u in inspetor.get_unique_constraints(tabela.name)}
+        unicas |= {tuple(i["column_names"]) for i in inspetor.get_indexes(tabela.name) if i.get("unique")}
+        for restricao in tabela.constraints:
+            if not isinstance(restricao, UniqueConstraint):
+                continue
+            nomes = tuple(c.name for c in restricao.columns)
+            if nomes not in unicas:
+                faltas.append(f"restrição única {tabela.name}({', '.join(nomes)})")
+
+    return faltas
@@ -0,0 +1,359 @@
+# ==========================================================
+# ESTADO "AO VIVO" PARTILHADO ENTRE WORKERS
+# ==========================================================
+# Cada chave (pzem1, pzem2, ldr, ...) guarda um snapshot inteiro:
+# quem lê recebe sempre uma cópia coerente e quem escreve substitui
+# o snapshot de uma vez (nunca campo a campo entre workers).
+#   • memoria  → dict no próprio processo (1 worker / desenvolvimento)
+#   • mmap     → ficheiro partilhado (/dev/shm) com lockf por slot (1 máquina)
+#   • postgres → tabela estado_vivo com SELECT ... FOR UPDATE (várias instâncias)
+
+import copy
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime
+
+from sqlalchemy import select
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o backend em memória
+    fcntl = None
+
+
+# ------------------------------------------------------
+# SERIALIZAÇÃO (JSON com datetimes)
+# ------------------------------------------------------
+def _json_padrao(valor):
+    if isinstance(valor, datetime):
+        return {"$dt": valor.isoformat()}
+    raise TypeError(f"{type(valor).__name__} não serializável")
+
+
+def _json_objeto(objeto):
+    if len(objeto) == 1 and "$dt" in objeto:
+        return datetime.fromisoformat(objeto["$dt"])
+    return objeto
+
+
+def codificar(valor):
+    return json.dumps(valor, default=_json_padrao, separators=(",", ":")).encode("utf-8")
+
+
+def decodificar(dados):
+    return json.loads(dados.decode("utf-8"), object_hook=_json_objeto)
+
+
+# ------------------------------------------------------
+# BACKENDS
+# ------------------------------------------------------
+class EstadoVivoBase:
+    """Interface comum: ler / gravar / modificar snapshots por chave"""
+
+    nome = "base"
+
+    def __init__(self, padroes=None):
+        # Valor inicial de cada chave conhecida (devolvido enquanto nada foi gravado)
+        self.padroes = copy.deepcopy(padroes or {})
+
+    def _padrao(self, chave):
+        return copy.deepcopy(self.padroes.get(chave, {}))
+
+    def ler(self, chave):
+        raise NotImplementedError
+
+    def modificar(self, chave, funcao):
+        """Aplica funcao(snapshot) → novo snapshot (ou None para não mudar) de forma atómica"""
+        raise NotImplementedError
+
+    def gravar(self, chave, valor):
+        return self.modificar(chave, lambda atual: valor)
+
+    def atualizar(self, chave, alteracoes):
+        """Junta alteracoes ao snapshot atual (last write wins por campo)"""
+        def juntar(atual):
+            atual.update(alteracoes)
+            return atual
+        return self.modificar(chave, juntar)
+
+    def status(self):
+        return {"backend": self.nome}
+
+
+class EstadoVivoMemoria(EstadoVivoBase):
+    """Backend em memória do processo"""
+
+    nome = "memoria"
+
+    def __init__(self, padroes=None, erro=None):
+        super().__init__(padroes)
+        self.erro = erro  # motivo, se isto é o recurso de um backend partilhado que falhou
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def ler(self, chave):
+        with self._lock:
+            if chave in self._dados:
+                return copy.deepcopy(self._dados[chave])
+        return self._padrao(chave)
+
+    def modificar(self, chave, funcao):
+        with self._lock:
+            atual = copy.deepcopy(self._dados[chave]) if chave in self._dados else self._padrao(chave)
+            novo = funcao(atual)
+            if novo is None:
+                return atual
+            self._dados[chave] = copy.deepcopy(novo)
+            return novo
+
+    def status(self):
+        return {"backend": self.nome, "erro": self.erro} if self.erro else {"backend": self.nome}
+
+
+class EstadoVivoMmap(EstadoVivoBase):
+    """Backend num ficheiro mapeado em memória partilhado pelos workers da mesma máquina.
+
+    Layout: SLOTS blocos de TAMANHO_SLOT bytes; cada bloco =
+    [chave 64 bytes][versão 8 bytes][tamanho 4 bytes][JSON].
+    O lockf cobre só o slot da chave (leitores partilhados, escritor exclusivo);
+    o slot 0 serve de lock global para reservar slots novos.
+    """
+
+    nome = "mmap"
+    CABECALHO = struct.Struct("<64sQI")
+
+    def __init__(self, caminho, padroes=None, slots=64, tamanho_slot=4096):
+        if fcntl is None:
+            raise RuntimeError("Backend mmap requer fcntl (POSIX)")
+        super().__init__(padroes)
+        self.caminho = caminho
+        self.slots = int(slots)
+        self.tamanho_slot = int(tamanho_slot)
+        self._tamanho_total = self.slots * self.tamanho_slot
+        self._indices = {}
+        self._lock = threading.Lock()  # lockf não exclui threads do mesmo processo
+        self._pid = None
+        self._fd = None
+        self._mapa = None
+
+    def _abrir(self):
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self._tamanho_total:
+            os.ftruncate(fd, self._tamanho_total)
+        self._fd = fd
+        self._mapa = mmap.mmap(fd, self._tamanho_total, mmap.MAP_SHARED)
+        self._indices = {}
+        self._pid = os.getpid()
+
+    def _travar(self, indice, exclusivo):
+        # Slot 0 é reservado ao lock global; dados ficam nos slots 1..N-1
+        modo = fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH
+        fcntl.lockf(self._fd, modo, self.tamanho_slot, indice * self.tamanho_slot)
+
+    def _destravar(self, indice):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self.tamanho_slot, indice * self.tamanho_slot)
+
+    def _chave_do_slot(self, indice):
+        inicio = indice * self.tamanho_slot
+        chave, _, _ = self.CABECALHO.unpack_from(self._mapa, inicio)
+        return chave.rstrip(b"\0").decode("utf-8")
+
+    def _indice(self, chave, criar):
+        indice = self._indices.get(chave)
+        if indice is not None:
+            return indice
+
+        self._travar(0, exclusivo=criar)
+        try:
+            livre = None
+            for i in range(1, self.slots):
+                nome = self._chave_do_slot(i)
+                if nome == chave:
+                    self._indices[chave] = i
+                    return i
+                if not nome and livre is None:
+                    livre = i
+
+            if not criar:
+                return None
+            if livre is None:
+                raise RuntimeError(f"Sem slots livres no estado partilhado para '{chave}'")
+
+            self.CABECALHO.pack_into(self._mapa, livre * self.tamanho_slot, chave.encode("utf-8"), 0, 0)
+            self._indices[chave] = livre
+            return livre
+        finally:
+            self._destravar(0)
+
+    def _ler_slot(self, indice, chave):
+        inicio = indice * self.tamanho_slot
+        _, _, tamanho = self.CABECALHO.unpack_from(self._mapa, inicio)
+        if not tamanho:
+            return self._padrao(chave)
+        dados_inicio = inicio + self.CABECALHO.size
+        return decodificar(self._mapa[dados_inicio:dados_inicio + tamanho])
+
+    def ler(self, chave):
+        with self._lock:
+            self._abrir()
+            indice = self._indice(chave, criar=False)
+            if indice is None:
+                return self._padrao(chave)
+
+            self._travar(indice, exclusivo=False)
+            try:
+                return self._ler_slot(indice, chave)
+            finally:
+                self._destravar(indice)
+
+    def modificar(self, chave, funcao):
+        with self._lock:
+            self._abrir()
+            indice = self._indice(chave, criar=True)
+
+            self._travar(indice, exclusivo=True)
+            try:
+                atual = self._ler_slot(indice, chave)
+                novo = funcao(atual)
+                if novo is None:
+                    return atual
+
+                dados = codificar(novo)
+                if len(dados) > self.tamanho_slot - self.CABECALHO.size:
+                    raise ValueError(f"Snapshot de '{chave}' excede {self.tamanho_slot} bytes")
+
+                inicio = indice * self.tamanho_slot
+                _, versao, _ = self.CABECALHO.unpack_from(self._mapa, inicio)
+                dados_inicio = inicio + self.CABECALHO.size
+                self._mapa[dados_inicio:dados_inicio + len(dados)] = dados
+                self.CABECALHO.pack_into(self._mapa, inicio, chave.encode("utf-8"), versao + 1, len(dados))
+                return novo
+            finally:
+                self._destravar(indice)
+
+    def status(self):
+        return {"backend": self.nome, "caminho": self.caminho, "slots": self.slots}
+
+
+class EstadoVivoPostgres(EstadoVivoBase):
+    """Backend numa tabela (chave, valor JSON) para várias instâncias/máquinas.
+
+    Leituras usam um cache local curto (cache_ttl) para não ir ao banco
+    em cada acesso do dashboard; escritas atualizam o cache do processo.
+    """
+
+    nome = "postgres"
+
+    def __init__(self, engine, tabela, padroes=None, cache_ttl=1.0):
+        super().__init__(padroes)
+        self.engine = engine
+        self.tabela = tabela
+        self.cache_ttl = float(cache_ttl)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _guardar_cache(self, chave, valor):
+        with self._lock:
+            self._cache[chave] = (time.monotonic(), copy.deepcopy(valor))
+
+    def ler(self, chave):
+        with self._lock:
+            em_cache = self._cache.get(chave)
+            if em_cache and time.monotonic() - em_cache[0] < self.cache_ttl:
+                return copy.deepcopy(em_cache[1])
+
+        with self.engine.connect() as conexao:
+            valor = conexao.execute(
+                select(self.tabela.c.valor).where(self.tabela.c.chave == chave)
+            ).scalar()
+
+        valor = decodificar(valor.encode("utf-8")) if valor else self._padrao(chave)
+        self._guardar_cache(chave, valor)
+        return valor
+
+    def modificar(self, chave, funcao):
+        from sqlalchemy.dialects.postgresql import insert
+
+        c = self.tabela.c
+        with self.engine.begin() as conexao:
+            # Garante a linha antes do FOR UPDATE (não há lock sobre linhas inexistentes)
+            conexao.execute(
+                insert(self.tabela).values(chave=chave, valor=None, atualizado_em=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=[c.chave])
+            )
+            valor = conexao.execute(
+                select(c.valor).where(c.chave == chave).with_for_update()
+            ).scalar()
+
+            atual = decodificar(valor.encode("utf-8")) if valor else self._padrao(chave)
+            novo = funcao(atual)
+            if novo is None:
+                self._guardar_cache(chave, atual)
+                return atual
+
+            conexao.execute(
+                self.tabela.update().where(c.chave == chave)
+                .values(valor=codificar(novo).decode("utf-8"), atualizado_em=datetime.utcnow())
+            )
+
+        self._guardar_cache(chave, novo)
+        return novo
+
+    def status(self):
+        return {"backend": self.nome, "cache_ttl": self.cache_ttl}
+
+
+def criar_estado_vivo(backend, padroes=None, caminho=None, engine=None, tabela=None, cache_ttl=1.0,
+                      processos=1):
+    """Cria o backend configurado. Se o escolhido não estiver disponível: com vários
+    processos (WEB_CONCURRENCY > 1) levanta RuntimeError - cada worker teria o seu
+    contador, normalizador e índice de comandos (consumo contado em dobro); com um
+    só processo cai para memória e regista o erro em status()"""
+    backend = (backend or "memoria").lower()
+    try:
+        if backend == "mmap":
+            return EstadoVivoMmap(caminho, padroes)
+        if backend == "postgres":
+            if engine is None or engine.dialect.name != "postgresql":
+                raise RuntimeError("Backend postgres requer DATABASE_URL PostgreSQL")
+            return EstadoVivoPostgres(engine, tabela, padroes, cache_ttl)
+    except Exception as e:
+        erro = f"Estado ao vivo '{backend}' indisponível ({e})"
+        if processos > 1:
+            raise RuntimeError(f"{erro} com {processos} processos - arranque cancelado") from e
+        print(f"❌ {erro} - usando memória do processo")
+        return EstadoVivoMemoria(padroes, erro=erro)
+
+    if processos > 1:
+        print(f"⚠️ Estado ao vivo em memória com {processos} processos: cada worker tem o seu estado")
+    return EstadoVivoMemoria(padroes)
+
+
+# ------------------------------------------------------
+# VISTA DE COMPATIBILIDADE
+# ------------------------------------------------------
+class VistaEstado(Mapping):
+    """Mapping só de leitura: vista[chave] devolve o snapshot atual dessa chave.
+    Escritas têm de passar por estado.atualizar()/modificar()."""
+
+    def __init__(self, estado, chaves):
+        self._estado = estado
+        self._chaves = tuple(chaves)
+
+    def __getitem__(self, chave):
+        if chave not in self._chaves:
+            raise KeyError(chave)
+        return self._estado.ler(chave)
+
+    def __iter__(self):
+        return iter(self._chaves)
+
+    def __len__(self):
+        return len(self._chaves)
@@ -0,0 +1,343 @@
+# ==========================================================
+# HUB DE EVENTOS AO VIVO (SSE PARA O DASHBOARD)
+# ==========================================================
+# A ingestão publica cada mudança uma vez (pzem, ldr, rele, saldo,
+# alerta); o hub copia o evento para a fila de cada browser ligado.
+# Nenhum browser consulta o banco a cada segundo: o custo por evento
+# é fixo e cada separador só custa uma fila em memória.
+# Entre workers o evento viaja por um transporte:
+#   • local    → só o próprio processo (1 worker / backend memoria)
+#   • estado   → anel de eventos no estado ao vivo partilhado (mmap)
+#   • postgres → NOTIFY/LISTEN no canal eventos_ao_vivo
+# A ingestão publica dentro de `hub.lote()`: os eventos do lote saem
+# juntos (um modificar no anel / uma transação de NOTIFY), só o último
+# de cada pzem/relé/saldo/ldr. Um worker que perca eventos (anel
+# ultrapassado, LISTEN religado) fecha os streams: o EventSource religa
+# e recebe de novo o estado atual no início do stream.
+# Cada stream prende uma thread do worker (gthread): no máximo
+# `max_streams` por worker; os browsers a mais recebem só o estado
+# atual e voltam a tentar daqui a `retry_cheio` segundos.
+
+import json
+import os
+import queue
+import select
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from sqlalchemy import func, select as sql_select
+
+
+def _json_padrao(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} não serializável")
+
+
+def formatar_sse(tipo, dados):
+    """Uma mensagem text/event-stream (event + data JSON)"""
+    corpo = json.dumps(dados, default=_json_padrao, ensure_ascii=False)
+    return f"event: {tipo}\ndata: {corpo}\n\n"
+
+
+# Entregue aos browsers quando o worker perdeu eventos: o stream fecha e religa
+RESSINCRONIZAR = {"tipo": "ressincronizar", "dados": None}
+
+# Só o estado mais recente interessa ao dashboard (alertas passam todos)
+CHAVES_COALESCER = {"pzem": "pzem", "rele": "id", "saldo": None, "ldr": None}
+
+
+def _chave_evento(evento, indice):
+    tipo = evento["tipo"]
+    if tipo not in CHAVES_COALESCER:
+        return (tipo, indice)
+    campo = CHAVES_COALESCER[tipo]
+    return (tipo, (evento["dados"] or {}).get(campo) if campo else None)
+
+
+# ------------------------------------------------------
+# TRANSPORTES ENTRE WORKERS
+# ------------------------------------------------------
+class TransporteLocal:
+    """Sem partilha: o evento só chega aos browsers deste processo"""
+
+    nome = "local"
+
+    def iniciar(self, entregar):
+        self.entregar = entregar
+
+    def publicar(self, eventos):
+        for evento in eventos:
+            self.entregar(evento)
+
+    def escutar(self):
+        pass
+
+
+class TransporteEstado(TransporteLocal):
+    """Anel com os últimos eventos numa chave do estado ao vivo; cada worker
+    com browsers ligados lê o anel a cada `intervalo` e entrega os eventos alheios"""
+
+    nome = "estado"
+
+    def __init__(self, estado, chave="eventos", maximo=6, intervalo=0.25):
+        self.estado = estado
+        self.chave = chave
+        self.maximo = maximo
+        self.intervalo = intervalo
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publicar(self, eventos):
+        eventos = [dict(evento, origem=os.getpid()) for evento in eventos]
+        for evento in eventos:
+            self.entregar(evento)
+
+        def anexar(anel, maximo):
+            seq = anel.get("seq", 0)
+            novos = [dict(evento, seq=seq + i) for i, evento in enumerate(eventos, 1)]
+            anel["seq"] = seq + len(novos)
+            anel["eventos"] = (anel.get("eventos", []) + novos)[-maximo:]
+            return anel
+
+        # Lote grande demais para o slot: ficam só os mais recentes; a sequência
+        # avança na mesma e os outros workers veem a lacuna e ressincronizam
+        for maximo in (self.maximo, *range(len(eventos), 0, -1)):
+            try:
+                self.estado.modificar(self.chave, lambda anel: anexar(anel, maximo))
+                return
+            except ValueError:
+                continue
+        raise ValueError("Evento maior que o slot do estado ao vivo")
+
+    def escutar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._ponte, daemon=True, name="ponte-eventos")
+                self._thread.start()
+
+    def _ponte(self):
+        ultimo = self.estado.ler(self.chave).get("seq", 0)
+        pid = os.getpid()
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                anel = self.estado.ler(self.chave)
+            except Exception as e:
+                print(f"⚠️ Ponte de eventos: {e}")
+                continue
+
+            novos = [evento for evento in anel.get("eventos", []) if evento["seq"] > ultimo]
+            if novos and novos[0]["seq"] > ultimo + 1:
+                # O anel deu a volta desde a última leitura: houve eventos perdidos
+                self.entregar(RESSINCRONIZAR)
+            for evento in novos:
+                if evento.get("origem") != pid:
+                    self.entregar(evento)
+            ultimo = max(ultimo, anel.get("seq", 0))
+
+
+class TransportePostgres(TransporteLocal):
+    """pg_notify na publicação e uma conexão LISTEN dedicada por worker"""
+
+    nome = "postgres"
+
+    def __init__(self, engine, canal="eventos_ao_vivo", limite_carga=7900):
+        self.engine = engine
+        self.canal = canal
+        self.limite_carga = limite_carga  # o payload do NOTIFY tem de ficar abaixo de 8000 bytes
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _cargas(self, eventos):
+        """Listas JSON de eventos, cada uma dentro do limite do NOTIFY"""
+        atual = []
+        for evento in eventos:
+            candidato = atual + [evento]
+            if atual and len(json.dumps(candidato, default=_json_padrao).encode("utf-8")) > self.limite_carga:
+                yield json.dumps(atual, default=_json_padrao)
+                candidato = [evento]
+            atual = candidato
+        if atual:
+            yield json.dumps(atual, default=_json_padrao)
+
+    def publicar(self, eventos):
+        eventos = [dict(evento, origem=os.getpid()) for evento in eventos]
+        for evento in eventos:
+            self.entregar(evento)
+        # Uma transação por lote (normalmente um único NOTIFY)
+        with self.engine.begin() as conexao:
+            for corpo in self._cargas(eventos):
+                conexao.execute(sql_select(func.pg_notify(self.canal, corpo)))
+
+    def escutar(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._ponte, daemon=True, name="ponte-eventos")
+                self._thread.start()
+
+    def _ponte(self):
+        pid = os.getpid()
+        religar = False
+        while True:
+            conexao = None
+            try:
+                # Conexão fora do pool: fica em autocommit e presa ao LISTEN
+                conexao = self.engine.raw_connection()
+                conexao.detach()
+                conexao.driver_connection.autocommit = True
+                conexao.cursor().execute(f'LISTEN "{self.canal}"')
+                bruta = conexao.driver_connection
+                if religar:
+                    # Sem LISTEN durante a queda: os NOTIFY desse intervalo perderam-se
+                    self.entregar(RESSINCRONIZAR)
+                religar = True
+
+                while True:
+                    if select.select([bruta], [], [], 30) == ([], [], []):
+                        continue
+                    bruta.poll()
+                    while bruta.notifies:
+                        for evento in json.loads(bruta.notifies.pop(0).payload):
+                            if evento.get("origem") != pid:
+                                self.entregar(evento)
+            except Exception as e:
+                print(f"⚠️ LISTEN de eventos interrompido ({e}) - a religar em 5s")
+                time.sleep(5)
+            finally:
+                if conexao is not None:
+                    try:
+                        conexao.close()
+                    except Exception:
+                        pass
+
+
+# ------------------------------------------------------
+# HUB (FAN-OUT PARA OS BROWSERS)
+# ------------------------------------------------------
+class HubEventos:
+    """Fan-out de eventos: uma fila limitada por assinante (browser ligado)"""
+
+    def __init__(self, transporte=None, tamanho_fila=100, max_streams=None, retry_cheio=30):
+        self.transporte = transporte or TransporteLocal()
+        self.tamanho_fila = tamanho_fila
+        self.max_streams = max_streams  # None = sem limite
+        self.retry_cheio = retry_cheio
+        self.recusados = 0
+        self._assinantes = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # lote aberto nesta thread
+        self.transporte.iniciar(self._distribuir)
+
+    def publicar(self, tipo, dados):
+        """Nunca levanta: falhar a notificar browsers não pode travar a ingestão"""
+        evento = {"tipo": tipo, "dados": dados}
+        pendentes = getattr(self._local, "pendentes", None)
+        if pendentes is not None:
+            chave = _chave_evento(evento, len(pendentes))
+            pendentes.pop(chave, None)  # o mais recente passa para o fim
+            pendentes[chave] = evento
+            return
+        self._enviar([evento])
+
+    @contextmanager
+    def lote(self):
+        """Junta os eventos publicados nesta thread e envia-os de uma vez no fim"""
+        if getattr(self._local, "pendentes", None) is not None:
+            yield  # lote já aberto mais acima
+            return
+        self._local.pendentes = {}
+        try:
+            yield
+        finally:
+            eventos = list(self._local.pendentes.values())
+            self._local.pendentes = None
+            if eventos:
+                self._enviar(eventos)
+
+    def _enviar(self, eventos):
+        try:
+            self.transporte.publicar(eventos)
+        except Exception as e:
+            tipos = ", ".join(sorted({evento["tipo"] for evento in eventos}))
+            print(f"⚠️ Eventos não publicados ({tipos}): {e}")
+
+    def assinar(self):
+        """Fila do novo assinante, ou None se este worker já tem max_streams abertos"""
+        fila = queue.Queue(maxsize=self.tamanho_fila)
+        with self._lock:
+            if self.max_streams is not None and len(self._assinantes) >= self.max_streams:
+                self.recusados += 1
+                return None
+            self._assinantes.add(fila)
+        self.transporte.escutar()
+        return fila
+
+    def cancelar(self, fila):
+        with self._lock:
+            self._assinantes.discard(fila)
+
+    def _distribuir(self, evento):
+        with self._lock:
+            assinantes = list(self._assinantes)
+
+        for fila in assinantes:
+            try:
+                fila.put_nowait(evento)
+            except queue.Full:
+                # Browser lento: descarta o evento mais antigo
+                try:
+                    fila.get_nowait()
+                    fila.put_nowait(evento)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def transmitir(self, iniciais=(), duracao=300, batimento=15):
+        """Gerador text/event-stream: eventos iniciais, depois os publicados.
+        Fecha após `duracao` segundos (o EventSource religa sozinho)."""
+        fila = self.assinar()
+        if fila is None:
+            # Sem vaga: só o estado atual, sem prender a thread; o browser religa mais tarde
+            yield f"retry: {int(self.retry_cheio * 1000)}\n\n"
+            for tipo, dados in iniciais:
+                yield formatar_sse(tipo, dados)
+            return
+
+        try:
+            yield "retry: 3000\n\n"
+            for tipo, dados in iniciais:
+                yield formatar_sse(tipo, dados)
+
+            fim = time.monotonic() + duracao
+            while True:
+                restante = fim - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    evento = fila.get(timeout=min(batimento, restante))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if evento is RESSINCRONIZAR:
+                    break  # eventos perdidos: o browser religa e recebe o estado atual
+                yield formatar_sse(evento["tipo"], evento["dados"])
+        finally:
+            self.cancelar(fila)
+
+    def status(self):
+        with self._lock:
+            return {"transporte": self.transporte.nome, "assinantes": len(self._assinantes),
+                    "max_streams": self.max_streams, "recusados": self.recusados}
+
+
+def criar_hub_eventos(estado, engine=None, tamanho_fila=100, max_streams=None, retry_cheio=30):
+    """Escolhe o transporte conforme o backend do estado ao vivo"""
+    if estado.nome == "postgres" and engine is not None and engine.dialect.name == "postgresql":
+        transporte = TransportePostgres(engine)
+    elif estado.nome == "mmap":
+        transporte = TransporteEstado(estado)
+    else:
+        transporte = TransporteLocal()
+    return HubEventos(transporte, tamanho_fila, max_streams, retry_cheio)
@@ -0,0 +1,125 @@
+# ==========================================================
+# HISTÓRICO RECENTE EM ANEL (ÚLTIMAS 24 HORAS / 60 MINUTOS)
+# ==========================================================
+# Cada anel tem N posições fixas; a posição de uma unidade de tempo
+# (hora ou minuto desde a época) é unidade % N e guarda, por PZEM,
+# soma e contagem da potência. Quando a posição é reutilizada por uma
+# unidade nova, os valores antigos são descartados.
+# • A ingestão soma cada lote gravado (depois do commit dos rollups).
+# • Ler a série = percorrer N posições: custo fixo, sem banco.
+# • Anel vazio (primeiro arranque) → semeado uma vez a partir dos
+#   rollups energia_hora / energia_minuto (no máximo N linhas por PZEM).
+# Os anéis vivem no estado ao vivo partilhado, iguais em todos os workers.
+
+from datetime import datetime, timedelta
+
+from servicos.rollups import truncar_hora, truncar_minuto
+
+EPOCA = datetime(1970, 1, 1)
+
+
+class AnelHistorico:
+    """Anel de médias de potência por PZEM numa chave do estado ao vivo"""
+
+    def __init__(self, estado, chave, posicoes, passo):
+        self.estado = estado
+        self.chave = chave
+        self.posicoes = posicoes
+        self.passo = passo  # timedelta de cada posição
+        self.truncar = truncar_hora if passo >= timedelta(hours=1) else truncar_minuto
+
+    def _unidade(self, ts):
+        return int((self.truncar(ts) - EPOCA) / self.passo)
+
+    def _somar(self, anel, unidade, pzem_id, soma, amostras):
+        marcas = anel.setdefault("marcas", [None] * self.posicoes)
+        i = unidade % self.posicoes
+        if marcas[i] != unidade:
+            # Posição reutilizada: descarta a unidade antiga de todos os PZEMs
+            marcas[i] = unidade
+            for serie in anel.setdefault("pzems", {}).values():
+                serie["soma"][i] = 0.0
+                serie["n"][i] = 0
+
+        serie = anel.setdefault("pzems", {}).setdefault(
+            str(pzem_id), {"soma": [0.0] * self.posicoes, "n": [0] * self.posicoes}
+        )
+        serie["soma"][i] = round(serie["soma"][i] + soma, 2)
+        serie["n"][i] += amostras
+
+    def registar(self, registros, agora=None):
+        """Soma os registros de EnergyData (dicts) que caem dentro da janela do anel"""
+        atual = self._unidade(agora or datetime.utcnow())
+        parciais = {}
+        for r in registros:
+            unidade = self._unidade(r["timestamp"].replace(tzinfo=None))
+            if not atual - self.posicoes < unidade <= atual:
+                continue  # importações antigas / relógio adiantado
+            chave = (unidade, int(r["pzem_id"]))
+            soma, n = parciais.get(chave, (0.0, 0))
+            parciais[chave] = (soma + float(r.get("power") or 0), n + 1)
+
+        if not parciais:
+            return
+
+        def somar(anel):
+            for (unidade, pzem_id), (soma, n) in sorted(parciais.items()):
+                self._somar(anel, unidade, pzem_id, soma, n)
+            return anel
+
+        self.estado.modificar(self.chave, somar)
+
+    def semear(self, linhas, agora=None):
+        """Substitui o anel por linhas de rollup (pzem_id, inicio, power_soma, amostras)"""
+        atual = self._unidade(agora or datetime.utcnow())
+
+        def substituir(anel):
+            novo = {"semeado": True}
+            for linha in linhas:
+                unidade = self._unidade(linha.inicio)
+                if atual - self.posicoes < unidade <= atual:
+                    self._somar(novo, unidade, linha.pzem_id, linha.power_soma or 0.0, linha.amostras or 0)
+            # Um lote gravado entre a consulta dos rollups e esta escrita pode
+            # ficar somado duas vezes: só pesa nessa média até a posição rodar
+            return novo
+
+        return self.estado.modificar(self.chave, substituir)
+
+    def semeado(self):
+        return bool(self.estado.ler(self.chave).get("semeado"))
+
+    def serie(self, agora=None):
+        """[(início, {pzem_id: potência média})] das N unidades até agora, da mais antiga à atual"""
+        anel = self.estado.ler(self.chave)
+        marcas = anel.get("marcas") or [None] * self.posicoes
+        pzems = anel.get("pzems", {})
+        atual = self._unidade(agora or datetime.utcnow())
+
+        resultado = []
+        for unidade in range(atual - self.posicoes + 1, atual + 1):
+            i = unidade % self.posicoes
+            medias = {}
+            if marcas[i] == unidade:
+                for pzem_id, serie in pzems.items():
+                    if serie["n"][i]:
+                        medias[int(pzem_id)] = serie["soma"][i] / serie["n"][i]
+            resultado.append((EPOCA + unidade * self.passo, medias))
+        return resultado
+
+
+class HistoricoRecente:
+    """Anéis de 24 horas e 60 minutos alimentados pela ingestão"""
+
+    def __init__(self, estado, horas=24, minutos=60):
+        self.horas = AnelHistorico(estado, "historico_horas", horas, timedelta(hours=1))
+        self.minutos = AnelHistorico(estado, "historico_minutos", minutos, timedelta(minutes=1))
+
+    def registar(self, registros):
+        agora = datetime.utcnow()
+        for anel in (self.horas, self.minutos):
+            try:
+                anel.registar(registros, agora)
+            except Exception as e:
+                # O anel é só um atalho: os rollups continuam a ser a fonte da verdade
+                print(f"⚠️ Histórico recente ({anel.chave}) não atualizado: {e}")
+                anel.estado.gravar(anel.chave, {})
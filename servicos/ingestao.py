@@ -0,0 +1,219 @@
+# ==========================================================
+# FILA DE INGESTÃO (WRITE-BEHIND) PARA /api/dados
+# ==========================================================
+# O ESP recebe a resposta logo depois de o estado em memória ser
+# atualizado. As linhas de EnergyData ficam nesta fila e uma thread
+# grava tudo em lote (um único commit) quando o lote enche ou
+# quando passa o intervalo configurado.
+# As leituras já foram confirmadas ao ESP (HTTP 200): um lote que falha
+# fica à cabeça e é repetido com backoff até o banco voltar; entretanto
+# a fila enche e os pedidos seguintes gravam de forma síncrona (e
+# respondem 500 se o banco continuar em baixo → o ESP reenvia). Só se
+# descartam linhas que o banco recusa (erros_permanentes, ex.:
+# IntegrityError), gravando o lote linha a linha para as encontrar.
+
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+from datetime import datetime
+
+
+class FilaIngestao:
+    """Fila em memória com escritor em background e commits agrupados"""
+
+    def __init__(self, escritor, lote_maximo=200, intervalo_flush=2.0,
+                 tamanho_maximo=10000, tentativas_maximas=3, espera_maxima=30.0,
+                 erros_permanentes=()):
+        # escritor(registros, contextos) grava o lote; deve lançar exceção se falhar
+        self.escritor = escritor
+        self.lote_maximo = max(1, int(lote_maximo))
+        self.intervalo_flush = max(0.05, float(intervalo_flush))
+        # Tentativas da gravação síncrona (e ao parar); a thread repete sem limite
+        self.tentativas_maximas = max(1, int(tentativas_maximas))
+        self.espera_maxima = max(self.intervalo_flush, float(espera_maxima))
+        self.erros_permanentes = tuple(erros_permanentes)  # a linha é inválida: repetir não adianta
+
+        self._fila = queue.Queue(maxsize=max(1, int(tamanho_maximo)))
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._atexit_registrado = False
+
+        self.estatisticas = {
+            "enfileirados": 0,
+            "gravados": 0,
+            "lotes": 0,
+            "falhas": 0,
+            "descartados": 0,
+            "repeticoes": 0,
+            "gravacoes_sincronas": 0,
+            "ultimo_flush": None,
+            "ultimo_lote": 0
+        }
+
+    # ------------------------------------------------------
+    # API PÚBLICA
+    # ------------------------------------------------------
+    def enfileirar(self, registros, contexto=None):
+        """Coloca registros (dicts de EnergyData) e o contexto do payload na fila"""
+        registros = list(registros or [])
+        self._garantir_thread()
+
+        try:
+            self._fila.put_nowait((registros, contexto))
+            self.estatisticas["enfileirados"] += len(registros)
+        except queue.Full:
+            # Fila cheia → grava no próprio pedido em vez de perder dados
+            print(f"⚠️ Fila de ingestão cheia ({self._fila.qsize()}) - gravação síncrona")
+            self.estatisticas["gravacoes_sincronas"] += 1
+            if not self._gravar(registros, [contexto], tentativas=self.tentativas_maximas):
+                # Sem 200 para o ESP: as leituras ficam no buffer dele e voltam a ser enviadas
+                raise RuntimeError("Banco indisponível - leituras não gravadas")
+
+    def tamanho(self):
+        """Quantidade de itens (payloads) à espera de gravação"""
+        return self._fila.qsize()
+
+    def status(self):
+        """Resumo do estado da fila para debug"""
+        return {
+            **self.estatisticas,
+            "ultimo_flush": self.estatisticas["ultimo_flush"].isoformat() if self.estatisticas["ultimo_flush"] else None,
+            "pendentes": self.tamanho(),
+            "thread_ativa": bool(self._thread and self._thread.is_alive()),
+            "lote_maximo": self.lote_maximo,
+            "intervalo_flush": self.intervalo_flush
+        }
+
+    def parar(self, timeout=10):
+        """Para a thread gravando o que ainda estiver na fila"""
+        self._parar.set()
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+
+    # ------------------------------------------------------
+    # THREAD DE ESCRITA
+    # ------------------------------------------------------
+    def _garantir_thread(self):
+        """Inicia a thread no processo atual (seguro com fork do gunicorn)"""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._parar.clear()
+            self._thread = threading.Thread(
+                target=self._executar,
+                name="fila-ingestao",
+                daemon=True
+            )
+            self._thread.start()
+
+            if not self._atexit_registrado:
+                atexit.register(self.parar)
+                self._atexit_registrado = True
+
+            print(f"🧵 Fila de ingestão iniciada (pid {self._pid})")
+
+    def _executar(self):
+        registros, contextos = [], []
+        prazo = None
+
+        while True:
+            pendente = bool(registros or contextos)
+
+            if self._parar.is_set():
+                # Esvaziar a fila antes de sair
+                while True:
+                    try:
+                        novos, contexto = self._fila.get_nowait()
+                    except queue.Empty:
+                        break
+                    registros.extend(novos)
+                    contextos.append(contexto)
+                if registros or contextos:
+                    self._gravar(registros, contextos, tentativas=self.tentativas_maximas)
+                return
+
+            espera = max(0.0, prazo - time.monotonic()) if pendente else self.intervalo_flush
+
+            try:
+                novos, contexto = self._fila.get(timeout=espera)
+                if not pendente:
+                    prazo = time.monotonic() + self.intervalo_flush
+                registros.extend(novos)
+                contextos.append(contexto)
+
+                # Gatilho por tamanho
+                if len(registros) < self.lote_maximo and time.monotonic() < prazo:
+                    continue
+            except queue.Empty:
+                if not pendente:
+                    continue
+
+            # Gatilho por tempo (ou tamanho)
+            self._gravar(registros, contextos)
+            registros, contextos = [], []
+            prazo = None
+
+    def _espera(self, tentativa):
+        """Backoff exponencial entre tentativas, até espera_maxima"""
+        return min(self.intervalo_flush * 2 ** (tentativa - 1), self.espera_maxima)
+
+    def _gravar(self, registros, contextos, tentativas=None):
+        """Grava o lote repetindo com backoff (sem limite se tentativas=None).
+        Devolve False se desistiu; nada foi descartado nesse caso."""
+        registros = list(registros)
+        total = len(registros)
+        linha_a_linha = False
+        tentativa = 0
+        while True:
+            tentativa += 1
+            try:
+                if linha_a_linha:
+                    self._gravar_linha_a_linha(registros, contextos)
+                else:
+                    self.escritor(registros, contextos)
+                    self.estatisticas["gravados"] += len(registros)
+                self.estatisticas["lotes"] += 1
+                self.estatisticas["ultimo_lote"] = total
+                self.estatisticas["ultimo_flush"] = datetime.utcnow()
+                return True
+            except self.erros_permanentes as e:
+                print(f"⚠️ Lote com registros inválidos ({e}) - gravação linha a linha")
+                linha_a_linha = True
+                tentativa = 0
+            except Exception as e:
+                self.estatisticas["falhas"] += 1
+                print(f"❌ Erro ao gravar lote de ingestão (tentativa {tentativa}): {e}")
+                if tentativa == 1:
+                    print(f"🔍 Traceback: {traceback.format_exc()}")
+                if tentativas is not None and tentativa >= tentativas:
+                    return False
+                self.estatisticas["repeticoes"] += 1
+                time.sleep(self._espera(tentativa))
+
+    def _gravar_linha_a_linha(self, registros, contextos):
+        """Descarta só as linhas recusadas; `registros` fica com as que faltam
+        (uma falha transitória a meio retoma daí, sem repetir as já gravadas)"""
+        while registros:
+            try:
+                self.escritor(registros[:1], [])
+                self.estatisticas["gravados"] += 1
+            except self.erros_permanentes as e:
+                self.estatisticas["descartados"] += 1
+                print(f"🗑️ Registro inválido descartado: {e}")
+            registros.pop(0)
+
+        try:
+            self.escritor([], contextos)
+        except self.erros_permanentes as e:
+            print(f"⚠️ Pós-processamento do lote recusado: {e}")
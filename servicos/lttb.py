@@ -0,0 +1,82 @@
+# ==========================================================
+# SÉRIES DE INTERVALO ARBITRÁRIO (GRÃO DE ROLLUP + LTTB)
+# ==========================================================
+# Um gráfico de um mês não precisa de ~1M pontos de 5s:
+# • escolher_grao() lê do grão mais fino (bruto/minuto/hora/dia) cujo
+#   número de linhas no intervalo cabe em `limite_linhas` por PZEM;
+# • lttb() reduz a série ao número de pontos pedido mantendo a forma
+#   (Largest-Triangle-Three-Buckets, Steinarsson 2013) em NumPy;
+# • gerar_json() devolve o JSON em blocos para a resposta em stream.
+
+import json
+
+import numpy as np
+
+GRAOS = (
+    ("bruto", 5),      # energy_data (uma amostra a cada ~5s)
+    ("minuto", 60),
+    ("hora", 3600),
+    ("dia", 86400)
+)
+
+
+def escolher_grao(segundos, limite_linhas):
+    """Grão mais fino com no máximo `limite_linhas` linhas por PZEM no intervalo"""
+    for nome, passo in GRAOS:
+        if segundos / passo <= limite_linhas:
+            return nome
+    return GRAOS[-1][0]
+
+
+def lttb(x, y, pontos):
+    """Índices dos pontos escolhidos pelo LTTB (x crescente); devolve todos se já couberem"""
+    n = len(x)
+    if pontos >= n or pontos < 3:
+        return np.arange(n)
+
+    # Primeiro e último ficam sempre; o resto é dividido em pontos-2 baldes
+    limites = np.linspace(1, n - 1, pontos - 1).astype(np.int64)
+    escolhidos = np.empty(pontos, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+
+    a = 0
+    for b in range(pontos - 2):
+        inicio, fim = limites[b], limites[b + 1]
+
+        # Vértice C = média do balde seguinte (o último ponto para o último balde)
+        proximo_fim = limites[b + 2] if b + 2 < len(limites) else n
+        cx = x[fim:proximo_fim].mean()
+        cy = y[fim:proximo_fim].mean()
+
+        # Área (×2) do triângulo A-B-C para cada candidato B do balde
+        areas = np.abs(
+            (x[a] - cx) * (y[inicio:fim] - y[a]) - (x[a] - x[inicio:fim]) * (cy - y[a])
+        )
+        a = inicio + int(np.argmax(areas))
+        escolhidos[b + 1] = a
+
+    return escolhidos
+
+
+def reduzir_lttb(tempos, valores, pontos):
+    """Arrays (epoch s, valor) → arrays reduzidos a no máximo `pontos`"""
+    x = np.asarray(tempos, dtype=np.float64)
+    y = np.asarray(valores, dtype=np.float64)
+    indices = lttb(x, y, pontos)
+    return x[indices], y[indices]
+
+
+def gerar_json(cabecalho, series, bloco=1000):
+    """Gerador do corpo JSON: {..cabecalho, "series": {nome: [[t_ms, valor], ...]}}
+    `series` é um iterável de (nome, tempos, valores); cada série é lida só quando chega a sua vez."""
+    yield json.dumps(cabecalho)[:-1] + ', "series": {'
+    for n_serie, (nome, tempos, valores) in enumerate(series):
+        yield ("" if n_serie == 0 else ", ") + json.dumps(nome) + ": ["
+        for inicio in range(0, len(tempos), bloco):
+            pares = [
+                [int(t * 1000), round(float(v), 3)]
+                for t, v in zip(tempos[inicio:inicio + bloco], valores[inicio:inicio + bloco])
+            ]
+            yield ("" if inicio == 0 else ", ") + json.dumps(pares)[1:-1]
+        yield "]"
+    yield "}}"
@@ -0,0 +1,269 @@
+# ==========================================================
+# DESPACHANTE DE NOTIFICAÇÕES (CAIXA DE SAÍDA notificacoes_saida)
+# ==========================================================
+# A verificação de alertas só grava uma linha por canal na caixa de
+# saída; o envio (Telegram, email) acontece aqui, fora da ingestão:
+# • thread por worker reserva linhas vencidas com UPDATE otimista
+#   (dois workers nunca enviam a mesma linha) e entrega-as a um pool
+#   limitado de threads - nunca há mais envios em voo que trabalhadores;
+# • falha → nova tentativa com backoff exponencial (base × 2^n, com
+#   teto e jitter), por linha = por canal; esgotadas → 'falhou';
+# • linha presa em 'enviando' (worker morreu) volta a 'pendente';
+# • canais em `agrupar`: todas as linhas vencidas do canal seguem num
+#   único envio (resumo); enfileirar(enviar_em=...) adia a linha até à
+#   janela do resumo (ex.: email de hora a hora / diário) e a thread
+#   acorda quando a primeira linha adiada vence.
+# enfileirar() usa a sessão do chamador e não faz commit; o despachante
+# deste worker acorda logo depois do commit.
+
+import atexit
+import os
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+
+
+def janela_resumo(frequencia, agora, hora_diaria=0):
+    """Momento de envio de uma notificação conforme email_frequency:
+    immediate → agora; hourly → próxima hora cheia; daily → próxima `hora_diaria`:00"""
+    if frequencia == "hourly":
+        return agora.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if frequencia == "daily":
+        envio = agora.replace(hour=hora_diaria, minute=0, second=0, microsecond=0)
+        return envio if envio > agora else envio + timedelta(days=1)
+    return agora
+
+
+def janela_agrupamento(agora, segundos):
+    """Fim da janela de `segundos` em curso: alertas da mesma janela vencem juntos
+    (e seguem num só envio nos canais agrupados)"""
+    if segundos <= 0:
+        return agora
+    inicio = datetime(agora.year, agora.month, agora.day)
+    decorrido = (agora - inicio).total_seconds()
+    return inicio + timedelta(seconds=(decorrido // segundos + 1) * segundos)
+
+
+class DespachanteNotificacoes:
+    """Envia as notificações da caixa de saída num pool de threads com retry/backoff"""
+
+    def __init__(self, db, modelo, contexto, enviadores, trabalhadores=4, tentativas_maximas=5,
+                 backoff_base=30, backoff_maximo=3600, intervalo=10, prazo_envio=300,
+                 agrupar=(), tamanho_grupo=50):
+        # enviadores = {canal: funcao([notificacoes])}; a função deve lançar exceção se falhar
+        self.db = db
+        self.modelo = modelo
+        self.contexto = contexto  # ex.: app.app_context
+        self.enviadores = enviadores
+        self.trabalhadores = max(1, int(trabalhadores))
+        self.tentativas_maximas = max(1, int(tentativas_maximas))
+        self.backoff_base = float(backoff_base)
+        self.backoff_maximo = float(backoff_maximo)
+        self.intervalo = float(intervalo)
+        self.prazo_envio = timedelta(seconds=prazo_envio)
+        self.agrupar = set(agrupar)
+        self.tamanho_grupo = max(1, int(tamanho_grupo))
+
+        self._sinal = threading.Event()  # commit novo ou trabalhador livre
+        self._em_voo = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+        self._pid = None
+        self._atexit_registrado = False
+
+        event.listen(Session, "after_commit", self._acordar_depois_commit)
+
+    # ------------------------------------------------------
+    # API PÚBLICA
+    # ------------------------------------------------------
+    def enfileirar(self, canal, tipo, mensagem, enviar_em=None):
+        """Adiciona a notificação à sessão atual (enviada depois do commit do chamador,
+        ou só a partir de `enviar_em`)"""
+        if canal not in self.enviadores:
+            raise ValueError(f"Canal de notificação desconhecido: {canal}")
+
+        agora = datetime.utcnow()
+        notificacao = self.modelo(
+            canal=canal,
+            tipo=tipo,
+            mensagem=mensagem,
+            estado="pendente",
+            tentativas=0,
+            criado_em=agora,
+            proxima_tentativa_em=max(agora, enviar_em or agora)
+        )
+        self.db.session.add(notificacao)
+        self.db.session.info["notificacoes_novas"] = True
+        self._garantir_thread()
+        return notificacao
+
+    def iniciar(self):
+        """Garante o despachante neste worker (retoma pendentes/novas tentativas)"""
+        self._garantir_thread()
+
+    def status(self):
+        m = self.modelo
+        contagem = dict(
+            self.db.session.query(m.estado, self.db.func.count(m.id)).group_by(m.estado).all()
+        )
+        return {
+            "por_estado": contagem,
+            "em_voo": self._em_voo,
+            "trabalhadores": self.trabalhadores,
+            "thread_ativa": bool(self._thread and self._thread.is_alive() and self._pid == os.getpid())
+        }
+
+    def acordar(self):
+        self._sinal.set()
+
+    def _acordar_depois_commit(self, sessao):
+        if sessao.info.pop("notificacoes_novas", None):
+            self.acordar()
+
+    # ------------------------------------------------------
+    # THREAD DE DESPACHO
+    # ------------------------------------------------------
+    def _garantir_thread(self):
+        """Inicia thread e pool no processo atual (seguro com fork do gunicorn)"""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._em_voo = 0
+            self._pool = ThreadPoolExecutor(max_workers=self.trabalhadores, thread_name_prefix="notificacao")
+            self._thread = threading.Thread(target=self._executar, name="despachante-notificacoes", daemon=True)
+            self._thread.start()
+
+            if not self._atexit_registrado:
+                atexit.register(lambda: self._pool and self._pool.shutdown(wait=False))
+                self._atexit_registrado = True
+
+            print(f"📮 Despachante de notificações iniciado (pid {self._pid}, {self.trabalhadores} trabalhadores)")
+
+    def _executar(self):
+        while True:
+            # Limpa antes de reservar: um sinal chegado durante a reserva não se perde
+            self._sinal.clear()
+            livres = self.trabalhadores - self._em_voo
+            espera = self.intervalo
+            if livres > 0:
+                try:
+                    with self.contexto():
+                        reservadas, proxima = self._reservar(livres)
+                    if proxima is not None:
+                        # Linha adiada (agrupamento/backoff) vence antes do intervalo → acorda a tempo
+                        espera = min(espera, max((proxima - datetime.utcnow()).total_seconds(), 0.05))
+                except Exception as e:
+                    print(f"❌ Erro ao reservar notificações: {e}")
+                    reservadas = []
+
+                for grupo in reservadas:
+                    with self._lock:
+                        self._em_voo += 1
+                    self._pool.submit(self._enviar, grupo)
+
+            # Acorda com commit novo, trabalhador livre, próxima linha vencida ou a cada intervalo
+            self._sinal.wait(espera)
+
+    def _reservar(self, limite):
+        """Reserva até `limite` envios: ([ids] por envio, vários nos canais agrupados;
+        momento da próxima linha pendente ainda não vencida)"""
+        m = self.modelo
+        agora = datetime.utcnow()
+        try:
+            # Envio interrompido (worker reiniciado a meio) volta à fila;
+            # em 'enviando', proxima_tentativa_em guarda o momento da reserva
+            self.db.session.execute(
+                update(m).where(m.estado == "enviando", m.proxima_tentativa_em < agora - self.prazo_envio)
+                .values(estado="pendente")
+            )
+
+            candidatas = m.query.filter(
+                m.estado == "pendente", m.proxima_tentativa_em <= agora
+            ).order_by(m.proxima_tentativa_em, m.id).limit(
+                limite + self.tamanho_grupo * len(self.agrupar)
+            ).with_entities(m.id, m.canal, m.tentativas).all()
+
+            grupos = {}
+            for c in candidatas:
+                chave = c.canal if c.canal in self.agrupar else c.id
+                if chave not in grupos:
+                    if len(grupos) == limite:
+                        continue
+                    grupos[chave] = []
+                elif len(grupos[chave]) >= self.tamanho_grupo:
+                    continue
+
+                resultado = self.db.session.execute(
+                    update(m).where(m.id == c.id, m.estado == "pendente", m.tentativas == c.tentativas)
+                    .values(estado="enviando", proxima_tentativa_em=agora)
+                    .execution_options(synchronize_session=False)
+                )
+                if resultado.rowcount == 1:
+                    grupos[chave].append(c.id)
+            proxima = self.db.session.query(self.db.func.min(m.proxima_tentativa_em)).filter(
+                m.estado == "pendente", m.proxima_tentativa_em > agora
+            ).scalar()
+            self.db.session.commit()
+            return [ids for ids in grupos.values() if ids], proxima
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    def _atraso(self, tentativas):
+        atraso = min(self.backoff_base * (2 ** (tentativas - 1)), self.backoff_maximo)
+        return atraso * random.uniform(0.8, 1.2)
+
+    def _enviar(self, ids):
+        try:
+            with self.contexto():
+                m = self.modelo
+                notificacoes = m.query.filter(m.id.in_(ids)).order_by(m.id).all()
+                if not notificacoes:
+                    return
+                canal = notificacoes[0].canal
+                descricao = f"{len(notificacoes)} notificação(ões) {canal} ({', '.join(str(n.id) for n in notificacoes)})"
+                inicio = time.monotonic()
+                try:
+                    self.enviadores[canal](notificacoes)
+                    agora = datetime.utcnow()
+                    for n in notificacoes:
+                        n.estado = "enviada"
+                        n.enviado_em = agora
+                        n.ultimo_erro = None
+                    print(f"📤 {descricao} enviada(s) em {time.monotonic() - inicio:.1f}s")
+                except Exception as e:
+                    # O grupo falha e repete junto (a próxima reserva pode juntar-lhe linhas novas)
+                    tentativas = max(n.tentativas or 0 for n in notificacoes) + 1
+                    atraso = self._atraso(tentativas)
+                    for n in notificacoes:
+                        n.tentativas = tentativas
+                        n.ultimo_erro = str(e)[:500]
+                        if tentativas >= self.tentativas_maximas:
+                            n.estado = "falhou"
+                        else:
+                            n.estado = "pendente"
+                            n.proxima_tentativa_em = datetime.utcnow() + timedelta(seconds=atraso)
+                    if tentativas >= self.tentativas_maximas:
+                        print(f"🗑️ {descricao} desistida(s) após {tentativas} tentativas: {e}")
+                    else:
+                        print(f"🔁 {descricao} falhou (tentativa {tentativas}/{self.tentativas_maximas}), "
+                              f"nova tentativa em {atraso:.0f}s: {e}")
+                self.db.session.commit()
+        except Exception:
+            print(f"❌ Erro no envio das notificações {ids}: {traceback.format_exc()}")
+        finally:
+            with self._lock:
+                self._em_voo -= 1
+            self._sinal.set()
@@ -0,0 +1,203 @@
+# ==========================================================
+# ROLLUPS DE ENERGY_DATA (MINUTO / HORA / DIA) E PICOS
+# ==========================================================
+# Cada lote gravado é agregado em memória por (pzem_id, início do
+# intervalo) e fundido nas tabelas de rollup com INSERT ... ON CONFLICT.
+# Todas as colunas são combináveis (contagem, soma, mínimo, máximo),
+# por isso a ordem dos lotes não importa e reconstruir = reprocessar.
+# As funções não fazem commit: quem chama controla a transação.
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import case
+
+from servicos.esquema import insert_upsert
+
+
+def truncar_minuto(ts):
+    return ts.replace(second=0, microsecond=0)
+
+
+def truncar_hora(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def truncar_dia(ts):
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+TRUNCAGENS = {
+    "minuto": truncar_minuto,
+    "hora": truncar_hora,
+    "dia": truncar_dia
+}
+
+
+def _timestamp(valor):
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    return valor.replace(tzinfo=None)
+
+
+def agregar_registros(registros, truncar):
+    """Agrega dicts de EnergyData por (pzem_id, início do intervalo)"""
+    grupos = {}
+
+    for r in registros:
+        ts = _timestamp(r["timestamp"])
+        power = float(r.get("power") or 0)
+        voltage = float(r.get("voltage") or 0)
+        energy = float(r.get("energy") or 0)
+        delta = float(r.get("delta_kwh") or 0)
+        chave = (int(r["pzem_id"]), truncar(ts))
+
+        g = grupos.get(chave)
+        if g is None:
+            grupos[chave] = {
+                "pzem_id": chave[0],
+                "inicio": chave[1],
+                "amostras": 1,
+                "power_min": power,
+                "power_max": power,
+                "power_soma": power,
+                "power_max_em": ts,
+                "voltage_min": voltage,
+                "voltage_max": voltage,
+                "voltage_soma": voltage,
+                "energy_min": energy,
+                "energy_max": energy,
+                "energia_soma": delta
+            }
+            continue
+
+        g["amostras"] += 1
+        g["power_soma"] += power
+        g["voltage_soma"] += voltage
+        if power > g["power_max"]:
+            g["power_max"] = power
+            g["power_max_em"] = ts
+        g["power_min"] = min(g["power_min"], power)
+        g["voltage_min"] = min(g["voltage_min"], voltage)
+        g["voltage_max"] = max(g["voltage_max"], voltage)
+        g["energy_min"] = min(g["energy_min"], energy)
+        g["energy_max"] = max(g["energy_max"], energy)
+        g["energia_soma"] += delta
+
+    return list(grupos.values())
+
+
+def _menor(novo, atual):
+    return case((novo < atual, novo), else_=atual)
+
+
+def _maior(novo, atual):
+    return case((novo > atual, novo), else_=atual)
+
+
+def upsert_rollups(conexao, tabela, agregados):
+    """Funde os agregados na tabela de rollup (ON CONFLICT (pzem_id, inicio))"""
+    if not agregados:
+        return 0
+
+    stmt = insert_upsert(conexao.dialect.name, tabela)
+    novo = stmt.excluded
+    c = tabela.c
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.pzem_id, c.inicio],
+        set_={
+            "amostras": c.amostras + novo.amostras,
+            "power_soma": c.power_soma + novo.power_soma,
+            "voltage_soma": c.voltage_soma + novo.voltage_soma,
+            "power_min": _menor(novo.power_min, c.power_min),
+            "power_max": _maior(novo.power_max, c.power_max),
+            # Os lados direitos do SET veem a linha antiga → comparar antes de trocar o máximo
+            "power_max_em": case((novo.power_max > c.power_max, novo.power_max_em), else_=c.power_max_em),
+            "voltage_min": _menor(novo.voltage_min, c.voltage_min),
+            "voltage_max": _maior(novo.voltage_max, c.voltage_max),
+            "energy_min": _menor(novo.energy_min, c.energy_min),
+            "energy_max": _maior(novo.energy_max, c.energy_max),
+            "energia_soma": c.energia_soma + novo.energia_soma
+        }
+    )
+    conexao.execute(stmt, agregados)
+    return len(agregados)
+
+
+def atualizar_rollups(conexao, registros, tabelas):
+    """Atualiza todos os grãos; tabelas = {"minuto": tabela, "hora": tabela, "dia": tabela}"""
+    if not registros:
+        return 0
+
+    total = 0
+    for grao, tabela in tabelas.items():
+        total += upsert_rollups(conexao, tabela, agregar_registros(registros, TRUNCAGENS[grao]))
+    return total
+
+
+# ==========================================================
+# PICOS DIÁRIOS / SEMANAIS / MENSAIS (daily_peaks, weekly_peaks, monthly_peaks)
+# ==========================================================
+# Upsert monotónico: a linha só muda quando chega um valor maior,
+# por isso reprocessar o mesmo lote não altera nada.
+
+def _maiores_por_periodo(agregados_dia, chave_periodo):
+    maiores = {}
+    for a in agregados_dia:
+        chave = (a["pzem_id"], chave_periodo(a["inicio"].date()))
+        atual = maiores.get(chave)
+        if atual is None or a["power_max"] > atual["power_max"]:
+            maiores[chave] = a
+    return maiores
+
+
+def upsert_picos(conexao, tabela, linhas, colunas_chave):
+    """INSERT ... ON CONFLICT (chave) DO UPDATE ... WHERE novo.value > atual.value"""
+    if not linhas:
+        return 0
+
+    stmt = insert_upsert(conexao.dialect.name, tabela)
+    novo = stmt.excluded
+    atualizar = [c for c in ("value", "time", "date") if c in tabela.c and c not in colunas_chave]
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[tabela.c[c] for c in colunas_chave],
+        set_={c: novo[c] for c in atualizar},
+        where=novo.value > tabela.c.value
+    )
+    conexao.execute(stmt, linhas)
+    return len(linhas)
+
+
+def atualizar_picos(conexao, registros, tabelas):
+    """Atualiza os picos; tabelas = {"dia": daily_peaks, "semana": weekly_peaks, "mes": monthly_peaks}"""
+    if not registros:
+        return 0
+
+    agregados_dia = agregar_registros(registros, truncar_dia)
+    total = 0
+
+    if "dia" in tabelas:
+        total += upsert_picos(conexao, tabelas["dia"], [
+            {"date": a["inicio"].date(), "pzem_id": a["pzem_id"],
+             "value": a["power_max"], "time": a["power_max_em"].time()}
+            for a in agregados_dia
+        ], ("date", "pzem_id"))
+
+    if "semana" in tabelas:
+        semanas = _maiores_por_periodo(agregados_dia, lambda d: d - timedelta(days=d.weekday()))
+        total += upsert_picos(conexao, tabelas["semana"], [
+            {"week_start": semana, "pzem_id": pzem_id, "value": a["power_max"],
+             "time": a["power_max_em"].time(), "date": a["power_max_em"].date()}
+            for (pzem_id, semana), a in semanas.items()
+        ], ("week_start", "pzem_id"))
+
+    if "mes" in tabelas:
+        meses = _maiores_por_periodo(agregados_dia, lambda d: (d.year, d.month))
+        total += upsert_picos(conexao, tabelas["mes"], [
+            {"year": ano, "month": mes, "pzem_id": pzem_id, "value": a["power_max"],
+             "time": a["power_max_em"].time(), "date": a["power_max_em"].date()}
+            for (pzem_id, (ano, mes)), a in meses.items()
+        ], ("year", "month", "pzem_id"))
+
+    return total
@@ -0,0 +1,244 @@
+# ==========================================================
+# LIVRO DE SALDO (MOVIMENTOS + DECREMENTO ATÓMICO)
+# ==========================================================
+# O saldo deixou de ser lido, alterado em Python e escrito de volta:
+# • a linha de base do contador de energia de cada PZEM fica na tabela
+#   contadores_energia (partilhada por todos os workers) e avança por
+#   compare-and-set na `sequencia` - cada kWh do contador só é contado
+#   por quem conseguir avançar a sequência;
+# • o saldo muda com UPDATE configuracoes SET saldo_kwh = saldo_kwh - :x
+#   RETURNING saldo_kwh (nunca abaixo de zero);
+# • cada consumo/recarga fica em movimentos_saldo (só acrescentado),
+#   único por (pzem_id, sequencia). O kwh do movimento é o que o saldo
+#   mudou de facto (a soma dos movimentos bate com o saldo); com o saldo
+#   esgotado o consumo a mais fica só em contador - contador_anterior.
+# Tudo corre na sessão do chamador, numa transação curta (só as linhas
+# do contador e da configuração ficam bloqueadas, até ao commit).
+
+import os
+import time
+from bisect import bisect_left
+from datetime import datetime
+
+from sqlalchemy import case, insert, select, update
+
+from servicos.esquema import insert_upsert
+
+
+def _inserir_se_nao_existir(sessao, tabela, valores):
+    insert_dialeto = insert_upsert(sessao.get_bind().dialect.name, tabela)
+    sessao.execute(insert_dialeto.values(**valores).on_conflict_do_nothing())
+
+
+class LivroSaldo:
+    """Consumo e recargas do saldo (kWh) com escrita atómica e registo de movimentos"""
+
+    def __init__(self, db, movimento, contador, configuracao, passo_kwh=0.01, tentativas=3):
+        self.db = db
+        self.movimento = movimento
+        self.contador = contador
+        self.configuracao = configuracao
+        self.passo_kwh = float(passo_kwh)  # avanço mínimo do contador para gerar movimento
+        self.tentativas = int(tentativas)
+
+    # ------------------------------------------------------
+    # SALDO
+    # ------------------------------------------------------
+    def _alterar_saldo(self, config_id, kwh):
+        """Soma `kwh` (negativo = consumo) ao saldo, sem descer de zero; devolve (anterior, novo)"""
+        t = self.configuracao.__table__
+        sessao = self.db.session
+        # Linha bloqueada até ao commit: o saldo anterior é o que o UPDATE vai alterar
+        anterior = sessao.execute(select(t.c.saldo_kwh).where(t.c.id == config_id).with_for_update()).scalar()
+        novo = t.c.saldo_kwh + kwh
+        saldo = sessao.execute(
+            update(t).where(t.c.id == config_id)
+            .values(saldo_kwh=case((novo > 0, novo), else_=0.0))
+            .returning(t.c.saldo_kwh)
+        ).scalar()
+        return anterior or 0.0, saldo
+
+    def _movimento(self, config_id, tipo, kwh, saldo_apos, **campos):
+        self.db.session.execute(insert(self.movimento.__table__).values(
+            configuracao_id=config_id, tipo=tipo, kwh=kwh, saldo_apos=saldo_apos,
+            criado_em=datetime.utcnow(), **campos
+        ))
+
+    # ------------------------------------------------------
+    # CONSUMO (CONTADORES DOS PZEMs)
+    # ------------------------------------------------------
+    def bases(self):
+        """{pzem_id: última leitura já descontada}"""
+        t = self.contador.__table__
+        return dict(self.db.session.execute(select(t.c.pzem_id, t.c.energia_kwh)).all())
+
+    def _avancar_contador(self, pzem_id, leitura, passo_kwh):
+        """Avança a linha de base do PZEM até `leitura`: (consumo_kwh, anterior, sequencia)
+        ou None se não há nada a contar (ou outro worker já contou)"""
+        t = self.contador.__table__
+        sessao = self.db.session
+
+        for _ in range(self.tentativas):
+            atual = sessao.execute(
+                select(t.c.energia_kwh, t.c.sequencia).where(t.c.pzem_id == pzem_id)
+            ).first()
+
+            if atual is None:
+                # Primeira leitura deste PZEM: vira a linha de base (não é consumo)
+                _inserir_se_nao_existir(sessao, t, dict(
+                    pzem_id=pzem_id, energia_kwh=leitura, sequencia=0, atualizado_em=datetime.utcnow()
+                ))
+                return None
+
+            anterior, sequencia = atual
+            if leitura >= anterior and (leitura - anterior < passo_kwh or leitura == anterior):
+                return None  # fica a acumular até ao próximo passo (nada se perde)
+
+            avancou = sessao.execute(
+                update(t).where(t.c.pzem_id == pzem_id, t.c.sequencia == sequencia)
+                .values(energia_kwh=leitura, sequencia=sequencia + 1, atualizado_em=datetime.utcnow())
+            ).rowcount
+            if avancou == 1:
+                # Contador reiniciado (leitura menor que a base) → nova base, sem consumo
+                consumo = leitura - anterior if leitura >= anterior else 0.0
+                return consumo, anterior, sequencia + 1
+            # Outro worker avançou entretanto → reler a base e tentar de novo
+
+        return None
+
+    def registar_consumo(self, config_id, leituras, passo_kwh=None):
+        """`leituras` = {pzem_id: contador de energia (kWh)}; desconta do saldo o que os
+        contadores avançaram desde a última contagem. Devolve (consumo, saldo) ou None.
+        Não faz commit."""
+        passo_kwh = self.passo_kwh if passo_kwh is None else passo_kwh
+        consumo_total = 0.0
+        avancos = []
+        for pzem_id, leitura in sorted(leituras.items()):
+            avanco = self._avancar_contador(pzem_id, float(leitura), passo_kwh)
+            if avanco is None:
+                continue
+            consumo, anterior, sequencia = avanco
+            avancos.append((pzem_id, consumo, anterior, leitura, sequencia))
+            consumo_total += consumo
+
+        if not avancos:
+            return None
+
+        saldo = None
+        descontar = 0.0
+        if consumo_total > 0:
+            saldo_anterior, saldo = self._alterar_saldo(config_id, -consumo_total)
+            # Saldo esgotado: só se desconta o que havia
+            descontar = consumo_total if saldo > 0 else min(consumo_total, max(saldo_anterior, 0.0))
+
+        for pzem_id, consumo, anterior, leitura, sequencia in avancos:
+            descontado = min(consumo, descontar)
+            descontar -= descontado
+            self._movimento(
+                config_id, "consumo" if consumo > 0 else "reinicio_contador", -descontado, saldo,
+                pzem_id=pzem_id, sequencia=sequencia, contador_anterior=anterior, contador=leitura
+            )
+        return consumo_total, saldo
+
+    # ------------------------------------------------------
+    # RECARGAS
+    # ------------------------------------------------------
+    def creditar(self, config_id, kwh, recarga_id=None):
+        """Soma `kwh` ao saldo; devolve (saldo_anterior, saldo_novo). Não faz commit."""
+        anterior, saldo = self._alterar_saldo(config_id, kwh)
+        self._movimento(config_id, "recarga", saldo - anterior, saldo, recarga_id=recarga_id)
+        return anterior, saldo
+
+
+# ==========================================================
+# ACUMULADOR DE CONSUMO (MENOS ESCRITAS NA LINHA DO SALDO)
+# ==========================================================
+# Cada lote da ingestão só calcula em memória o consumo pendente
+# (leitura atual - base já descontada) e o saldo estimado; o livro só é
+# escrito quando:
+# • o pendente chega a `passo_kwh`, ou passaram `intervalo` s desde a
+#   última escrita deste worker;
+# • o saldo estimado cruza um limiar (limite de um relé automático,
+#   limite de saldo baixo, zero) → escreve logo, para os relés e alertas
+#   reagirem no próprio lote;
+# • um contador recuou (reinício) ou ainda não tem base.
+# Bases e limiares ficam em cache até mudar a versão "config"/"reles"
+# (qualquer escrita do saldo, recarga ou relé alterado em qualquer worker).
+
+class AcumuladorSaldo:
+    """Integra o consumo em memória e escreve no LivroSaldo por passo, intervalo ou limiar"""
+
+    def __init__(self, livro, versoes, obter_limiares, passo_kwh=0.05, intervalo=60):
+        self.livro = livro
+        self.versoes = versoes
+        self.obter_limiares = obter_limiares  # funcao(config) → [kWh]
+        self.passo_kwh = float(passo_kwh)
+        self.intervalo = float(intervalo)
+        self._pid = None
+        self._versao = None
+        self._bases = {}
+        self._ultimas = {}  # última leitura vista de cada PZEM (neste worker)
+        self._limiares = []
+        self._ultima_escrita = time.monotonic()
+        self.estatisticas = {"lotes": 0, "escritas": 0, "por_limiar": 0}
+
+    def _atualizar_cache(self, config):
+        atuais = self.versoes.atuais()
+        versao = (atuais.get("config"), atuais.get("reles"))
+        if self._pid != os.getpid() or versao != self._versao:
+            self._bases = self.livro.bases()
+            self._limiares = sorted(self.obter_limiares(config))
+            self._versao, self._pid = versao, os.getpid()
+
+    def cruzou_limiar(self, antes, depois):
+        """Há algum limiar L com depois <= L < antes?"""
+        return bisect_left(self._limiares, depois) < bisect_left(self._limiares, antes)
+
+    def registar(self, config, leituras):
+        """Devolve {"saldo_estimado", "pendente_kwh", "gravou", "escrito": (consumo, saldo) | None,
+        "cruzou_limiar"}; se gravou, o chamador faz commit"""
+        self.estatisticas["lotes"] += 1
+        self._atualizar_cache(config)
+
+        saldo = config.saldo_kwh or 0.0
+        pendente = 0.0
+        forcar = False
+        antes_reinicio = {}
+        for pzem_id, leitura in leituras.items():
+            base = self._bases.get(pzem_id)
+            if base is None or leitura < base:
+                forcar = True  # primeira leitura ou contador reiniciado
+                # O que o contador avançou antes de reiniciar ainda não foi descontado
+                ultima = self._ultimas.get(pzem_id)
+                if base is not None and ultima is not None and ultima > base:
+                    antes_reinicio[pzem_id] = ultima
+            else:
+                pendente += leitura - base
+        self._ultimas.update(leituras)
+
+        estimado = max(saldo - pendente, 0.0)
+        cruzou = pendente > 0 and self.cruzou_limiar(saldo, estimado)
+        vencido = pendente > 0 and time.monotonic() - self._ultima_escrita >= self.intervalo
+
+        escrito = None
+        gravou = forcar or cruzou or vencido or pendente >= self.passo_kwh
+        if gravou:
+            previo = self.livro.registar_consumo(config.id, antes_reinicio, passo_kwh=0.0) if antes_reinicio else None
+            # Num limiar ou no fim do intervalo desconta tudo o que houver, por pouco que seja
+            escrito = self.livro.registar_consumo(
+                config.id, leituras, passo_kwh=0.0 if cruzou or vencido else None
+            )
+            if previo:
+                consumo, saldo_novo = escrito or (0.0, None)
+                escrito = (previo[0] + consumo, previo[1] if saldo_novo is None else saldo_novo)
+            self._ultima_escrita = time.monotonic()
+            self._versao = None  # bases mudaram → recarregar no próximo lote
+            self.estatisticas["escritas"] += 1
+            self.estatisticas["por_limiar"] += int(cruzou)
+
+        return {"saldo_estimado": estimado, "pendente_kwh": pendente, "gravou": gravou,
+                "escrito": escrito, "cruzou_limiar": cruzou}
+
+    def status(self):
+        return {**self.estatisticas, "passo_kwh": self.passo_kwh, "intervalo": self.intervalo,
+                "limiares": self._limiares}
@@ -0,0 +1,176 @@
+# ==========================================================
+# SÉRIE AO VIVO POR PZEM (ANEL DE AMOSTRAS EM ARRAYS TIPADOS)
+# ==========================================================
+# Os gráficos ao vivo só precisam das últimas horas de leituras:
+# em vez de consultar energy_data, cada amostra gravada entra num anel
+# de capacidade fixa por PZEM, guardado em colunas de doubles
+# (timestamp, voltage, current, power, pf, frequency).
+# • Memória limitada: PZEMS × 6 colunas × capacidade × 8 bytes.
+# • Buffer = ficheiro mmap partilhado pelos workers da máquina (lockf
+#   por bloco de PZEM) ou bytearray do processo (backend memoria).
+# • Amostras mais antigas que a última do anel são ignoradas (o anel
+#   está sempre ordenado por tempo; backfill antigo fica nos rollups).
+
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: só em memória
+    fcntl = None
+
+CAMPOS = ("timestamp", "voltage", "current", "power", "pf", "frequency")
+CABECALHO = 2  # [amostras escritas, timestamp da última] em doubles
+
+
+def _epoch(ts):
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+class SerieViva:
+    """Anel de amostras por PZEM sobre um buffer de doubles (memoryview 'd')"""
+
+    def __init__(self, pzems=(1, 2), capacidade=4320, caminho=None):
+        self.pzems = tuple(pzems)
+        self.capacidade = int(capacidade)
+        self.caminho = None
+        if caminho and fcntl is not None:
+            self.caminho = f"{caminho}_{'-'.join(map(str, self.pzems))}_{self.capacidade}"
+        self._bloco = CABECALHO + len(CAMPOS) * self.capacidade  # doubles por PZEM
+        self._tamanho = len(self.pzems) * self._bloco * 8
+        self._lock = threading.Lock()  # lockf não exclui threads do mesmo processo
+        self._pid = None
+        self._buffer = None
+        self._valores = None
+
+    # ------------------------------------------------------
+    # BUFFER
+    # ------------------------------------------------------
+    def _abrir(self):
+        if self._pid == os.getpid():
+            return
+        if self.caminho:
+            # O layout depende da capacidade e dos PZEMs: ficheiro próprio para cada combinação
+            fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < self._tamanho:
+                os.ftruncate(fd, self._tamanho)
+            self._fd = fd
+            self._buffer = mmap.mmap(fd, self._tamanho, mmap.MAP_SHARED)
+        else:
+            self._buffer = bytearray(self._tamanho)
+        self._valores = memoryview(self._buffer).cast("d")
+        self._pid = os.getpid()
+
+    def _travar(self, k, exclusivo):
+        if self.caminho:
+            modo = fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH
+            fcntl.lockf(self._fd, modo, self._bloco * 8, k * self._bloco * 8)
+
+    def _destravar(self, k):
+        if self.caminho:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, self._bloco * 8, k * self._bloco * 8)
+
+    def _coluna(self, k, campo):
+        return k * self._bloco + CABECALHO + CAMPOS.index(campo) * self.capacidade
+
+    # ------------------------------------------------------
+    # ESCRITA (INGESTÃO)
+    # ------------------------------------------------------
+    def adicionar(self, registros, idade_maxima=None):
+        """Acrescenta registros de EnergyData (dicts) ao anel do respetivo PZEM"""
+        limite = _epoch(datetime.now(timezone.utc)) - idade_maxima if idade_maxima else None
+        por_pzem = {}
+        for r in registros:
+            pzem_id = int(r["pzem_id"])
+            if pzem_id not in self.pzems:
+                continue
+            ts = _epoch(r["timestamp"])
+            if limite is not None and ts < limite:
+                continue
+            por_pzem.setdefault(pzem_id, []).append((ts, r))
+
+        with self._lock:
+            self._abrir()
+            v = self._valores
+            for pzem_id, amostras in por_pzem.items():
+                k = self.pzems.index(pzem_id)
+                base = k * self._bloco
+                self._travar(k, exclusivo=True)
+                try:
+                    escritos, ultimo = int(v[base]), v[base + 1]
+                    for ts, r in sorted(amostras, key=lambda a: a[0]):
+                        if escritos and ts < ultimo:
+                            continue
+                        i = escritos % self.capacidade
+                        v[self._coluna(k, "timestamp") + i] = ts
+                        for campo in CAMPOS[1:]:
+                            v[self._coluna(k, campo) + i] = float(r.get(campo) or 0)
+                        escritos += 1
+                        ultimo = ts
+                    v[base], v[base + 1] = escritos, ultimo
+                finally:
+                    self._destravar(k)
+
+    # ------------------------------------------------------
+    # LEITURA
+    # ------------------------------------------------------
+    def ler(self, pzem_id, desde=None):
+        """{campo: array('d')} em ordem cronológica (só amostras com timestamp >= desde)"""
+        k = self.pzems.index(pzem_id)
+        base = k * self._bloco
+        with self._lock:
+            self._abrir()
+            v = self._valores
+            self._travar(k, exclusivo=False)
+            try:
+                escritos = int(v[base])
+                if escritos <= self.capacidade:
+                    trechos = [(0, escritos)]
+                else:
+                    # Anel cheio → ordem cronológica: da posição mais antiga ao fim, depois o início
+                    mais_antiga = escritos % self.capacidade
+                    trechos = [(mais_antiga, self.capacidade), (0, mais_antiga)]
+
+                colunas = {}
+                for campo in CAMPOS:
+                    c = self._coluna(k, campo)
+                    dados = array("d")
+                    for inicio, fim in trechos:
+                        dados.frombytes(v[c + inicio:c + fim].tobytes())
+                    colunas[campo] = dados
+            finally:
+                self._destravar(k)
+
+        if desde is not None:
+            corte = bisect_left(colunas["timestamp"], desde)
+            colunas = {campo: dados[corte:] for campo, dados in colunas.items()}
+        return colunas
+
+    def status(self):
+        return {
+            "capacidade": self.capacidade,
+            "pzems": list(self.pzems),
+            "partilhado": bool(self.caminho),
+            "bytes": self._tamanho
+        }
+
+
+def reduzir(colunas, pontos):
+    """Reduz para no máximo `pontos` por média em blocos iguais (timestamp = média do bloco)"""
+    total = len(colunas["timestamp"])
+    if not pontos or total <= pontos:
+        return colunas
+
+    reduzidas = {campo: array("d") for campo in colunas}
+    for b in range(pontos):
+        inicio, fim = b * total // pontos, (b + 1) * total // pontos
+        for campo, dados in colunas.items():
+            bloco = dados[inicio:fim]
+            reduzidas[campo].append(sum(bloco) / len(bloco))
+    return reduzidas
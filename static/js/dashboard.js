@@ -12,7 +12,9 @@ const state = {
         perPage: 5,
         allReles: [],
         filteredReles: []
-    }
+    },
+    aoVivo: null,  // Último snapshot do dashboard, atualizado pelos eventos SSE
+    etag: null     // ETag do último snapshot (If-None-Match → 304 sem corpo)
 };
 
 // Função utilitária para obter elementos DOM com segurança
@@ -186,18 +188,26 @@ function inicializarGraficos() {
 // Atualizar dados do dashboard
 async function atualizarDashboard() {
     try {
-        const response = await fetch('/api/dashboard-data');
-        if (!response.ok) throw new Error('Erro na resposta da API');
-        const data = await response.json();
+        // Snapshot consolidado: se nada mudou o servidor responde 304 sem corpo
+        const headers = state.etag && state.aoVivo ? { 'If-None-Match': state.etag } : {};
+        const response = await fetch('/api/dashboard/snapshot', { headers, cache: 'no-store' });
 
-        if (!data || !data.pzem1 || !data.pzem2 || !data.historical || !data.peaks || !data.reles_chart || !data.reles) {
-            throw new Error('Dados da API incompletos');
-        }
+        if (response.status !== 304) {
+            if (!response.ok) throw new Error('Erro na resposta da API');
+            const data = await response.json();
 
-        atualizarDadosPZEM(data);
-        atualizarKPIs(data);
-        atualizarGraficos(data);
-        atualizarTabelaReles(data.reles);
+            if (!data || !data.pzem1 || !data.pzem2 || !data.historical || !data.peaks || !data.reles_chart || !data.reles) {
+                throw new Error('Dados da API incompletos');
+            }
+
+            state.aoVivo = data;
+            state.etag = response.headers.get('ETag');
+            atualizarDadosPZEM(data);
+            atualizarKPIs(data);
+            atualizarGraficos(data);
+            atualizarTabelaReles(data.reles);
+            if (data.ldr && data.ldr.valorLuz !== undefined) mostrarLDR(data.ldr);
+        }
 
         const lastUpdate = getElement('last-update-time');
         if (lastUpdate) lastUpdate.textContent = new Date().toLocaleTimeString();
@@ -468,28 +478,68 @@ async function atualizarLDR() {
 
         if (!data.success) return;
 
-        // Atualizar luminosidade
-        document.getElementById("r1-luz").innerText = data.valorLuz;
+        mostrarLDR(data);
+    } catch (e) {
+        console.log("Erro ao buscar LDR:", e);
+    }
+}
 
-        // Elementos visuais
-        const card = document.getElementById("card-r1");
-        const estadoTexto = document.getElementById("r1-estado-texto");
+function mostrarLDR(data) {
+    // Atualizar luminosidade
+    document.getElementById("r1-luz").innerText = data.valorLuz;
 
-        if (data.R1 == 1) {
-            estadoTexto.innerText = "LIGADO";
+    // Elementos visuais
+    const card = document.getElementById("card-r1");
+    const estadoTexto = document.getElementById("r1-estado-texto");
 
-            card.classList.remove("stat-off");
-            card.classList.add("stat-on");
-        } else {
-            estadoTexto.innerText = "DESLIGADO";
+    if (data.R1 == 1) {
+        estadoTexto.innerText = "LIGADO";
 
-            card.classList.remove("stat-on");
-            card.classList.add("stat-off");
-        }
+        card.classList.remove("stat-off");
+        card.classList.add("stat-on");
+    } else {
+        estadoTexto.innerText = "DESLIGADO";
 
-    } catch (e) {
-        console.log("Erro ao buscar LDR:", e);
+        card.classList.remove("stat-on");
+        card.classList.add("stat-off");
+    }
+}
+
+// =========================
+// 📺 EVENTOS AO VIVO (SSE)
+// =========================
+// Cada evento de /api/eventos é aplicado sobre o último snapshot do dashboard
+function aplicarEventoAoVivo(tipo, evento) {
+    const data = state.aoVivo;
+    if (!data) return;
+
+    if (tipo === 'pzem') {
+        data[evento.pzem] = { ...data[evento.pzem], ...evento };
+        atualizarDadosPZEM(data);
+        atualizarKPIs(data);
+    } else if (tipo === 'saldo') {
+        data.energia_atual = { ...data.energia_atual, ...evento };
+        atualizarKPIs(data);
+    } else if (tipo === 'rele') {
+        const rele = state.reles.allReles.find(r => r.id === evento.id);
+        if (!rele) return;
+        Object.assign(rele, evento, { modo_desc: evento.modo_automatico ? "Automático" : "Manual" });
+        atualizarTabelaReles();
     }
+
+    const lastUpdate = document.getElementById('last-update-time');
+    if (lastUpdate) lastUpdate.textContent = new Date().toLocaleTimeString();
+}
+
+function iniciarEventosAoVivo() {
+    if (typeof ouvirEventos !== 'function') return false;
+    if (!ouvirEventos('pzem', evento => aplicarEventoAoVivo('pzem', evento))) return false;
+
+    ouvirEventos('saldo', evento => aplicarEventoAoVivo('saldo', evento));
+    ouvirEventos('rele', evento => aplicarEventoAoVivo('rele', evento));
+    ouvirEventos('ldr', mostrarLDR);
+    ouvirEventos('alerta', evento => showToast(evento.mensagem, 'warning'));
+    return true;
 }
  
 
@@ -2360,8 +2410,13 @@ document.addEventListener('DOMContentLoaded', function() {
     atualizarLDR();
     carregarConfigTaxas();
     carregarConfigPreco();
-   setInterval(atualizarLDR, 2000);
-    setInterval(atualizarDashboard, 5000);
+    // Com SSE as leituras, relés, saldo e LDR chegam sozinhos; o pedido completo
+    // (gráficos e picos) só é refeito a cada minuto. Sem SSE mantém o polling.
+    if (iniciarEventosAoVivo()) {
+        setInterval(atualizarDashboard, 60000);
+    } else {
+        setInterval(atualizarDashboard, 3000);
+    }
 
   // iniciarDashboard();
     const elements = {
@@ -0,0 +1,30 @@
+# ==========================================================
+# FIXTURES DOS TESTES (serviços isolados, sem importar app.py)
+# ==========================================================
+# Os serviços de servicos/ recebem o estado ao vivo, o db e os modelos
+# por parâmetro: os testes usam o backend em memória e, quando precisam
+# de banco, um Flask-SQLAlchemy em SQLite na memória.
+
+import pytest
+
+from servicos.estado_vivo import EstadoVivoMemoria
+
+
+@pytest.fixture
+def estado():
+    return EstadoVivoMemoria()
+
+
+@pytest.fixture
+def banco():
+    """Flask-SQLAlchemy em SQLite na memória, com o contexto da app ativo"""
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db = SQLAlchemy(app)
+    with app.app_context():
+        yield db
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,129 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from servicos.comandos import CHAVE_INDICE, FilaComandos
+
+
+@pytest.fixture
+def ComandoRele(banco):
+    db = banco
+
+    class ComandoRele(db.Model):
+        __tablename__ = "comandos_reles"
+        id = db.Column(db.Integer, primary_key=True)
+        rele_id = db.Column(db.Integer, nullable=True)
+        comando = db.Column(db.String(64), nullable=False)
+        estado = db.Column(db.String(16), nullable=False, default="pendente")
+        origem = db.Column(db.String(32), default="sistema")
+        tentativas = db.Column(db.Integer, nullable=False, default=0)
+        criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+        entregue_em = db.Column(db.DateTime)
+        confirmado_em = db.Column(db.DateTime)
+        expira_em = db.Column(db.DateTime)
+
+    db.create_all()
+    return ComandoRele
+
+
+@pytest.fixture
+def fila(banco, ComandoRele, estado):
+    fila = FilaComandos(banco, ComandoRele, estado, reentrega_segundos=10, varredura_segundos=30)
+    yield fila
+    # Os ouvintes são globais (Session): não podem passar para o teste seguinte
+    event.remove(Session, "after_commit", fila._aplicar_indice)
+    event.remove(Session, "after_rollback", fila._descartar_indice)
+
+
+def estados(ComandoRele):
+    return {c.id: c.estado for c in ComandoRele.query.order_by(ComandoRele.id)}
+
+
+def abertos(estado):
+    return estado.ler(CHAVE_INDICE).get("abertos", {})
+
+
+def test_comando_novo_substitui_os_abertos_do_mesmo_rele(banco, fila, ComandoRele):
+    fila.enfileirar("RELE1_ON")
+    fila.enfileirar("rele1_off")
+    fila.enfileirar("RELE2_ON")
+    banco.session.commit()
+
+    assert estados(ComandoRele) == {1: "substituido", 2: "pendente", 3: "pendente"}
+    assert [e["comando"] for e in fila.entregar(limite=None)] == ["RELE1_OFF", "RELE2_ON"]
+
+
+def test_indice_so_muda_depois_do_commit(banco, fila, estado):
+    fila.enfileirar("RELE1_ON")
+    assert abertos(estado) == {}
+
+    banco.session.commit()
+    assert abertos(estado) == {"1": 1}
+
+
+def test_rollback_descarta_as_alteracoes_do_indice(banco, fila, estado):
+    fila.enfileirar("RELE1_ON")
+    banco.session.rollback()
+
+    assert abertos(estado) == {}
+    assert fila.entregar() == []
+
+
+def test_entrega_otimista_nao_repete_o_comando(banco, fila, ComandoRele):
+    fila.enfileirar("RELE1_ON")
+    banco.session.commit()
+
+    assert [e["id"] for e in fila.entregar()] == [1]
+    assert fila.entregar() == []  # entregue há menos de reentrega_segundos
+    assert estados(ComandoRele) == {1: "entregue"}
+
+
+def test_linha_alterada_por_outro_worker_nao_e_entregue(banco, fila, ComandoRele, monkeypatch):
+    fila.enfileirar("RELE1_ON")
+    banco.session.commit()
+
+    # Outro worker entrega o comando entre a leitura dos candidatos e o UPDATE otimista
+    executar = banco.session.execute
+    corrida = []
+
+    def outro_worker_primeiro(stmt, *args, **kwargs):
+        if getattr(stmt, "is_update", False) and not corrida:
+            corrida.append(True)
+            executar(ComandoRele.__table__.update().values(estado="entregue", tentativas=1))
+        return executar(stmt, *args, **kwargs)
+
+    monkeypatch.setattr(banco.session, "execute", outro_worker_primeiro)
+    assert fila.entregar() == []
+    assert corrida
+
+
+def test_confirmacao_fecha_so_os_entregues(banco, fila, ComandoRele, estado):
+    fila.enfileirar("RELE1_ON")
+    fila.enfileirar("RELE2_ON")
+    banco.session.commit()
+    fila.entregar(limite=1)
+
+    assert fila.confirmar_ids([1, 2, 99]) == [1]
+    banco.session.commit()
+    assert estados(ComandoRele) == {1: "confirmado", 2: "pendente"}
+    assert abertos(estado) == {"2": 2}
+
+
+def test_confirmacao_implicita_pelo_estado_do_rele(banco, fila, ComandoRele, estado):
+    fila.enfileirar("RELE1_ON")
+    banco.session.commit()
+
+    assert fila.confirmar_estados([{"id": 1, "estado": False}]) == []
+    assert fila.confirmar_estados([{"id": 1, "estado": True}]) == [1]
+    banco.session.commit()
+    assert abertos(estado) == {}
+
+
+def test_reconstrucao_mantem_ids_mais_novos_que_a_leitura(banco, fila, estado):
+    fila.enfileirar("RELE1_ON")
+    banco.session.commit()
+    estado.modificar(CHAVE_INDICE, lambda indice: dict(indice, abertos={"0": 9, "1": 1, "50": 3}))
+
+    assert fila._reconstruir_indice(datetime.utcnow()) == {"1": 1, "50": 3}
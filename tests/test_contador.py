@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from servicos.contador import ConflitoContador, NormalizadorContador
+
+INICIO = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def amostras(pzem_id, energias, passo=5):
+    return [
+        {"pzem_id": pzem_id, "energy": energia, "timestamp": INICIO + timedelta(seconds=i * passo)}
+        for i, energia in enumerate(energias)
+    ]
+
+
+def deltas(registros):
+    return [r["delta_kwh"] for r in registros]
+
+
+@pytest.fixture
+def normalizador(estado):
+    return NormalizadorContador(estado, rollover_kwh=10000, potencia_maxima_w=25000, confirmacoes=3)
+
+
+def test_normal_soma_as_diferencas(normalizador):
+    registros = amostras(1, [100.0, 100.01, 100.03])
+    totais = normalizador.processar(registros)
+
+    assert deltas(registros) == [0.0, 0.01, 0.02]
+    assert totais[1] == pytest.approx(0.03)
+
+
+def test_reinicio_do_contador_conta_a_leitura_nova(normalizador):
+    registros = amostras(1, [500.0, 500.01, 0.005, 0.015])
+    normalizador.processar(registros)
+
+    assert deltas(registros) == pytest.approx([0.0, 0.01, 0.005, 0.01])
+    assert normalizador.status()["reinicio"] == 1
+
+
+def test_rollover_continua_depois_do_fim(normalizador):
+    registros = amostras(2, [9999.99, 0.01])
+    normalizador.processar(registros)
+
+    assert deltas(registros) == pytest.approx([0.0, 0.02])
+    assert normalizador.status()["rollover"] == 1
+
+
+def test_glitch_isolado_nao_conta_e_mantem_a_base(normalizador):
+    registros = amostras(1, [500.0, 800.0, 500.01])
+    normalizador.processar(registros)
+
+    assert deltas(registros) == pytest.approx([0.0, 0.0, 0.01])
+    assert normalizador.status()["glitch"] == 1
+
+
+def test_salto_confirmado_vira_nova_base(normalizador):
+    registros = amostras(1, [500.0, 800.0, 800.0, 800.0, 800.01])
+    normalizador.processar(registros)
+
+    assert deltas(registros) == pytest.approx([0.0, 0.0, 0.0, 0.0, 0.01])
+    assert normalizador.status()["nova_base"] == 1
+
+
+def test_amostra_fora_de_ordem_nao_conta(normalizador):
+    normalizador.processar(amostras(1, [100.0, 100.01]))
+    atrasada = [{"pzem_id": 1, "energy": 99.0, "timestamp": INICIO}]
+    normalizador.processar(atrasada)
+
+    assert deltas(atrasada) == [0.0]
+
+
+def test_repetir_lote_depois_de_commit_falhado_da_os_mesmos_deltas(normalizador):
+    normalizador.processar(amostras(1, [100.0]))
+    lote = amostras(1, [100.0, 100.02, 100.05])[1:]
+
+    lancamento = normalizador.calcular(lote)
+    normalizador.reservar(lancamento)
+    primeira = deltas(lote)
+    normalizador.desfazer(lancamento)  # o commit do banco falhou
+
+    normalizador.reservar(normalizador.calcular(lote))
+    assert deltas(lote) == primeira == pytest.approx([0.02, 0.03])
+    assert normalizador.totais([1])[1] == pytest.approx(0.05)
+
+
+def test_reservar_com_estado_alterado_levanta_conflito(normalizador):
+    normalizador.processar(amostras(1, [100.0]))
+    lancamento = normalizador.calcular(amostras(1, [100.0, 100.01])[1:])
+    normalizador.processar([{"pzem_id": 1, "energy": 100.02, "timestamp": INICIO + timedelta(seconds=10)}])
+
+    with pytest.raises(ConflitoContador):
+        normalizador.reservar(lancamento)
+    assert normalizador.totais([1])[1] == pytest.approx(0.02)
+
+
+def test_total_inicial_continua_do_banco_quando_o_estado_se_perdeu(estado):
+    normalizador = NormalizadorContador(estado, total_inicial=lambda pzem_id: 42.0)
+    normalizador.processar(amostras(1, [10.0, 10.5], passo=300))
+
+    assert normalizador.totais([1])[1] == pytest.approx(42.5)
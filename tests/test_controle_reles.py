@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from servicos.controle_reles import MotorReles
+
+AGORA = datetime(2026, 1, 1, 12, 0, 0)
+HA_MUITO = AGORA - timedelta(hours=1)
+
+
+def rele(rele_id, estado, limite, **campos):
+    return {
+        "id": rele_id, "nome": f"R{rele_id}", "estado": estado, "limite_individual": limite,
+        "ultima_alteracao_manual": HA_MUITO, "estado_alterado_em": None,
+        "histerese_kwh": None, "tempo_minimo_ligado": None, "tempo_minimo_desligado": None,
+        **campos
+    }
+
+
+def motor_com(*reles, saldo=None, **padroes):
+    """Motor sem banco: o índice dos relés é montado como faria _atualizar_cache()"""
+    motor = MotorReles(None, None, None, None, None, **padroes)
+    motor._reles = {r["id"]: motor._preparar(r) for r in reles}
+    motor._limiares = sorted(
+        (limiar, r["id"]) for r in motor._reles.values() for limiar in {r["limite_individual"], r["limite_ligar"]}
+    )
+    motor._saldo = saldo
+    return motor
+
+
+def test_so_reve_os_reles_com_limite_cruzado():
+    motor = motor_com(rele(1, True, 10.0), rele(2, True, 5.0), saldo=12.0)
+
+    assert motor._decidir(8.0, AGORA) == {1: False}
+    motor._saldo = 8.0
+    assert motor._decidir(7.0, AGORA) == {}
+
+
+def test_pendentes_sao_revistos_sem_o_saldo_mudar():
+    motor = motor_com(rele(1, True, 10.0), saldo=8.0)
+    motor._pendentes = {1}
+
+    assert motor._decidir(8.0, AGORA) == {1: False}
+
+
+def test_histerese_so_volta_a_ligar_acima_de_limite_mais_histerese():
+    motor = motor_com(rele(1, False, 10.0, histerese_kwh=2.0), saldo=9.0)
+
+    assert motor._decidir(11.0, AGORA) == {}
+    motor._saldo = 11.0
+    assert motor._decidir(12.5, AGORA) == {1: True}
+
+
+def test_ligado_com_histerese_desliga_no_limite():
+    motor = motor_com(rele(1, True, 10.0, histerese_kwh=2.0), saldo=11.0)
+
+    assert motor._decidir(10.0, AGORA) == {1: False}
+
+
+def test_permanencia_minima_segura_o_rele_e_deixa_pendente():
+    mudou = AGORA - timedelta(seconds=60)
+    motor = motor_com(rele(1, True, 10.0, estado_alterado_em=mudou), saldo=12.0, tempo_minimo_ligado=300)
+
+    assert motor._decidir(8.0, AGORA) == {}
+    assert motor.tem_pendentes()
+    assert motor._decidir(8.0, AGORA + timedelta(seconds=300)) == {1: False}
+
+
+def test_sem_saldo_desliga_mesmo_dentro_da_permanencia():
+    motor = motor_com(rele(1, True, 10.0, estado_alterado_em=AGORA), saldo=12.0, tempo_minimo_ligado=300)
+
+    assert motor._decidir(0.0, AGORA) == {1: False}
+
+
+def test_rele_que_nunca_mudou_nao_tem_espera():
+    motor = motor_com(rele(1, True, 10.0), saldo=12.0, tempo_minimo_ligado=300)
+
+    assert motor._decidir(8.0, AGORA) == {1: False}
+
+
+def test_protecao_manual_adia_a_decisao():
+    manual = AGORA - timedelta(seconds=10)
+    motor = motor_com(rele(1, True, 10.0, ultima_alteracao_manual=manual), saldo=12.0, protecao_manual=30)
+
+    assert motor._decidir(8.0, AGORA) == {}
+    assert motor._decidir(8.0, AGORA + timedelta(seconds=30)) == {1: False}
+
+
+@pytest.mark.parametrize("saldo, esperado", [(10.0, False), (10.01, True)])
+def test_desejado_no_limite(saldo, esperado):
+    motor = motor_com(rele(1, True, 10.0))
+    assert motor.desejado(motor._reles[1], saldo) is esperado
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+
+from servicos.lttb import escolher_grao, gerar_json, lttb, reduzir_lttb
+
+
+def serie(n, semente=0):
+    gerador = np.random.default_rng(semente)
+    return np.arange(n, dtype=np.float64) * 5, gerador.normal(500, 150, n)
+
+
+@pytest.mark.parametrize("n,pontos", [(10, 3), (1000, 100), (1000, 999), (17280, 500)])
+def test_mantem_extremos_e_numero_de_pontos(n, pontos):
+    x, y = serie(n)
+    indices = lttb(x, y, pontos)
+
+    assert len(indices) == pontos
+    assert (indices[0], indices[-1]) == (0, n - 1)
+    assert np.all(np.diff(indices) > 0)
+
+
+@pytest.mark.parametrize("pontos", [2, 0, 50, 80])
+def test_devolve_tudo_quando_ja_cabe(pontos):
+    x, y = serie(50)
+
+    assert np.array_equal(lttb(x, y, pontos), np.arange(50))
+
+
+def test_preserva_o_pico():
+    x, y = serie(1000)
+    y[437] = 10_000.0
+
+    assert 437 in lttb(x, y, 20)
+
+
+def test_reduzir_lttb_devolve_os_pares_escolhidos():
+    tempos, valores = serie(300)
+    x, y = reduzir_lttb(tempos.tolist(), valores.tolist(), 30)
+
+    assert len(x) == len(y) == 30
+    assert (x[0], x[-1]) == (tempos[0], tempos[-1])
+    assert np.array_equal(y, valores[(x / 5).astype(int)])
+
+
+def test_escolher_grao():
+    assert escolher_grao(3600, 2000) == "bruto"
+    assert escolher_grao(86400, 2000) == "minuto"
+    assert escolher_grao(30 * 86400, 2000) == "hora"
+    assert escolher_grao(10 * 365 * 86400, 2000) == "dia"
+
+
+def test_gerar_json_em_blocos():
+    series = [("a", [1.0, 2.0, 3.0], [10.0, 20.5, 30.1234]), ("b", [], [])]
+    corpo = "".join(gerar_json({"grao": "minuto"}, series, bloco=2))
+
+    assert json.loads(corpo) == {
+        "grao": "minuto",
+        "series": {"a": [[1000, 10.0], [2000, 20.5], [3000, 30.123]], "b": []}
+    }
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import (Column, Date, DateTime, Float, Integer, MetaData, Table, Time, UniqueConstraint,
+                        create_engine, select)
+
+from servicos.rollups import atualizar_picos, atualizar_rollups
+
+INICIO = datetime(2026, 1, 5, 10, 0, 0)  # segunda-feira
+
+
+def tabela_rollup(metadata, nome):
+    return Table(
+        nome, metadata,
+        Column("id", Integer, primary_key=True),
+        Column("pzem_id", Integer, nullable=False),
+        Column("inicio", DateTime, nullable=False),
+        Column("amostras", Integer, nullable=False),
+        *[Column(c, Float, nullable=False) for c in (
+            "power_min", "power_max", "power_soma", "voltage_min", "voltage_max", "voltage_soma",
+            "energy_min", "energy_max", "energia_soma"
+        )],
+        Column("power_max_em", DateTime, nullable=False),
+        UniqueConstraint("pzem_id", "inicio")
+    )
+
+
+@pytest.fixture
+def conexao():
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    tabelas = {grao: tabela_rollup(metadata, f"energia_{grao}") for grao in ("minuto", "hora", "dia")}
+    picos = {
+        "dia": Table("daily_peaks", metadata, Column("id", Integer, primary_key=True),
+                     Column("date", Date), Column("pzem_id", Integer), Column("value", Float), Column("time", Time),
+                     UniqueConstraint("date", "pzem_id")),
+        "semana": Table("weekly_peaks", metadata, Column("id", Integer, primary_key=True),
+                        Column("week_start", Date), Column("pzem_id", Integer), Column("value", Float),
+                        Column("time", Time), Column("date", Date), UniqueConstraint("week_start", "pzem_id")),
+    }
+    metadata.create_all(engine)
+    with engine.begin() as conexao:
+        conexao.info.update(tabelas=tabelas, picos=picos)
+        yield conexao
+    engine.dispose()
+
+
+def registro(segundos, power, voltage=220.0, energy=100.0, delta=0.0, pzem_id=1):
+    return {"pzem_id": pzem_id, "timestamp": INICIO + timedelta(seconds=segundos), "power": power,
+            "voltage": voltage, "energy": energy, "delta_kwh": delta}
+
+
+def linhas(conexao, grao):
+    tabela = conexao.info["tabelas"][grao]
+    return conexao.execute(select(tabela).order_by(tabela.c.pzem_id, tabela.c.inicio)).mappings().all()
+
+
+def test_agrega_por_minuto_hora_e_dia(conexao):
+    atualizar_rollups(conexao, [
+        registro(0, 100.0, energy=100.0, delta=0.01),
+        registro(5, 300.0, energy=100.02, delta=0.02),
+        registro(65, 200.0, energy=100.03, delta=0.01),
+    ], conexao.info["tabelas"])
+
+    assert [m["amostras"] for m in linhas(conexao, "minuto")] == [2, 1]
+    (hora,) = linhas(conexao, "hora")
+    assert (hora["amostras"], hora["power_min"], hora["power_max"], hora["power_soma"]) == (3, 100.0, 300.0, 600.0)
+    assert hora["power_max_em"] == INICIO + timedelta(seconds=5)
+    assert (hora["energy_min"], hora["energy_max"]) == (100.0, 100.03)
+    assert hora["energia_soma"] == pytest.approx(0.04)
+
+
+def test_lotes_seguintes_fundem_min_max_e_somas(conexao):
+    tabelas = conexao.info["tabelas"]
+    atualizar_rollups(conexao, [registro(0, 100.0, voltage=220.0, delta=0.01)], tabelas)
+    atualizar_rollups(conexao, [registro(10, 50.0, voltage=230.0, delta=0.02)], tabelas)
+    atualizar_rollups(conexao, [registro(20, 400.0, voltage=210.0, delta=0.03)], tabelas)
+
+    (minuto,) = linhas(conexao, "minuto")
+    assert minuto["amostras"] == 3
+    assert (minuto["power_min"], minuto["power_max"], minuto["power_soma"]) == (50.0, 400.0, 550.0)
+    assert minuto["power_max_em"] == INICIO + timedelta(seconds=20)
+    assert (minuto["voltage_min"], minuto["voltage_max"]) == (210.0, 230.0)
+    assert minuto["energia_soma"] == pytest.approx(0.06)
+
+
+def test_maximo_menor_nao_troca_a_hora_do_pico(conexao):
+    tabelas = conexao.info["tabelas"]
+    atualizar_rollups(conexao, [registro(0, 500.0)], tabelas)
+    atualizar_rollups(conexao, [registro(10, 100.0)], tabelas)
+
+    assert linhas(conexao, "minuto")[0]["power_max_em"] == INICIO
+
+
+def test_pzems_ficam_em_linhas_separadas(conexao):
+    atualizar_rollups(conexao, [registro(0, 100.0, pzem_id=1), registro(0, 200.0, pzem_id=2)],
+                      conexao.info["tabelas"])
+
+    assert [(d["pzem_id"], d["power_max"]) for d in linhas(conexao, "dia")] == [(1, 100.0), (2, 200.0)]
+
+
+def test_picos_so_sobem(conexao):
+    picos = conexao.info["picos"]
+    atualizar_picos(conexao, [registro(0, 300.0)], picos)
+    atualizar_picos(conexao, [registro(3600, 200.0)], picos)
+    atualizar_picos(conexao, [registro(86400 * 2, 900.0)], picos)
+
+    dias = conexao.execute(select(picos["dia"]).order_by(picos["dia"].c.date)).mappings().all()
+    assert [(d["date"].day, d["value"]) for d in dias] == [(5, 300.0), (7, 900.0)]
+    (semana,) = conexao.execute(select(picos["semana"])).mappings().all()
+    assert (semana["week_start"], semana["value"], semana["date"].day) == (INICIO.date(), 900.0, 7)
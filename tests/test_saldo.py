@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import pytest
+
+from servicos.saldo import LivroSaldo
+
+
+@pytest.fixture
+def modelos(banco):
+    db = banco
+
+    class Configuracao(db.Model):
+        __tablename__ = "configuracoes"
+        id = db.Column(db.Integer, primary_key=True)
+        saldo_kwh = db.Column(db.Float, default=0.0)
+
+    class ContadorEnergia(db.Model):
+        __tablename__ = "contadores_energia"
+        pzem_id = db.Column(db.Integer, primary_key=True)
+        energia_kwh = db.Column(db.Float, nullable=False)
+        sequencia = db.Column(db.Integer, nullable=False, default=0)
+        atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    class MovimentoSaldo(db.Model):
+        __tablename__ = "movimentos_saldo"
+        __table_args__ = (db.UniqueConstraint("pzem_id", "sequencia"),)
+        id = db.Column(db.Integer, primary_key=True)
+        configuracao_id = db.Column(db.Integer, nullable=False)
+        tipo = db.Column(db.String(20), nullable=False)
+        kwh = db.Column(db.Float, nullable=False)
+        saldo_apos = db.Column(db.Float)
+        pzem_id = db.Column(db.Integer)
+        sequencia = db.Column(db.Integer)
+        contador_anterior = db.Column(db.Float)
+        contador = db.Column(db.Float)
+        recarga_id = db.Column(db.Integer)
+        criado_em = db.Column(db.DateTime)
+
+    db.create_all()
+    return Configuracao, ContadorEnergia, MovimentoSaldo
+
+
+@pytest.fixture
+def livro(banco, modelos):
+    Configuracao, ContadorEnergia, MovimentoSaldo = modelos
+    banco.session.add(Configuracao(id=1, saldo_kwh=1.0))
+    banco.session.commit()
+    return LivroSaldo(banco, MovimentoSaldo, ContadorEnergia, Configuracao)
+
+
+def saldo(banco, modelos):
+    return banco.session.get(modelos[0], 1).saldo_kwh
+
+
+def movimentos(modelos):
+    return modelos[2].query.order_by(modelos[2].id).all()
+
+
+def registar(banco, livro, leituras, **kwargs):
+    resultado = livro.registar_consumo(1, leituras, **kwargs)
+    banco.session.commit()
+    return resultado
+
+
+def test_primeira_leitura_so_grava_a_base(banco, modelos, livro):
+    assert registar(banco, livro, {1: 100.0, 2: 50.0}) is None
+    assert livro.bases() == {1: 100.0, 2: 50.0}
+    assert saldo(banco, modelos) == 1.0
+
+
+def test_consumo_desconta_e_regista_um_movimento_por_pzem(banco, modelos, livro):
+    registar(banco, livro, {1: 100.0, 2: 50.0})
+    consumo, saldo_novo = registar(banco, livro, {1: 100.25, 2: 50.5})
+
+    assert consumo == pytest.approx(0.75)
+    assert saldo_novo == pytest.approx(0.25)
+    assert [(m.pzem_id, m.kwh, m.sequencia) for m in movimentos(modelos)] == [(1, -0.25, 1), (2, -0.5, 1)]
+
+
+def test_saldo_nao_desce_de_zero_e_o_movimento_regista_so_o_descontado(banco, modelos, livro):
+    registar(banco, livro, {1: 100.0, 2: 50.0})
+    consumo, saldo_novo = registar(banco, livro, {1: 100.75, 2: 50.5})
+
+    assert consumo == pytest.approx(1.25)
+    assert saldo_novo == 0
+    kwh = [m.kwh for m in movimentos(modelos)]
+    assert kwh == pytest.approx([-0.75, -0.25])
+    assert 1.0 + sum(kwh) == pytest.approx(saldo(banco, modelos))
+
+
+def test_abaixo_do_passo_nao_escreve(banco, modelos, livro):
+    registar(banco, livro, {1: 100.0})
+    assert registar(banco, livro, {1: 100.005}) is None
+    assert registar(banco, livro, {1: 100.02}) == (pytest.approx(0.02), pytest.approx(0.98))
+
+
+def test_contador_reiniciado_vira_base_sem_consumo(banco, modelos, livro):
+    registar(banco, livro, {1: 100.0})
+    consumo, saldo_novo = registar(banco, livro, {1: 0.5})
+
+    assert (consumo, saldo_novo) == (0.0, None)
+    assert movimentos(modelos)[-1].tipo == "reinicio_contador"
+    assert livro.bases() == {1: 0.5}
+
+
+def test_recarga_regista_saldo_anterior_e_novo(banco, modelos, livro):
+    anterior, novo = livro.creditar(1, 2.0, recarga_id=7)
+    banco.session.commit()
+
+    assert (anterior, novo) == (1.0, 3.0)
+    recarga = movimentos(modelos)[-1]
+    assert (recarga.tipo, recarga.kwh, recarga.saldo_apos, recarga.recarga_id) == ("recarga", 2.0, 3.0, 7)